@@ -0,0 +1,412 @@
+"""Asyncio Gmail client over the REST endpoints, sharing one pooled HTTP session.
+
+Every call goes through an AsyncQuotaScheduler, an asyncio waiter over the
+same quota.QuotaPolicy that quota.QuotaScheduler uses from threads.
+"""
+import asyncio
+import json
+import time
+import uuid
+from itertools import islice
+from urllib.parse import urlencode
+
+import httpx
+
+from check_reply import (
+    CHECKPOINT_PATH,
+    FULL_SCAN_LIMIT,
+    LIST_PAGE_SIZE,
+    MAX_BATCH_SIZE,
+    load_checkpoint,
+    parse_sender,
+    save_checkpoint,
+)
+from gmail_auth import TOKEN_PATH, needs_refresh, refresh_if_needed
+from quota import (
+    QUOTA_UNITS,
+    RATE_LIMIT_REASONS,
+    RETRYABLE_STATUSES,
+    USER_QUOTA_PER_SECOND,
+    QuotaPolicy,
+    TokenBucket,
+)
+from send_engine import DEFAULT_CONCURRENCY
+import metrics
+
+GMAIL_API = 'https://gmail.googleapis.com'
+# httpcore's pool bookkeeping grows with pool size; past ~16 connections it costs more than it gains
+MAX_CONNECTIONS = 16
+
+
+class GmailAPIError(Exception):
+    def __init__(self, status, reason, message='', retry_after=None):
+        super().__init__(f"Gmail API error {status} ({reason}): {message}")
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def rate_limited(self):
+        return self.status == 429 or (self.status == 403 and self.reason in RATE_LIMIT_REASONS)
+
+    @property
+    def retryable(self):
+        return self.rate_limited or self.status in RETRYABLE_STATUSES
+
+
+def _error_from_response(status, body, retry_after=None):
+    try:
+        error = json.loads(body)['error']
+        reason = (error.get('errors') or [{}])[0].get('reason', '')
+        return GmailAPIError(status, reason, error.get('message', ''), retry_after)
+    except (ValueError, KeyError, TypeError):
+        return GmailAPIError(status, '', body[:200] if isinstance(body, str) else '', retry_after)
+
+
+class AsyncTokenBucket:
+    """Waits on a quota.TokenBucket without blocking the event loop."""
+
+    def __init__(self, rate, capacity=None):
+        self.bucket = TokenBucket(rate, capacity)
+
+    async def acquire(self, tokens=1):
+        await take_tokens(self.bucket, tokens)
+
+
+async def take_tokens(bucket, tokens):
+    """Sleep until the quota.TokenBucket has the tokens, then take them."""
+    while True:
+        wait_for = bucket.take(tokens)
+        if not wait_for:
+            return
+        await asyncio.sleep(wait_for)
+
+
+class AsyncQuotaScheduler:
+    """Waits as a quota.QuotaPolicy says (same arguments) without blocking the event loop.
+
+    execute() takes a coroutine function rather than a request object,
+    since a coroutine cannot be awaited twice. Use one instance per event
+    loop; it does not share its budget with threaded schedulers.
+    """
+
+    def __init__(self, units_per_second=USER_QUOTA_PER_SECOND, **policy):
+        self.policy = QuotaPolicy(units_per_second, **policy)
+        self._cond = asyncio.Condition()
+
+    @property
+    def max_retries(self):
+        return self.policy.max_retries
+
+    async def acquire(self, method, units=None):
+        """Wait for a concurrency slot and enough quota units."""
+        async with self._cond:
+            while True:
+                wait_for = self.policy.slot_wait()
+                if wait_for == 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._cond.wait(), wait_for)
+                except asyncio.TimeoutError:
+                    pass
+            units = self.policy.start(method, units)
+        if self.policy.bucket is not None:
+            await take_tokens(self.policy.bucket, units)
+
+    async def release(self, success=True, rate_limited=False, delay=0.0, retry=False):
+        async with self._cond:
+            self.policy.finish(success, rate_limited, delay, retry)
+            self._cond.notify_all()
+
+    async def report_rate_limited(self, delay=0.0):
+        """Record a throttled call that was not made through execute(), e.g. inside a batch."""
+        async with self._cond:
+            self.policy.throttle(delay)
+            self._cond.notify_all()
+
+    def backoff(self, attempt, error=None):
+        """Seconds to wait before retry `attempt` (0-based) of a call that raised GmailAPIError `error`."""
+        return self.policy.backoff(attempt, error.retry_after if error is not None else None)
+
+    async def execute(self, call, method, units=None):
+        """Await call() under the quota, retrying throttled and 5xx GmailAPIErrors."""
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(method, units)
+            try:
+                with metrics.timer('gmail_call_seconds', method=method):
+                    result = await call()
+            except GmailAPIError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    await self.release(success=False, rate_limited=e.rate_limited)
+                    raise
+                delay = self.backoff(attempt, e)
+                metrics.count('gmail_retries_total', method=method, status=e.status)
+                await self.release(success=False, rate_limited=e.rate_limited, delay=delay, retry=True)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                await self.release(success=False)
+                raise
+            await self.release(success=True)
+            return result
+
+    def stats(self):
+        return self.policy.stats()
+
+
+class AsyncGmailClient:
+    """Gmail client whose calls are coroutines on one keep-alive connection pool.
+
+    Pass google `creds` or a bare `token`. Creds are refreshed by
+    gmail_auth.refresh_if_needed (ahead of expiry, saved to `token_path`)
+    off the event loop; `base_url` points the client at a local fake server.
+    Calls are paced and retried by `scheduler` (a new AsyncQuotaScheduler
+    by default).
+    """
+
+    def __init__(self, creds=None, token=None, base_url=GMAIL_API, user_id='me',
+                 max_connections=MAX_CONNECTIONS, timeout=30.0, scheduler=None, token_path=TOKEN_PATH):
+        self.creds = creds
+        self.token = token
+        self.token_path = token_path
+        self.scheduler = scheduler or AsyncQuotaScheduler()
+        self.base_url = base_url.rstrip('/')
+        self.user_id = user_id
+        self._refresh_lock = asyncio.Lock()
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def _headers(self):
+        if self.creds is not None:
+            if needs_refresh(self.creds):
+                async with self._refresh_lock:
+                    await asyncio.to_thread(refresh_if_needed, self.creds, self.token_path)
+            return {'Authorization': f'Bearer {self.creds.token}'}
+        if self.token:
+            return {'Authorization': f'Bearer {self.token}'}
+        return {}
+
+    def _path(self, path):
+        return f'/gmail/v1/users/{self.user_id}/{path}'
+
+    async def _request(self, api_method, method, path, params=None, json_body=None):
+        """Make one REST call under the scheduler; api_method names its QUOTA_UNITS entry."""
+        async def call():
+            response = await self._http.request(
+                method, self._path(path), params=params, json=json_body, headers=await self._headers()
+            )
+            if response.status_code >= 400:
+                raise _error_from_response(response.status_code, response.text, response.headers.get('retry-after'))
+            return response.json()
+
+        return await self.scheduler.execute(call, api_method)
+
+    async def send_message(self, message):
+        return await self._request('messages.send', 'POST', 'messages/send', json_body=message)
+
+    async def get_profile(self):
+        return await self._request('getProfile', 'GET', 'profile')
+
+    async def list_message_ids(self, query, limit=None):
+        """Return message ids matching the query, following nextPageToken."""
+        message_ids = []
+        page_token = None
+        while limit is None or len(message_ids) < limit:
+            params = {'q': query, 'maxResults': LIST_PAGE_SIZE}
+            if page_token:
+                params['pageToken'] = page_token
+            response = await self._request('messages.list', 'GET', 'messages', params=params)
+            message_ids.extend(msg['id'] for msg in response.get('messages', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        return message_ids if limit is None else message_ids[:limit]
+
+    async def get_metadata(self, message_id, metadata_headers=('From',)):
+        params = [('format', 'metadata')] + [('metadataHeaders', h) for h in metadata_headers]
+        return await self._request('messages.get', 'GET', f'messages/{message_id}', params=params)
+
+    async def list_added_message_ids(self, start_history_id):
+        """Async counterpart of check_reply.list_added_message_ids; raises GmailAPIError(404) when expired."""
+        message_ids = []
+        seen = set()
+        latest_history_id = start_history_id
+        page_token = None
+        while True:
+            params = {'startHistoryId': start_history_id, 'historyTypes': 'messageAdded',
+                      'labelId': 'INBOX', 'maxResults': LIST_PAGE_SIZE}
+            if page_token:
+                params['pageToken'] = page_token
+            response = await self._request('history.list', 'GET', 'history', params=params)
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    msg = added['message']
+                    if msg['id'] not in seen and 'INBOX' in msg.get('labelIds', ['INBOX']):
+                        seen.add(msg['id'])
+                        message_ids.append(msg['id'])
+            latest_history_id = response.get('historyId', latest_history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        return message_ids, latest_history_id
+
+    async def batch_get_metadata(self, message_ids, metadata_headers=('From',), batch_size=MAX_BATCH_SIZE):
+        """Fetch metadata for many messages with multipart batch requests, keyed by message id.
+
+        Like check_reply.fetch_metadata, calls throttled or failed with 5xx
+        inside a batch are re-batched after a backoff, up to the scheduler's
+        retry limit.
+        """
+        query = urlencode([('format', 'metadata')] + [('metadataHeaders', h) for h in metadata_headers])
+        scheduler = self.scheduler
+        results = {}
+        pending = list(message_ids)
+        for attempt in range(scheduler.max_retries + 1):
+            chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+            retry = []
+            for chunk_results, chunk_retry in await asyncio.gather(*(self._batch_get(chunk, query) for chunk in chunks)):
+                results.update(chunk_results)
+                retry += chunk_retry
+            if not retry:
+                break
+            if attempt == scheduler.max_retries:
+                for msg_id, error in retry:
+                    print(f"⚠️ Failed to fetch message {msg_id}: {error}")
+                break
+            delay = scheduler.backoff(attempt, retry[0][1])
+            if any(error.rate_limited for _, error in retry):
+                await scheduler.report_rate_limited(delay)
+            await asyncio.sleep(delay)
+            pending = [msg_id for msg_id, _ in retry]
+        return results
+
+    async def _batch_get(self, message_ids, query):
+        """Return ({message id: metadata}, [(message id, retryable GmailAPIError)]) for one batch."""
+        boundary = f'batch_{uuid.uuid4().hex}'
+        parts = []
+        for msg_id in message_ids:
+            parts.append(
+                f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <{msg_id}>\r\n\r\n'
+                f'GET {self._path(f"messages/{msg_id}")}?{query}\r\n\r\n'
+            )
+        body = ''.join(parts) + f'--{boundary}--\r\n'
+
+        async def call():
+            headers = await self._headers()
+            headers['Content-Type'] = f'multipart/mixed; boundary={boundary}'
+            response = await self._http.post('/batch/gmail/v1', content=body.encode(), headers=headers)
+            if response.status_code >= 400:
+                raise _error_from_response(response.status_code, response.text, response.headers.get('retry-after'))
+            return response
+
+        # A batch is one HTTP round-trip, but every inner call is billed
+        response = await self.scheduler.execute(call, 'messages.get', units=QUOTA_UNITS['messages.get'] * len(message_ids))
+        results = {}
+        retry = []
+        for content_id, status, payload in parse_batch_response(response.headers['content-type'], response.text):
+            if status >= 400:
+                error = _error_from_response(status, payload)
+                if error.retryable:
+                    retry.append((content_id, error))
+                else:
+                    print(f"⚠️ Failed to fetch message {content_id}: {error}")
+                continue
+            results[content_id] = json.loads(payload)
+        return results, retry
+
+    async def get_recent_repliers(self, query="in:inbox newer_than:2d"):
+        message_ids = await self.list_message_ids(query)
+        return _senders(await self.batch_get_metadata(message_ids))
+
+    async def get_new_repliers(self, checkpoint_path=CHECKPOINT_PATH, query="in:inbox newer_than:2d"):
+        """Async counterpart of check_reply.get_new_repliers, sharing its checkpoint file."""
+        history_id = load_checkpoint(checkpoint_path)
+        message_ids = None
+        if history_id is not None:
+            try:
+                message_ids, history_id = await self.list_added_message_ids(history_id)
+            except GmailAPIError as e:
+                if e.status != 404:
+                    raise
+                print("⚠️ Reply checkpoint expired, falling back to a full inbox scan.")
+
+        if message_ids is None:
+            history_id = (await self.get_profile())['historyId']
+            message_ids = await self.list_message_ids(query, limit=FULL_SCAN_LIMIT)
+
+        repliers = _senders(await self.batch_get_metadata(message_ids))
+        save_checkpoint(history_id, checkpoint_path)
+        return repliers
+
+    async def iter_send_results(self, messages, concurrency=DEFAULT_CONCURRENCY):
+        """Async counterpart of send_engine.iter_send_results, yielding the same result dicts.
+
+        Sends are paced and retried by the client's scheduler; a result
+        carries an error only once its retries are used up.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def send(email, message):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    sent = await self.send_message(message)
+                    error, message_id, thread_id = None, sent.get('id'), sent.get('threadId')
+                except (GmailAPIError, httpx.HTTPError) as e:
+                    error, message_id, thread_id = str(e), None, None
+                return {'email': email, 'message_id': message_id, 'thread_id': thread_id,
+                        'latency': time.perf_counter() - start, 'error': error, 'skipped': False}
+
+        messages = iter(messages)
+        max_in_flight = max(1, concurrency) * 2
+        pending = set()
+        while True:
+            for email, message in islice(messages, max_in_flight - len(pending)):
+                pending.add(asyncio.ensure_future(send(email, message)))
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+
+
+def _senders(metadata):
+    repliers = set()
+    for msg_data in metadata.values():
+        email = parse_sender(msg_data)
+        if email:
+            repliers.add(email)
+    return repliers
+
+
+def parse_batch_response(content_type, text):
+    """Yield (content_id, status, body) for each part of a multipart/mixed batch response."""
+    boundary = content_type.split('boundary=', 1)[1].strip().strip('"')
+    for part in text.split(f'--{boundary}'):
+        part = part.strip('\r\n')
+        if not part or part == '--':
+            continue
+        outer_headers, _, inner = part.replace('\r\n', '\n').partition('\n\n')
+        content_id = ''
+        for line in outer_headers.split('\n'):
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-id':
+                content_id = value.strip().strip('<>')
+                if content_id.startswith('response-'):
+                    content_id = content_id[len('response-'):]
+        status_line, _, rest = inner.partition('\n')
+        status = int(status_line.split()[1])
+        _, _, body = rest.partition('\n\n')
+        yield content_id, status, body.strip()
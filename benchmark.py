@@ -0,0 +1,932 @@
+"""Benchmarks for the send/track pipeline against fake_gmail.FakeGmailService.
+
+    python benchmark.py                                  # every benchmark, printed as JSON
+    python benchmark.py pipeline --sizes 1000 1000000    # once per synthetic CSV size
+    python benchmark.py pipeline --set latency=0.002 jitter=0.01 error_rate=0.02
+    python benchmark.py --output results.json --compare baseline.json
+
+Each benchmark runs in a fresh process, so its peak RSS is its own.
+The script exits with status 1 when a benchmark raises (including the
+output checks in send_engine, mime and retry), and with --compare when a
+throughput or latency figure is worse than the baseline by more than
+--tolerance.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from queue import Empty
+
+from check_reply import (get_campaign_replies, get_new_repliers, get_recent_repliers, parse_sender,
+                         remove_responders_from_csv)
+from async_gmail import AsyncGmailClient, AsyncQuotaScheduler
+from fake_gmail import FakeGmailServer, FakeGmailService
+from quota import QUOTA_UNITS, QuotaScheduler
+from send_engine import iter_send_results, send_campaign
+from send_mail import MessageBuilder, convert_to_double_braces, create_message
+from template import compile_template
+
+import httplib2
+import pandas as pd
+from googleapiclient.discovery import build
+
+
+def naive_recent_repliers(service):
+    """The original N+1 implementation: one list call, then one get per message."""
+    response = service.users().messages().list(userId='me', q="in:inbox newer_than:2d").execute()
+    repliers = set()
+    for msg in response.get('messages', []):
+        msg_data = service.users().messages().get(
+            userId='me', id=msg['id'], format='metadata', metadataHeaders=['From']
+        ).execute()
+        email = parse_sender(msg_data)
+        if email:
+            repliers.add(email)
+    return repliers
+
+
+def unlimited_scheduler(**kwargs):
+    """A scheduler that does not pace calls, so benchmarks measure the code rather than the quota."""
+    return QuotaScheduler(units_per_second=None, **kwargs)
+
+
+# Contact list sizes the size-dependent benchmarks run at by default
+SIZES = (1000, 10000, 100000, 1000000)
+NICHES = ('beauty', 'fitness', 'food', 'gaming', 'tech', 'travel')
+
+
+def make_contacts_csv(path, rows, seed=0, chunksize=100000):
+    """Write a deterministic synthetic contact CSV (influencer_name, email, niche, followers) in chunks."""
+    rng = random.Random(seed)
+    for start in range(0, rows, chunksize):
+        count = min(chunksize, rows - start)
+        pd.DataFrame({
+            'influencer_name': [f'Influencer {i}' for i in range(start, start + count)],
+            'email': [f'contact{i}@example.com' for i in range(start, start + count)],
+            'niche': [rng.choice(NICHES) for _ in range(count)],
+            'followers': [rng.randint(1000, 2000000) for _ in range(count)],
+        }).to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return path
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0-100) of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100.0 * len(ordered))) - 1))]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def bench_repliers(inbox_size=1000, latency=0.002):
+    """Compare HTTP round-trips and wall time of naive vs batched reply polling."""
+    results = {}
+    batched = lambda service: get_recent_repliers(service, scheduler=unlimited_scheduler())
+    for name, func in (('naive', naive_recent_repliers), ('batched', batched)):
+        service = FakeGmailService(inbox_size=inbox_size, latency=latency)
+        start = time.perf_counter()
+        repliers = func(service)
+        results[name] = {
+            'http_calls': service.http_calls,
+            'api_calls': dict(service.calls),
+            'seconds': round(time.perf_counter() - start, 4),
+            'repliers': len(repliers),
+        }
+    return results
+
+
+def bench_incremental_poll(inbox_size=1000, new_messages=10, latency=0.002):
+    """Compare a steady-state poll that rescans the inbox with one that reads history."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint_path = os.path.join(tmp, 'checkpoint.json')
+        for name in ('full_scan', 'history'):
+            service = FakeGmailService(inbox_size=inbox_size, latency=latency)
+            scheduler = unlimited_scheduler()
+            get_new_repliers(service, checkpoint_path=checkpoint_path, scheduler=scheduler)
+            for i in range(new_messages):
+                service.add_inbox_message(f'new{i}@example.com')
+            service.http_calls = 0
+            service.calls = {}
+            start = time.perf_counter()
+            if name == 'full_scan':
+                repliers = get_recent_repliers(service, scheduler=scheduler)
+            else:
+                repliers = get_new_repliers(service, checkpoint_path=checkpoint_path, scheduler=scheduler)
+            results[name] = {
+                'http_calls': service.http_calls,
+                'api_calls': dict(service.calls),
+                'seconds': round(time.perf_counter() - start, 4),
+                'repliers': len(repliers),
+            }
+    return results
+
+
+def bench_templates(rows=100000):
+    """Compare per-row str.replace personalization with compiled per-chunk rendering, checking both agree."""
+    subject = "Collaboration Opportunity with {influencer_name}"
+    message = "Hi {influencer_name}, I hope you're doing well. I'd love to collaborate with you. " * 4
+    df = pd.DataFrame({
+        'influencer_name': [f'Influencer {i}' for i in range(rows)],
+        'email': [f'contact{i}@example.com' for i in range(rows)],
+    })
+    records = list(df.itertuples(index=False))
+    results = {}
+
+    start = time.perf_counter()
+    subject_template = convert_to_double_braces(subject)
+    message_template = convert_to_double_braces(message)
+    expected = [(subject_template.replace("{{influencer_name}}", row.influencer_name),
+                 message_template.replace("{{influencer_name}}", row.influencer_name)) for row in records]
+    results['replace'] = time.perf_counter() - start
+
+    subject_template = compile_template(convert_to_double_braces(subject))
+    message_template = compile_template(convert_to_double_braces(message))
+    start = time.perf_counter()
+    rendered = list(zip(subject_template.render_chunk(df), message_template.render_chunk(df)))
+    results['chunk'] = time.perf_counter() - start
+    if rendered != expected:
+        raise AssertionError("render_chunk output differs from str.replace")
+
+    return {name: {'seconds': round(seconds, 4), 'rows_per_second': round(rows / seconds)}
+            for name, seconds in results.items()}
+
+
+def bench_mime(messages=20000):
+    """Time MessageBuilder against create_message and check the payloads are byte-identical."""
+    body = "Hi there, I hope you're doing well. I'd love to collaborate with you. 🙂 " * 4
+    items = [
+        (f'contact{i}@example.com', f'Collaboration with Influencer {i} ' + 'é' * (i % 4 == 3) * 40, body)
+        for i in range(messages)
+    ]
+    results = {}
+
+    start = time.perf_counter()
+    expected = [create_message(to, subject, text) for to, subject, text in items]
+    results['create_message'] = time.perf_counter() - start
+
+    builder = MessageBuilder()
+    start = time.perf_counter()
+    built = builder.build_batch(items)
+    results['builder'] = time.perf_counter() - start
+
+    constant_body = MessageBuilder(body)
+    start = time.perf_counter()
+    built_constant = constant_body.build_batch([(to, subject, None) for to, subject, _ in items])
+    results['builder_constant_body'] = time.perf_counter() - start
+
+    if built != expected or built_constant != expected:
+        raise AssertionError("MessageBuilder output differs from create_message")
+
+    return {name: {'seconds': round(seconds, 4), 'messages_per_second': round(messages / seconds)}
+            for name, seconds in results.items()}
+
+
+def bench_send_engine(messages=200, latency=0.02, jitter=0.01, error_rate=0.02, concurrency=8,
+                      paced_sends_per_second=50):
+    """Send through a fake with latency, jitter and 429s; check every contact is sent exactly once and pacing holds."""
+    items = [(f'contact{i}@example.com', {'raw': f'cmF3{i}'}) for i in range(messages)]
+    results = {}
+
+    # The original loop: one send at a time, a 429 drops the contact
+    service = FakeGmailService(latency=latency, jitter=jitter, error_rate=error_rate)
+    start = time.perf_counter()
+    sent = 0
+    for email, message in items:
+        try:
+            service.users().messages().send(userId='me', body=message).execute()
+            sent += 1
+        except Exception:
+            pass
+    results['sequential'] = {'seconds': time.perf_counter() - start, 'sent': sent}
+
+    for name, sends_per_second in (('engine', None), ('paced', paced_sends_per_second)):
+        service = FakeGmailService(latency=latency, jitter=jitter, error_rate=error_rate)
+        units = sends_per_second * QUOTA_UNITS['messages.send'] if sends_per_second else None
+        scheduler = QuotaScheduler(units_per_second=units, max_concurrency=concurrency, max_retries=8,
+                                   base_delay=0.01, max_delay=0.2)
+        start = time.perf_counter()
+        outcome = send_campaign(service, items, concurrency=concurrency, scheduler=scheduler)
+        seconds = time.perf_counter() - start
+        if sorted(r['email'] for r in outcome) != sorted(email for email, _ in items):
+            raise AssertionError(f"{name}: results do not cover every contact exactly once")
+        failed = [r for r in outcome if r['error'] is not None]
+        if failed:
+            raise AssertionError(f"{name}: {len(failed)} sends failed despite retries, e.g. {failed[0]['error']}")
+        if sorted(body['raw'] for body in service.sent) != sorted(message['raw'] for _, message in items):
+            raise AssertionError(f"{name}: the fake received duplicate or missing messages")
+        if sends_per_second:
+            # The bucket starts full with one second of quota; the rest must be spread out
+            floor = (messages - sends_per_second) / sends_per_second
+            if seconds < floor * 0.9:
+                raise AssertionError(f"paced: {messages} sends took {seconds:.2f}s, under the {floor:.2f}s quota floor")
+        results[name] = {'seconds': seconds, 'sent': len(outcome), 'retries': scheduler.stats()['retries']}
+
+    return {name: {**r, 'seconds': round(r['seconds'], 4), 'sends_per_second': round(r['sent'] / r['seconds'], 1)}
+            for name, r in results.items()}
+
+
+def bench_async_send(messages=400, latency=0.02, concurrency=16):
+    """Compare the threaded googleapiclient send path with AsyncGmailClient over a local fake server."""
+    items = [(f'contact{i}@example.com', {'raw': 'cmF3'}) for i in range(messages)]
+    results = {}
+    with FakeGmailServer(FakeGmailService(latency=latency)) as server:
+        service = build('gmail', 'v1', http=httplib2.Http(), static_discovery=True,
+                        client_options={'api_endpoint': server.url})
+        start = time.perf_counter()
+        results_iter = iter_send_results(service, items, concurrency=concurrency, http_factory=httplib2.Http,
+                                         scheduler=unlimited_scheduler(max_concurrency=concurrency))
+        sent = sum(1 for r in results_iter if r['error'] is None)
+        results['threaded'] = {'seconds': time.perf_counter() - start, 'sent': sent}
+
+        async def run_async():
+            scheduler = AsyncQuotaScheduler(units_per_second=None, max_concurrency=concurrency)
+            async with AsyncGmailClient(token='fake', base_url=server.url, max_connections=concurrency,
+                                        scheduler=scheduler) as client:
+                count = 0
+                async for r in client.iter_send_results(items, concurrency=concurrency):
+                    count += r['error'] is None
+                return count
+
+        start = time.perf_counter()
+        sent = asyncio.run(run_async())
+        results['async'] = {'seconds': time.perf_counter() - start, 'sent': sent}
+
+    for result in results.values():
+        result['sends_per_second'] = round(result['sent'] / result['seconds'], 1)
+        result['seconds'] = round(result['seconds'], 4)
+    return results
+
+
+def bench_retry(messages=300, error_rate=0.2, latency=0.005):
+    """Send through a fake that throttles a share of calls and check the scheduler still delivers everything."""
+    items = [(f'contact{i}@example.com', {'raw': 'cmF3'}) for i in range(messages)]
+    results = {}
+    for name, max_retries in (('no_retry', 0), ('scheduler', 8)):
+        service = FakeGmailService(latency=latency, error_rate=error_rate)
+        scheduler = unlimited_scheduler(max_concurrency=16, max_retries=max_retries, base_delay=0.01, max_delay=0.2,
+                                        success_window=10)
+        start = time.perf_counter()
+        sent = sum(1 for r in iter_send_results(service, items, concurrency=16, scheduler=scheduler)
+                   if r['error'] is None)
+        stats = scheduler.stats()
+        results[name] = {
+            'seconds': round(time.perf_counter() - start, 4),
+            'delivered': sent,
+            'dropped': messages - sent,
+            'retries': stats['retries'],
+            'rate_limited': stats['rate_limited'],
+            'final_concurrency': stats['limit'],
+        }
+
+    async def send_async(server):
+        scheduler = AsyncQuotaScheduler(units_per_second=None, max_concurrency=16, max_retries=8, base_delay=0.01,
+                                        max_delay=0.2, success_window=10)
+        async with AsyncGmailClient(token='fake', base_url=server.url, scheduler=scheduler) as client:
+            sent = 0
+            async for r in client.iter_send_results(items, concurrency=16):
+                sent += r['error'] is None
+        return sent, scheduler.stats()
+
+    with FakeGmailServer(FakeGmailService(latency=latency, error_rate=error_rate)) as server:
+        start = time.perf_counter()
+        sent, stats = asyncio.run(send_async(server))
+    assert sent == messages, f"async client dropped {messages - sent} of {messages} throttled sends"
+    results['async_scheduler'] = {
+        'seconds': round(time.perf_counter() - start, 4),
+        'delivered': sent,
+        'dropped': messages - sent,
+        'retries': stats['retries'],
+        'rate_limited': stats['rate_limited'],
+        'final_concurrency': stats['limit'],
+    }
+    return results
+
+
+def bench_personalize(contacts=400, pack_size=8, concurrency=16, latency=0.05, malformed_rate=0.05, drop_rate=0.05):
+    """Draft per-recipient copy through a mock completion server, then rerun to check the resume path."""
+    os.environ.setdefault('GROQ_API_KEY', 'fake')
+    from groq import AsyncGroq
+    from fake_groq import FakeCompletionServer
+    from journal import SendJournal
+    from personalize import Personalizer
+
+    records = [{'email': f'contact{i}@example.com', 'influencer_name': f'Creator {i}', 'niche': 'fitness',
+                'followers': str(1000 + i)} for i in range(contacts)]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, \
+            FakeCompletionServer(latency=latency, malformed_rate=malformed_rate, drop_rate=drop_rate) as server:
+        with SendJournal(os.path.join(tmp, 'journal.db'), 'bench') as journal:
+            for name, size in (('one_per_call', 1), ('packed', pack_size), ('resume', pack_size)):
+                if name != 'resume':
+                    with journal._lock, journal._conn:
+                        journal._conn.execute('DELETE FROM drafts')
+                client = AsyncGroq(api_key='fake', base_url=server.url, max_retries=0)
+                personalizer = Personalizer(journal, 'Collab with {{influencer_name}}', 'Hi {{influencer_name}}',
+                                            client=client, pack_size=size, concurrency=concurrency)
+                start = time.perf_counter()
+                stats = asyncio.run(personalizer.run(records))
+                elapsed = time.perf_counter() - start
+                results[name] = dict(stats, seconds=round(elapsed, 4),
+                                     drafts_per_second=round(stats['drafted'] / elapsed, 1))
+            results['drafts_in_journal'] = len(journal.drafted())
+    return results
+
+
+# Mail in a campaign thread that is not the contact answering: (sender, extra headers)
+AUTOMATED_MAIL = (
+    ('mailer-daemon@googlemail.com', {}),
+    ('postmaster@example.net', {}),
+    (None, {'Auto-Submitted': 'auto-replied'}),
+    (None, {'Precedence': 'bulk'}),
+    ('me@example.com', {}),
+)
+
+
+def bench_reply_matching(sent=1000, unrelated=2000, replies=50, automated=50):
+    """Compare From-header polling with thread/Message-ID matching on an inbox that is mostly unrelated mail.
+
+    `automated` more campaign threads get a bounce, an auto-reply or a copy
+    of our own message, none of which is a reply.
+    """
+    from journal import SendJournal
+    from reply_index import ReplyIndex
+    from check_reply import backfill_message_ids
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        service = FakeGmailService(inbox_size=10)
+        journal = SendJournal(os.path.join(tmp, 'journal.db'), 'bench')
+        items = [(f'contact{i}@example.com', {'raw': 'cmF3'}) for i in range(sent)]
+        threads = [result['thread_id'] for result in
+                   iter_send_results(service, items, scheduler=unlimited_scheduler(), journal=journal)]
+        index = ReplyIndex(journal.path)
+        backfill_start = time.perf_counter()
+        while backfill_message_ids(service, journal, index, scheduler=unlimited_scheduler()):
+            pass
+        backfill_seconds = time.perf_counter() - backfill_start
+        # Set both checkpoints, so the polls below only see the new mail
+        get_campaign_replies(service, index, os.path.join(tmp, 'threads.json'), scheduler=unlimited_scheduler())
+        get_new_repliers(service, os.path.join(tmp, 'from.json'), scheduler=unlimited_scheduler())
+
+        for i in range(unrelated):
+            service.add_inbox_message(f'contact{i % sent}@example.com')  # contacts mailing outside the campaign
+        for i in range(replies):
+            # Half reply from an alias address in the campaign thread
+            sender = f'alias{i}@elsewhere.com' if i % 2 else f'contact{i}@example.com'
+            service.add_inbox_message(sender, thread_id=threads[i])
+        for i in range(replies, replies + automated):
+            sender, headers = AUTOMATED_MAIL[i % len(AUTOMATED_MAIL)]
+            service.add_inbox_message(sender or f'contact{i}@example.com', thread_id=threads[i], headers=headers)
+
+        for name, poll in (
+            ('from_header', lambda: get_new_repliers(service, os.path.join(tmp, 'from.json'),
+                                                     scheduler=unlimited_scheduler())),
+            ('thread_index', lambda: get_campaign_replies(service, index, os.path.join(tmp, 'threads.json'),
+                                                          scheduler=unlimited_scheduler(), journal=journal)),
+        ):
+            gets_before = service.calls.get('messages.get', 0)
+            start = time.perf_counter()
+            found = poll()
+            expected = {f'contact{i}@example.com' for i in range(replies)}
+            results[name] = {
+                'seconds': round(time.perf_counter() - start, 4),
+                'metadata_fetches': service.calls.get('messages.get', 0) - gets_before,
+                'true_replies_found': len(found & expected),
+                'false_positives': len(found - expected),
+            }
+        results['thread_index']['message_id_backfill'] = {'messages': sent, 'seconds': round(backfill_seconds, 4)}
+        index.close()
+        journal.close()
+    return results
+
+
+def bench_push(replies=20, duration=2.0, poll_interval=0.5):
+    """Compare reply detection delay and mailbox polls between fixed-interval polling and push notifications."""
+    import statistics
+    import threading
+    from journal import SendJournal
+    from push import NotificationReceiver, ReplyWaiter
+    from reply_index import ReplyIndex
+    from sender_pool import Sender
+
+    results = {}
+    for mode in ('polling', 'push'):
+        with tempfile.TemporaryDirectory() as tmp:
+            service = FakeGmailService()
+            scheduler = unlimited_scheduler()
+            journal = SendJournal(os.path.join(tmp, 'journal.db'), 'bench')
+            items = [(f'contact{i}@example.com', {'raw': 'cmF3'}) for i in range(replies)]
+            sent = list(iter_send_results(service, items, scheduler=scheduler, journal=journal))
+            index = ReplyIndex(journal.path)
+            checkpoint = os.path.join(tmp, 'checkpoint.json')
+            sender = Sender('me', 'unused.json', checkpoint_path=checkpoint, service=service, scheduler=scheduler)
+            if mode == 'push':
+                receiver = NotificationReceiver(port=0, token=None)
+                service.push_endpoint = receiver.url
+                # Same fallback-to-poll ratio as the defaults (FALLBACK_INTERVAL / POLL_INTERVAL)
+                waiter = ReplyWaiter([sender], topic='projects/fake/topics/gmail', receiver=receiver,
+                                     fallback_interval=poll_interval * 15, coalesce=0.01)
+            else:
+                waiter = ReplyWaiter([sender], topic=None, interval=poll_interval)
+            waiter.start()
+            get_campaign_replies(service, index, checkpoint, scheduler=scheduler)
+
+            delivered = {}
+
+            def deliver():
+                for result in sent:
+                    time.sleep(duration / replies)
+                    delivered[result['email']] = time.perf_counter()
+                    service.add_inbox_message(result['email'], thread_id=result['thread_id'])
+
+            polls_before = service.calls.get('history.list', 0)
+            threading.Thread(target=deliver, daemon=True).start()
+            detected = {}
+            deadline = time.perf_counter() + duration * 2
+            while len(detected) < replies and time.perf_counter() < deadline:
+                for email in get_campaign_replies(service, index, checkpoint, scheduler=scheduler):
+                    detected.setdefault(email, time.perf_counter())
+                if len(detected) < replies:
+                    waiter.wait()
+            # Then an idle mailbox for the same length of time
+            polls_before_idle = service.calls.get('history.list', 0)
+            threading.Timer(duration, waiter.wake).start()
+            while waiter.wait():
+                get_campaign_replies(service, index, checkpoint, scheduler=scheduler)
+            waiter.stop()
+            if mode == 'push':
+                receiver.stop()
+            delays = [detected[email] - delivered[email] for email in detected]
+            results[mode] = {
+                'detected': len(detected),
+                'mean_delay_seconds': round(statistics.mean(delays), 4),
+                'max_delay_seconds': round(max(delays), 4),
+                'mailbox_polls': polls_before_idle - polls_before,
+                'idle_polls': service.calls.get('history.list', 0) - polls_before_idle,
+            }
+            index.close()
+            journal.close()
+    return results
+
+
+def bench_adaptive_poll(waves=2, replies_per_wave=200, campaigns=3, hours=24, fixed_interval=60,
+                        reply_halflife=1800, seed=0):
+    """Simulate a day of reply tracking on a virtual clock: fixed-interval polling vs AdaptivePollScheduler.
+
+    Replies to each send wave arrive with exponentially decaying frequency.
+    One thread per campaign (the old Gradio loop) polls the mailbox once
+    per campaign; ReplyTracker polls it once for all of them.
+    """
+    import math
+    import random
+    from poll_scheduler import AdaptivePollScheduler
+    from sender_pool import Sender
+
+    rng = random.Random(seed)
+    horizon = hours * 3600
+    wave_times = [i * horizon / waves for i in range(waves)]
+    arrivals = sorted(t + rng.expovariate(math.log(2) / reply_halflife)
+                      for t in wave_times for _ in range(replies_per_wave))
+    arrivals = [t for t in arrivals if t < horizon]
+
+    def detect(poll_times):
+        delays, i = [], 0
+        for poll in poll_times:
+            while i < len(arrivals) and arrivals[i] <= poll:
+                delays.append(poll - arrivals[i])
+                i += 1
+        delays.sort()
+        return {'polls': len(poll_times), 'mean_delay_seconds': round(sum(delays) / len(delays), 1),
+                'p95_delay_seconds': round(delays[int(len(delays) * 0.95)], 1)}
+
+    fixed = detect([fixed_interval * (i + 1) for i in range(int(horizon // fixed_interval))])
+    fixed['polls_for_all_campaigns'] = fixed['polls'] * campaigns
+
+    now = [0.0]
+    sender = Sender('me', 'unused.json', service=FakeGmailService(), scheduler=unlimited_scheduler())
+    schedule = AdaptivePollScheduler([sender], clock=lambda: now[0])
+    poll_times, pending_waves, last_poll = [], list(wave_times), 0.0
+    while True:
+        if pending_waves and pending_waves[0] <= now[0]:
+            schedule.note_send('me', pending_waves.pop(0))
+        if schedule.due():
+            poll_times.append(now[0])
+            found = any(last_poll < t <= now[0] for t in arrivals)
+            schedule.record_poll('me', {'reply'} if found else set())
+            last_poll = now[0]
+        step = schedule.next_wait()
+        if pending_waves:
+            step = min(step, max(0.0, pending_waves[0] - now[0]))
+        now[0] += max(step, 1e-6)
+        if now[0] >= horizon:
+            break
+    adaptive = detect(poll_times)
+    adaptive['polls_for_all_campaigns'] = adaptive['polls']
+    assert adaptive['p95_delay_seconds'] <= fixed['p95_delay_seconds'], \
+        f"adaptive polling finds replies later than a fixed {fixed_interval}s loop (p95)"
+    return {'replies': len(arrivals), 'fixed_interval': fixed, 'adaptive': adaptive}
+
+
+def bench_reconcile(contacts=1000000, repliers=10000, naive_sample=20):
+    """Mark repliers in a large contact list: the original per-replier DataFrame scan vs ContactStore.
+
+    The scan is timed on `naive_sample` repliers and extrapolated.
+    """
+    import random
+    from contact_store import ContactStore
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'contacts.csv')
+        emails = [f'Contact{i}@Example.com' for i in range(contacts)]
+        pd.DataFrame({'influencer_name': [f'Name {i}' for i in range(contacts)], 'email': emails}).to_csv(
+            csv_path, index=False)
+        replied = [email.lower() for email in rng.sample(emails, repliers)]
+
+        original_df = pd.read_csv(csv_path)
+        start = time.perf_counter()
+        for email in replied[:naive_sample]:
+            original_df.loc[original_df['email'].str.lower() == email, ['influencer_name', 'email']]
+        naive_seconds = (time.perf_counter() - start) / naive_sample * repliers
+
+        store = ContactStore(os.path.join(tmp, 'contacts.db'))
+        start = time.perf_counter()
+        store.import_csv(csv_path)
+        import_seconds = time.perf_counter() - start
+        # What every later poll pays for the unchanged CSV
+        start = time.perf_counter()
+        store.import_csv(csv_path)
+        reimport_seconds = time.perf_counter() - start
+        store.counts(csv_path)
+        start = time.perf_counter()
+        marked = store.mark_responded(csv_path, replied)
+        mark_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        counts = store.counts(csv_path)
+        counts_seconds = time.perf_counter() - start
+        store.close()
+    return {
+        'contacts': contacts,
+        'repliers': repliers,
+        'dataframe_scan_seconds_estimated': round(naive_seconds, 1),
+        'store_import_seconds': round(import_seconds, 2),
+        'unchanged_reimport_seconds': round(reimport_seconds, 6),
+        'mark_responded_seconds': round(mark_seconds, 3),
+        'counts_seconds': round(counts_seconds, 6),
+        'marked': len(marked),
+        'counts': counts,
+    }
+
+
+def bench_fair_send(workers=16, big=3000, small=200, latency=0.01):
+    """Send one large and two small campaigns at once on a shared pool: FIFO vs jobs.FairExecutor.
+
+    The large campaign keeps 64 sends queued; each small one 16. Reported
+    are the seconds each campaign took from its own start.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from jobs import FairExecutor
+
+    results = {}
+    for mode in ('fifo', 'fair'):
+        service = FakeGmailService(latency=latency)
+        executor = FairExecutor(workers) if mode == 'fair' else ThreadPoolExecutor(workers)
+        took = {}
+
+        def campaign(name, count, delay, concurrency):
+            time.sleep(delay)
+            start = time.perf_counter()
+            items = ((f'{name}{i}@example.com', {'raw': 'cmF3'}) for i in range(count))
+            for _ in iter_send_results(service, items, concurrency=concurrency,
+                                       scheduler=unlimited_scheduler(max_concurrency=64),
+                                       executor=executor.tenant(name) if mode == 'fair' else executor):
+                pass
+            took[name] = round(time.perf_counter() - start, 2)
+
+        threads = [threading.Thread(target=campaign, args=args)
+                   for args in (('big', big, 0, 32), ('small1', small, 0.2, 8), ('small2', small, 0.4, 8))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        executor.shutdown()
+        results[mode] = took
+    return results
+
+
+def bench_pipeline(rows=10000, send_limit=20000, inbox_size=2000, latency=0.0, jitter=0.0, error_rate=0.0,
+                   reply_rate=0.01, concurrency=8):
+    """End-to-end cost of one campaign on a synthetic CSV of `rows` contacts.
+
+    Stages: template substitution and MIME building for every row; sending
+    the first `send_limit` messages to the fake service (sends/s and
+    p50/p99 send latency); one reply poll of an inbox of `inbox_size`
+    messages (time, HTTP calls and quota units); and moving `reply_rate`
+    of the contacts out of the CSV with remove_responders_from_csv.
+    """
+    from send_mail import prepare_campaign
+
+    subject = "Collaboration Opportunity with {influencer_name}"
+    message = "Hi {influencer_name}, I love your {niche} content and would like to work with you."
+    result = {'rows': rows}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = make_contacts_csv(os.path.join(tmp, 'contacts.csv'), rows)
+
+        start = time.perf_counter()
+        prepared = sum(1 for _ in prepare_campaign(csv_path, subject, message))
+        seconds = time.perf_counter() - start
+        result['prepare'] = {'seconds': round(seconds, 3), 'rows_per_second': round(prepared / seconds)}
+
+        service = FakeGmailService(latency=latency, jitter=jitter, error_rate=error_rate)
+        messages = (item for _, item in zip(range(send_limit), prepare_campaign(csv_path, subject, message)))
+        start = time.perf_counter()
+        results = list(iter_send_results(service, messages, concurrency=concurrency,
+                                         scheduler=unlimited_scheduler(max_retries=8)))
+        seconds = time.perf_counter() - start
+        latencies = [r['latency'] * 1000 for r in results if r['error'] is None]
+        result['send'] = {
+            'messages': len(results),
+            'failed': sum(1 for r in results if r['error'] is not None),
+            'seconds': round(seconds, 3),
+            'sends_per_second': round(len(results) / seconds),
+            'latency_p50_ms': round(percentile(latencies, 50), 3),
+            'latency_p99_ms': round(percentile(latencies, 99), 3),
+        }
+
+        service = FakeGmailService(inbox_size=inbox_size, latency=latency, jitter=jitter, error_rate=error_rate)
+        scheduler = unlimited_scheduler(max_retries=8)
+        start = time.perf_counter()
+        repliers = get_recent_repliers(service, scheduler=scheduler)
+        result['poll'] = {
+            'inbox_size': inbox_size,
+            'seconds': round(time.perf_counter() - start, 4),
+            'http_calls': service.http_calls,
+            'quota_units': sum(scheduler.stats()['units_used'].values()),
+            'repliers': len(repliers),
+        }
+
+        repliers = {f'contact{i}@example.com' for i in random.Random(1).sample(range(rows), int(rows * reply_rate))}
+        start = time.perf_counter()
+        remove_responders_from_csv(csv_path, repliers, responded_path=os.path.join(tmp, 'responded.csv'))
+        seconds = time.perf_counter() - start
+        result['remove_responders'] = {'repliers': len(repliers), 'seconds': round(seconds, 3),
+                                       'rows_per_second': round(rows / seconds)}
+    return result
+
+
+def bench_metrics(rows=20000, repeats=3):
+    """Cost of the hot-path instrumentation: bench_pipeline with CAMPAIGN_METRICS unset vs set.
+
+    metrics.py reads the variable at import, so each run is a fresh
+    process. Every stage keeps its best time over `repeats` runs;
+    overhead is the relative slowdown with metrics on (no exporter runs,
+    so only the recording itself is measured).
+    """
+    previous = os.environ.pop('CAMPAIGN_METRICS', None)
+    best = {}
+    try:
+        for mode in ('off', 'on'):
+            if mode == 'on':
+                os.environ['CAMPAIGN_METRICS'] = 'jsonl'
+            for _ in range(repeats):
+                run = run_benchmark('pipeline', {'rows': rows, 'send_limit': rows, 'inbox_size': 200})
+                for stage in ('prepare', 'send', 'poll', 'remove_responders'):
+                    seconds = run[stage]['seconds']
+                    best.setdefault(mode, {})[stage] = min(best.get(mode, {}).get(stage, seconds), seconds)
+    finally:
+        os.environ.pop('CAMPAIGN_METRICS', None)
+        if previous is not None:
+            os.environ['CAMPAIGN_METRICS'] = previous
+    result = {mode: {stage: {'seconds': seconds} for stage, seconds in stages.items()} for mode, stages in best.items()}
+    result['overhead_pct'] = {stage: round((best['on'][stage] / best['off'][stage] - 1) * 100, 1)
+                              for stage in best['off']}
+    return result
+
+
+# What each cli.py command imports before its first network call, and what every entry point used to import
+STARTUP_SNIPPETS = {
+    'interpreter': 'pass',
+    'status': 'import cli; cli.main(["status"])',
+    'track_once': 'import cli, check_reply, sender_pool, reply_index, journal, contact_store',
+    'send': 'import cli, send_mail',
+    'suggest': 'import cli, sugestion',
+    'eager': 'import pandas, groq, dotenv, googleapiclient.discovery, google_auth_oauthlib.flow, google_auth_httplib2',
+}
+HEAVY_MODULES = ('pandas', 'groq', 'dotenv', 'googleapiclient', 'google_auth_oauthlib', 'google_auth_httplib2')
+
+
+def bench_startup(repeats=5):
+    """Cold-start cost of each cli.py command: best wall time of a fresh interpreter over `repeats` runs.
+
+    Also lists which heavy dependencies each one loads. 'eager' imports
+    everything app.py, send_mail and check_reply used to load up front.
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=repo)
+    env.pop('CAMPAIGN_METRICS', None)
+    report = (f"; import json, sys; print(json.dumps(sorted({{m.split('.')[0] for m in sys.modules}} "
+              f"& set({HEAVY_MODULES!r}))))")
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, snippet in STARTUP_SNIPPETS.items():
+            best = float('inf')
+            for _ in range(repeats):
+                start = time.perf_counter()
+                output = subprocess.run([sys.executable, '-c', snippet + report], cwd=tmp, env=env,
+                                        capture_output=True, text=True, check=True).stdout
+                best = min(best, time.perf_counter() - start)
+            # The snippet's last line is the list of heavy modules it loaded
+            result[name] = {'seconds': round(best, 3), 'heavy_modules': json.loads(output.splitlines()[-1])}
+    return result
+
+
+BENCHMARKS = {
+    'repliers': bench_repliers,
+    'incremental_poll': bench_incremental_poll,
+    'templates': bench_templates,
+    'mime': bench_mime,
+    'send_engine': bench_send_engine,
+    'async_send': bench_async_send,
+    'retry': bench_retry,
+    'personalize': bench_personalize,
+    'reply_matching': bench_reply_matching,
+    'push': bench_push,
+    'adaptive_poll': bench_adaptive_poll,
+    'reconcile': bench_reconcile,
+    'fair_send': bench_fair_send,
+    'pipeline': bench_pipeline,
+    'metrics': bench_metrics,
+    'startup': bench_startup,
+}
+# Benchmarks that run once per --sizes entry, with the size as this keyword
+SIZED = {'pipeline': 'rows', 'templates': 'rows', 'reconcile': 'contacts'}
+
+
+def _run_child(name, kwargs, queue):
+    try:
+        result = BENCHMARKS[name](**kwargs)
+    except Exception as e:
+        queue.put({'error': f'{type(e).__name__}: {e}'})
+        return
+    if isinstance(result, dict):
+        result['peak_rss_mb'] = peak_rss_mb()
+    queue.put(result)
+
+
+def run_benchmark(name, kwargs=None, isolate=True):
+    """Run one benchmark; in a fresh process when `isolate`, so peak_rss_mb is its own."""
+    kwargs = kwargs or {}
+    if not isolate:
+        result = BENCHMARKS[name](**kwargs)
+        if isinstance(result, dict):
+            result['peak_rss_mb'] = peak_rss_mb()
+        return result
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_child, args=(name, kwargs, queue))
+    process.start()
+    while True:
+        try:
+            result = queue.get(timeout=1.0)
+            break
+        except Empty:
+            # A child killed before reporting (e.g. out of memory) counts as a failure, not a hang
+            if not process.is_alive():
+                result = {'error': f'benchmark process exited with code {process.exitcode}'}
+                break
+    process.join()
+    return result
+
+
+def _metrics(report, prefix=''):
+    """Yield (path, value) for every number in a nested report."""
+    for key, value in report.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            yield from _metrics(value, path + '.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def _direction(path):
+    """+1 if a larger value is better, -1 if smaller is better, 0 if the metric is not compared."""
+    key = path.rsplit('.', 1)[-1]
+    if key.endswith('_per_second'):
+        return 1
+    if key == 'seconds' or 'latency' in key or key == 'peak_rss_mb':
+        return -1
+    return 0
+
+
+def compare_reports(current, baseline, tolerance=0.15, min_seconds=0.01):
+    """Return a list of regressions: throughput down or time/latency/memory up by more than `tolerance`.
+
+    Timings below `min_seconds` in both reports are too noisy to compare.
+    """
+    old = dict(_metrics(baseline))
+    regressions = []
+    for path, value in _metrics(current):
+        direction = _direction(path)
+        if not direction or path not in old or not old[path]:
+            continue
+        if path.endswith('seconds') and max(value, old[path]) < min_seconds:
+            continue
+        change = (value - old[path]) / abs(old[path])
+        if change * direction < -tolerance:
+            regressions.append(f'{path}: {old[path]} -> {value} ({change:+.0%})')
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('names', nargs='*', default=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument('--sizes', nargs='*', type=int, default=None,
+                        help=f"contact list sizes for {', '.join(SIZED)} (default: each benchmark's own)")
+    parser.add_argument('--all-sizes', action='store_true', help=f"same as --sizes {' '.join(map(str, SIZES))}")
+    parser.add_argument('--set', nargs='*', default=[], metavar='KEY=VALUE',
+                        help="keyword arguments for the benchmarks, e.g. latency=0.002 error_rate=0.05")
+    parser.add_argument('--no-isolate', action='store_true', help="run in this process (peak RSS is then cumulative)")
+    parser.add_argument('--output', help="also write the report to this JSON file")
+    parser.add_argument('--compare', help="baseline report to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed relative slowdown (default 0.15)")
+    args = parser.parse_args()
+
+    sizes = SIZES if args.all_sizes else args.sizes
+    overrides = {}
+    for item in args.set:
+        key, _, value = item.partition('=')
+        try:
+            overrides[key] = json.loads(value)
+        except ValueError:
+            overrides[key] = value
+    results = {}
+    for name in args.names:
+        # Each benchmark gets only the overrides it accepts
+        kwargs = {key: value for key, value in overrides.items()
+                  if key in BENCHMARKS[name].__code__.co_varnames[:BENCHMARKS[name].__code__.co_argcount]}
+        if sizes and name in SIZED:
+            for size in sizes:
+                results[f'{name}[{size}]'] = run_benchmark(name, dict(kwargs, **{SIZED[name]: size}),
+                                                           isolate=not args.no_isolate)
+        else:
+            results[name] = run_benchmark(name, kwargs, isolate=not args.no_isolate)
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'results': results,
+    }
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    failed = [name for name, result in results.items() if isinstance(result, dict) and 'error' in result]
+    if failed:
+        print(f"❌ {len(failed)} benchmark(s) failed:")
+        for name in failed:
+            print(f"   {name}: {results[name]['error']}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report['results'], baseline.get('results', baseline), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) against {args.compare}:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"✅ No regressions against {args.compare}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,46 +1,279 @@
-import pandas as pd
 import os
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-
-SCOPES = [
-    'https://www.googleapis.com/auth/gmail.readonly',
-    'https://www.googleapis.com/auth/gmail.send',
-]
-
-
-def gmail_authenticate():
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(r'credentials/credentials_email.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token_file:
-            token_file.write(creds.to_json())
-    return creds
-
-def get_recent_repliers(service):
-    response = service.users().messages().list(userId='me', q="in:inbox newer_than:2d").execute()
-    messages = response.get('messages', [])
+import json
+import time
+from itertools import islice
+from googleapiclient.errors import HttpError
+from contacts import DEFAULT_CHUNKSIZE, iter_contact_chunks, read_columns, read_emails
+from contact_store import ContactStore, append_responded_csv
+from quota import QUOTA_UNITS, get_default_scheduler, is_rate_limited, is_retryable
+from reply_index import is_automated
+import metrics
+
+# Gmail accepts at most 100 calls in one batch HTTP request
+MAX_BATCH_SIZE = 100
+# Largest page size messages().list supports
+LIST_PAGE_SIZE = 500
+# Where the last processed Gmail historyId is persisted between polls
+CHECKPOINT_PATH = 'reply_checkpoint.json'
+# Upper bound on messages fetched when the history checkpoint is missing or expired
+FULL_SCAN_LIMIT = 2000
+# Sent messages whose Message-ID is looked up per poll
+BACKFILL_LIMIT = 500
+# Headers read from messages in campaign threads: who sent it, what it answers, and whether it is automated
+REPLY_HEADERS = ('From', 'In-Reply-To', 'References', 'Auto-Submitted', 'Precedence')
+
+
+def list_message_ids(service, query, user_id='me', scheduler=None):
+    """Yield every message id matching the query, following nextPageToken."""
+    for msg in list_messages(service, query, user_id=user_id, scheduler=scheduler):
+        yield msg['id']
+
+def list_messages(service, query, user_id='me', scheduler=None):
+    """Yield {'id', 'threadId'} for every message matching the query, following nextPageToken."""
+    scheduler = scheduler or get_default_scheduler()
+    page_token = None
+    while True:
+        response = scheduler.execute(service.users().messages().list(
+            userId=user_id, q=query, maxResults=LIST_PAGE_SIZE, pageToken=page_token
+        ), 'messages.list')
+        yield from response.get('messages', [])
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+@metrics.timed('metadata_fetch_seconds')
+def fetch_metadata(service, message_ids, metadata_headers=('From',), user_id='me', batch_size=MAX_BATCH_SIZE,
+                   scheduler=None):
+    """Fetch metadata for many messages using batch HTTP requests, keyed by message id.
+
+    Calls throttled or failed with 5xx inside a batch are collected and
+    re-batched after a backoff, up to the scheduler's retry limit.
+    """
+    scheduler = scheduler or get_default_scheduler()
+    results = {}
+    retry = []
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            if isinstance(exception, HttpError) and is_retryable(exception):
+                retry.append((request_id, exception))
+            else:
+                print(f"⚠️ Failed to fetch message {request_id}: {exception}")
+            return
+        results[request_id] = response
+
+    pending = list(message_ids)
+    for attempt in range(scheduler.max_retries + 1):
+        retry.clear()
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            batch = service.new_batch_http_request(callback=callback)
+            for msg_id in chunk:
+                batch.add(
+                    service.users().messages().get(
+                        userId=user_id, id=msg_id, format='metadata', metadataHeaders=list(metadata_headers)
+                    ),
+                    request_id=msg_id
+                )
+            scheduler.execute(batch, 'messages.get', units=QUOTA_UNITS['messages.get'] * len(chunk))
+        if not retry:
+            break
+        if attempt == scheduler.max_retries:
+            for msg_id, exception in retry:
+                print(f"⚠️ Failed to fetch message {msg_id}: {exception}")
+            break
+        delay = scheduler.backoff(attempt, retry[0][1])
+        if any(is_rate_limited(exception) for _, exception in retry):
+            scheduler.report_rate_limited(delay)
+        time.sleep(delay)
+        pending = [msg_id for msg_id, _ in retry]
+    metrics.count('metadata_fetched_total', len(results))
+    return results
+
+def parse_header(msg_data, name):
+    """Return the value of a header from a metadata response ('' if absent); names match case-insensitively."""
+    name = name.lower()
+    for h in msg_data['payload']['headers']:
+        if h['name'].lower() == name:
+            return h['value']
+    return ''
+
+def parse_sender(msg_data):
+    """Return the lower-cased sender address of a metadata response, or None."""
+    for h in msg_data['payload']['headers']:
+        if h['name'] == 'From':
+            email = h['value']
+            if '<' in email:
+                email = email.split('<')[1].strip('>')
+            return email.lower()
+    return None
+
+def load_checkpoint(path=CHECKPOINT_PATH):
+    """Return the persisted historyId, or None if there is no checkpoint."""
+    try:
+        with open(path) as f:
+            return json.load(f).get('historyId')
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_checkpoint(history_id, path=CHECKPOINT_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'historyId': str(history_id)}, f)
+    os.replace(tmp_path, path)
+
+def list_added_message_ids(service, start_history_id, user_id='me', scheduler=None):
+    """Return (message_ids, latest_history_id) for inbox messages added since start_history_id.
+
+    Raises HttpError with status 404 when the checkpoint is too old for Gmail to serve.
+    """
+    messages, latest_history_id = list_added_messages(service, start_history_id, user_id, scheduler)
+    return [msg['id'] for msg in messages], latest_history_id
+
+def list_added_messages(service, start_history_id, user_id='me', scheduler=None):
+    """Like list_added_message_ids, but returns the {'id', 'threadId'} dicts from the history records."""
+    scheduler = scheduler or get_default_scheduler()
+    messages = []
+    seen = set()
+    latest_history_id = start_history_id
+    page_token = None
+    while True:
+        response = scheduler.execute(service.users().history().list(
+            userId=user_id,
+            startHistoryId=start_history_id,
+            historyTypes=['messageAdded'],
+            labelId='INBOX',
+            maxResults=LIST_PAGE_SIZE,
+            pageToken=page_token
+        ), 'history.list')
+        for record in response.get('history', []):
+            for added in record.get('messagesAdded', []):
+                msg = added['message']
+                if msg['id'] not in seen and 'INBOX' in msg.get('labelIds', ['INBOX']):
+                    seen.add(msg['id'])
+                    messages.append(msg)
+        latest_history_id = response.get('historyId', latest_history_id)
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    return messages, latest_history_id
+
+@metrics.timed('poll_seconds', kind='new_repliers')
+def get_new_repliers(service, checkpoint_path=CHECKPOINT_PATH, query="in:inbox newer_than:2d", scheduler=None):
+    """Return senders of inbox messages that arrived since the last call.
+
+    Uses the Gmail history API from the persisted historyId checkpoint. If
+    there is no checkpoint, or it has expired, falls back to a scan of at
+    most FULL_SCAN_LIMIT messages matching `query`.
+    """
+    scheduler = scheduler or get_default_scheduler()
+    history_id = load_checkpoint(checkpoint_path)
+    message_ids = None
+    if history_id is not None:
+        try:
+            message_ids, history_id = list_added_message_ids(service, history_id, scheduler=scheduler)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            print("⚠️ Reply checkpoint expired, falling back to a full inbox scan.")
+
+    if message_ids is None:
+        # Read the current historyId before scanning so nothing arriving mid-scan is skipped
+        history_id = scheduler.execute(service.users().getProfile(userId='me'), 'getProfile')['historyId']
+        message_ids = list(islice(list_message_ids(service, query, scheduler=scheduler), FULL_SCAN_LIMIT))
+
     repliers = set()
+    for msg_data in fetch_metadata(service, message_ids, scheduler=scheduler).values():
+        email = parse_sender(msg_data)
+        if email:
+            repliers.add(email)
 
-    for msg in messages:
-        msg_data = service.users().messages().get(userId='me', id=msg['id'], format='metadata', metadataHeaders=['From']).execute()
-        headers = msg_data['payload']['headers']
-        for h in headers:
-            if h['name'] == 'From':
-                email = h['value']
-                if '<' in email:
-                    email = email.split('<')[1].strip('>')
-                repliers.add(email.lower())
+    save_checkpoint(history_id, checkpoint_path)
     return repliers
 
+
+@metrics.timed('poll_seconds', kind='recent')
+def get_recent_repliers(service, query="in:inbox newer_than:2d", scheduler=None):
+    message_ids = list_message_ids(service, query, scheduler=scheduler)
+    repliers = set()
+
+    for msg_data in fetch_metadata(service, message_ids, scheduler=scheduler).values():
+        email = parse_sender(msg_data)
+        if email:
+            repliers.add(email)
+    return repliers
+
+def backfill_message_ids(service, journal, index=None, senders=(None,), limit=BACKFILL_LIMIT, scheduler=None):
+    """Fetch the Message-ID header of up to `limit` sent messages that lack one and store it in the journal.
+
+    Gmail's send response carries the threadId but not the Message-ID, so
+    it is read afterwards with batched metadata calls (5 units each).
+    """
+    missing = journal.missing_rfc_message_ids(senders, limit)
+    if not missing:
+        return 0
+    metadata = fetch_metadata(service, [message_id for message_id, _ in missing], metadata_headers=('Message-ID',),
+                              scheduler=scheduler)
+    pairs = [(message_id, parse_header(metadata[message_id], 'Message-ID') if message_id in metadata else '')
+             for message_id, _ in missing]
+    journal.set_rfc_message_ids(pairs)
+    if index is not None:
+        emails = dict(missing)
+        index.add_message_ids((rfc_id, emails[message_id]) for message_id, rfc_id in pairs)
+    return len(pairs)
+
+@metrics.timed('poll_seconds', kind='campaign')
+def get_campaign_replies(service, index, checkpoint_path=CHECKPOINT_PATH, query="in:inbox newer_than:2d",
+                         scheduler=None, journal=None, senders=(None,), own_address=None):
+    """Return the campaign recipients who replied since the last call.
+
+    New inbox messages come from the history API (or a bounded scan, as in
+    get_new_repliers) together with their threadId. Only messages in a
+    thread started by one of our sends are fetched, and each is matched to
+    its recipient by In-Reply-To/References, then by thread, through
+    `index` (a reply_index.ReplyIndex). A contact replying from another
+    address is therefore still credited, and mail from a contact outside
+    a campaign thread is not. Bounces, auto-replies and mail from the
+    mailbox's own address (`own_address`, read from the profile when not
+    given) are not replies. With `journal`, Message-IDs of recent sends
+    by `senders` are backfilled first.
+    """
+    scheduler = scheduler or get_default_scheduler()
+    if own_address is None:
+        own_address = scheduler.execute(service.users().getProfile(userId='me'), 'getProfile')['emailAddress']
+    own_addresses = (own_address.lower(),)
+    index.refresh()
+    if journal is not None:
+        backfill_message_ids(service, journal, index, senders=senders, scheduler=scheduler)
+
+    history_id = load_checkpoint(checkpoint_path)
+    messages = None
+    if history_id is not None:
+        try:
+            messages, history_id = list_added_messages(service, history_id, scheduler=scheduler)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            print("⚠️ Reply checkpoint expired, falling back to a full inbox scan.")
+
+    if messages is None:
+        history_id = scheduler.execute(service.users().getProfile(userId='me'), 'getProfile')['historyId']
+        messages = list(islice(list_messages(service, query, scheduler=scheduler), FULL_SCAN_LIMIT))
+
+    threads = {msg['id']: msg['threadId'] for msg in messages if index.is_known_thread(msg.get('threadId'))}
+    metadata = fetch_metadata(service, list(threads), metadata_headers=REPLY_HEADERS, scheduler=scheduler)
+    replied = set()
+    for msg_id, msg_data in metadata.items():
+        if is_automated(parse_sender(msg_data), parse_header(msg_data, 'Auto-Submitted'),
+                        parse_header(msg_data, 'Precedence'), own_addresses):
+            continue
+        email = index.match(threads[msg_id], parse_header(msg_data, 'In-Reply-To'), parse_header(msg_data, 'References'))
+        if email:
+            replied.add(email)
+
+    save_checkpoint(history_id, checkpoint_path)
+    return replied
+
 # def remove_responders_from_csv(csv_path, repliers):
 #     df = pd.read_csv(csv_path)
 #     initial_count = len(df)
@@ -49,40 +282,62 @@ def get_recent_repliers(service):
 #     df.to_csv(csv_path, index=False)
 #     print(f"✅ Removed {initial_count - len(df)} replied influencers. CSV updated.")
 
-import pandas as pd
+@metrics.timed('csv_update_seconds', op='remove_responders')
+def remove_responders_from_csv(csv_path, repliers, responded_path='responded.csv', chunksize=DEFAULT_CHUNKSIZE):
+    import pandas as pd
+    repliers = set(repliers)
+    already_responded = read_emails(responded_path)
+    responded_columns = read_columns(responded_path) if os.path.exists(responded_path) else None
 
-def remove_responders_from_csv(csv_path, repliers, responded_path='responded.csv'):
-    df = pd.read_csv(csv_path)
+    # Stream the contact list chunk by chunk into a temporary file, moving the replied rows out
+    tmp_path = csv_path + '.tmp'
+    columns = read_columns(csv_path)
+    pd.DataFrame(columns=columns).to_csv(tmp_path, index=False)
+    moved = 0
+    for chunk in iter_contact_chunks(csv_path, columns=None, chunksize=chunksize):
+        mask = chunk['email'].isin(repliers)
+        responded_df = chunk[mask & ~chunk['email'].isin(already_responded)].drop_duplicates(subset=['email'])
+        remaining_df = chunk[~mask]
 
-    # Filter the rows that match the repliers
-    mask = df['email'].isin(repliers)
-    responded_df = df[mask]
-    remaining_df = df[~mask]
+        if len(responded_df):
+            # Append the replied ones to responded.csv, keeping its existing column layout
+            if responded_columns is None:
+                responded_columns = columns
+                responded_df.to_csv(responded_path, index=False)
+            else:
+                responded_df.reindex(columns=responded_columns).to_csv(responded_path, mode='a', header=False, index=False)
+            already_responded.update(responded_df['email'])
+            moved += len(responded_df)
 
-    # Save the replied ones to responded.csv (append if file exists)
-    try:
-        existing_responded = pd.read_csv(responded_path)
-        responded_df = pd.concat([existing_responded, responded_df], ignore_index=True).drop_duplicates(subset=['email'])
-    except FileNotFoundError:
-        pass  # File doesn't exist yet, will be created fresh
+        remaining_df.to_csv(tmp_path, mode='a', header=False, index=False)
 
-    responded_df.to_csv(responded_path, index=False)
-    remaining_df.to_csv(csv_path, index=False)
+    os.replace(tmp_path, csv_path)
 
-    print(f"✅ Moved {len(responded_df)} replied influencers to '{responded_path}' and updated '{csv_path}'.")
+    print(f"✅ Moved {moved} replied influencers to '{responded_path}' and updated '{csv_path}'.")
 
 
-def main():
-    creds = gmail_authenticate()
-    service = build('gmail', 'v1', credentials=creds)
+def main(csv_path='influencer.csv'):
+    from journal import SendJournal
+    from reply_index import ReplyIndex
+    from sender_pool import load_sender_pool
+    metrics.start_exporters()
+    pool = load_sender_pool()
 
-    csv_path = 'influencer.csv'
-    repliers = get_recent_repliers(service)
+    store = ContactStore()
+    with SendJournal() as journal:
+        repliers = pool.get_campaign_replies(ReplyIndex(), journal=journal)
+    newly_responded = []
     if repliers:
-        print(f"📩 Found replies from: {repliers}")
-        remove_responders_from_csv(csv_path, repliers)
+        # Sync with the CSV first (skipped when it is unchanged since the last export),
+        # so rows added or deleted since the last run survive the export below
+        store.import_csv(csv_path)
+        newly_responded = store.mark_responded(csv_path, repliers)
+    if newly_responded:
+        print(f"📩 Found replies from: {[email for _, email in newly_responded]}")
+        append_responded_csv(newly_responded)
+        store.export_csv(csv_path, csv_path)
     else:
-        print("ℹ️ No replies detected in the last 2 days.")
+        print("ℹ️ No new replies since the last check.")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,125 @@
+"""Single entry point for a campaign.
+
+    python cli.py suggest            # Groq suggestions for a subject and message, saved to final_selection.json
+    python cli.py send               # send the selected subject and message to everyone in influencer.csv
+    python cli.py track              # track replies until Ctrl+C (adaptive polling, or push with GMAIL_PUSH_TOPIC)
+    python cli.py track --once       # one reply check, e.g. from cron
+    python cli.py status             # sent/failed and pending/responded counts, without contacting Gmail
+
+Only the standard library is imported up front. Each command imports the
+modules it needs when it runs, and the Gmail and Groq clients are created
+on first use, so `status` never loads pandas, groq or the Google client
+libraries and `track --once` loads only what a poll needs.
+"""
+import argparse
+import json
+import os
+import sys
+
+CSV_PATH = 'influencer.csv'
+SELECTION_PATH = 'final_selection.json'
+
+
+def load_selection(selection_path):
+    """Return (subject, message) from the selection file, or None if it does not exist yet."""
+    if not os.path.exists(selection_path):
+        return None
+    with open(selection_path) as f:
+        selected = json.load(f)
+    return selected["selected_subject"], selected["selected_message"]
+
+
+def suggest(args):
+    from sugestion import main as suggest_main
+    suggest_main(args.selection)
+
+
+def send(args):
+    from send_mail import main as send_main
+    send_main(args.csv, args.selection)
+    print("✅ All initial emails sent.")
+
+
+def track(args):
+    if args.once:
+        from check_reply import main as check_main
+        check_main(args.csv)
+        return
+
+    import metrics
+    from contact_store import ContactStore
+    from poll_scheduler import ReplyTracker
+    from sender_pool import load_sender_pool
+    metrics.start_exporters()
+
+    print("\n🚀 Starting live tracking of replies... (Press Ctrl+C to stop)\n")
+    # Authenticate every sender account once (senders.json, or token.json alone)
+    pool = load_sender_pool()
+    # Replies are recorded in the indexed contact store; the CSV is rewritten once on exit
+    store = ContactStore()
+    # Polls soon after sends and less often while no replies come, or waits for
+    # Gmail push notifications when GMAIL_PUSH_TOPIC is set
+    tracker = ReplyTracker(pool, store, [args.csv])
+    try:
+        tracker.run()
+    except KeyboardInterrupt:
+        print("\n🛑 Live tracking stopped by user.")
+    finally:
+        tracker.close()
+        tracker.export()
+
+
+def status(args):
+    from contact_store import STORE_PATH, ContactStore
+    from journal import JOURNAL_PATH, SendJournal, campaign_key
+
+    selection = load_selection(args.selection)
+    if selection is None:
+        print(f"ℹ️ No campaign selected yet (`{args.selection}` not found); run `python cli.py suggest`.")
+    elif not os.path.exists(JOURNAL_PATH):
+        print("ℹ️ Nothing sent yet.")
+    else:
+        campaign_id = campaign_key(args.csv, *selection)
+        with SendJournal(campaign_id=campaign_id) as journal:
+            counts = journal.counts()
+        print(f"📧 Campaign {campaign_id}: {counts['sent']} sent, {counts['failed']} failed attempts")
+
+    if not os.path.exists(STORE_PATH):
+        print("ℹ️ No replies tracked yet.")
+        return
+    store = ContactStore()
+    try:
+        counts = store.counts(args.csv)
+    finally:
+        store.close()
+    if not counts['pending'] and not counts['responded']:
+        print(f"ℹ️ No replies tracked yet for `{args.csv}`.")
+    else:
+        print(f"📩 {counts['responded']} responded, {counts['pending']} pending in `{args.csv}`")
+
+
+COMMANDS = {
+    'suggest': suggest,
+    'send': send,
+    'track': track,
+    'status': status,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=list(COMMANDS))
+    parser.add_argument('--csv', default=CSV_PATH, help='contact list (default: %(default)s)')
+    parser.add_argument('--selection', default=SELECTION_PATH,
+                        help='chosen subject and message (default: %(default)s)')
+    parser.add_argument('--once', action='store_true', help='track: check for replies once and exit')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    COMMANDS[args.command](args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
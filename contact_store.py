@@ -0,0 +1,206 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from contacts import DEFAULT_CHUNKSIZE, iter_contact_chunks
+
+STORE_PATH = 'contacts.db'
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class ContactStore:
+    """SQLite-backed contact and reply state, indexed by normalized email.
+
+    Each CSV is imported as a named list; marking responders is one
+    set-based join instead of a rewrite of the CSV files. The CSV stays
+    the source of truth for who is pending: re-importing it before
+    export_csv() keeps rows added to it and drops rows deleted from it,
+    while responded contacts (which export_csv() moves out of the CSV)
+    keep their state. A CSV whose path, size and mtime match its last
+    import or export is not read again. Per-list counts are read
+    once and then kept in memory, in step with this store's own imports
+    and marks.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        # One import per list at a time; imports of different lists may interleave
+        self._import_locks = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS contacts (
+                list_name TEXT NOT NULL,
+                email_norm TEXT NOT NULL,
+                email TEXT NOT NULL,
+                influencer_name TEXT,
+                fields TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                responded_at REAL,
+                PRIMARY KEY (list_name, email_norm)
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS contacts_status ON contacts (list_name, status)')
+        # The CSV each list was last imported from or exported to, to skip re-reading an unchanged file
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS sources (
+                list_name TEXT PRIMARY KEY,
+                csv_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            )
+        ''')
+        # Repliers of one mark_responded() call, joined against the list in a single statement
+        self._conn.execute('CREATE TEMP TABLE IF NOT EXISTS responders (email_norm TEXT PRIMARY KEY)')
+        # Emails seen by a running import_csv(), per list, to drop pending contacts no longer in the CSV
+        self._conn.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS imported (list_name TEXT NOT NULL, email_norm TEXT NOT NULL, '
+            'PRIMARY KEY (list_name, email_norm))'
+        )
+        self._conn.commit()
+        self._counts = {}
+
+    @metrics.timed('store_update_seconds', op='import')
+    def import_csv(self, csv_path, list_name=None, chunksize=DEFAULT_CHUNKSIZE):
+        """Make the list match the CSV and return the number of contacts added.
+
+        New rows are added as pending, pending contacts missing from the CSV
+        are removed, and known contacts keep their state. A file unchanged
+        since it was last imported or exported is not read, and 0 is returned.
+        """
+        list_name = list_name or csv_path
+        with self._lock:
+            import_lock = self._import_locks.setdefault(list_name, threading.Lock())
+        with import_lock:
+            source = _file_source(csv_path)
+            if source == self._source(list_name):
+                return 0
+            added = self._import_csv(csv_path, list_name, chunksize)
+            self._set_source(list_name, source)
+            return added
+
+    def _source(self, list_name):
+        with self._lock:
+            return self._conn.execute('SELECT csv_path, size, mtime_ns FROM sources WHERE list_name = ?',
+                                      (list_name,)).fetchone()
+
+    def _set_source(self, list_name, source):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO sources (list_name, csv_path, size, mtime_ns) '
+                               'VALUES (?, ?, ?, ?)', (list_name, *source))
+
+    def _import_csv(self, csv_path, list_name, chunksize):
+        added = 0
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM imported WHERE list_name = ?', (list_name,))
+        for chunk in iter_contact_chunks(csv_path, columns=None, chunksize=chunksize):
+            # The full row is kept so export_csv() can reproduce every column
+            rows = [(list_name, normalize_email(record['email']), record['email'],
+                     record.get('influencer_name'), json.dumps(record))
+                    for record in chunk.to_dict('records')]
+            with self._lock, self._conn:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO contacts (list_name, email_norm, email, influencer_name, fields) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    rows
+                )
+                changes = self._conn.total_changes - before
+                self._conn.executemany('INSERT OR IGNORE INTO imported (list_name, email_norm) VALUES (?, ?)',
+                                       ((list_name, row[1]) for row in rows))
+                added += changes
+                if list_name in self._counts:
+                    self._counts[list_name]['pending'] += changes
+        with self._lock, self._conn:
+            removed = self._conn.execute(
+                "DELETE FROM contacts WHERE list_name = ? AND +status = 'pending' "
+                "AND email_norm NOT IN (SELECT email_norm FROM imported WHERE list_name = ?)",
+                (list_name, list_name)
+            ).rowcount
+            self._conn.execute('DELETE FROM imported WHERE list_name = ?', (list_name,))
+            if list_name in self._counts:
+                self._counts[list_name]['pending'] -= removed
+        return added
+
+    @metrics.timed('store_update_seconds', op='mark_responded')
+    def mark_responded(self, list_name, emails):
+        """Mark pending contacts as responded and return [(influencer_name, email)] of the newly marked."""
+        keys = {normalize_email(email) for email in emails}
+        if not keys:
+            return []
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM responders')
+            self._conn.executemany('INSERT INTO responders (email_norm) VALUES (?)', ((key,) for key in keys))
+            # CROSS JOIN and +status keep SQLite on the primary key: one lookup per replier,
+            # not a scan of every pending contact through contacts_status
+            marked = self._conn.execute(
+                "SELECT c.influencer_name, c.email FROM responders r CROSS JOIN contacts c "
+                "ON c.list_name = ? AND c.email_norm = r.email_norm WHERE +c.status = 'pending'",
+                (list_name,)
+            ).fetchall()
+            if marked:
+                self._conn.execute(
+                    "UPDATE contacts SET status = 'responded', responded_at = ? WHERE list_name = ? "
+                    "AND +status = 'pending' AND email_norm IN (SELECT email_norm FROM responders)",
+                    (time.time(), list_name)
+                )
+                if list_name in self._counts:
+                    self._counts[list_name]['pending'] -= len(marked)
+                    self._counts[list_name]['responded'] += len(marked)
+            self._conn.execute('DELETE FROM responders')
+        metrics.count('replies_marked_total', len(marked))
+        return marked
+
+    def counts(self, list_name):
+        """Return {'pending': n, 'responded': n} for the list."""
+        with self._lock:
+            if list_name not in self._counts:
+                rows = self._conn.execute(
+                    'SELECT status, COUNT(*) FROM contacts WHERE list_name = ? GROUP BY status', (list_name,)
+                ).fetchall()
+                counts = {'pending': 0, 'responded': 0}
+                counts.update(dict(rows))
+                self._counts[list_name] = counts
+            return dict(self._counts[list_name])
+
+    @metrics.timed('store_update_seconds', op='export')
+    def export_csv(self, list_name, csv_path, status='pending'):
+        """Write the contacts with the given status back to a CSV with their original columns."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT fields FROM contacts WHERE list_name = ? AND status = ? ORDER BY rowid',
+                (list_name, status)
+            ).fetchall()
+        records = [json.loads(row[0]) for row in rows]
+        columns = list(records[0]) if records else ['influencer_name', 'email']
+        import pandas as pd
+        tmp_path = csv_path + '.tmp'
+        pd.DataFrame(records, columns=columns).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, csv_path)
+        if status == 'pending':
+            # The file now holds exactly the list's pending contacts, so the next import can skip it
+            self._set_source(list_name, _file_source(csv_path))
+
+    def close(self):
+        self._conn.close()
+
+
+def _file_source(path):
+    stat = os.stat(path)
+    return (path, stat.st_size, stat.st_mtime_ns)
+
+
+def append_responded_csv(rows, responded_path='responded.csv'):
+    """Append (influencer_name, email) rows to the responded CSV, creating it with a header if needed."""
+    import pandas as pd
+    new_file = not os.path.exists(responded_path) or os.path.getsize(responded_path) == 0
+    pd.DataFrame(rows, columns=['influencer_name', 'email']).to_csv(
+        responded_path, mode='a', header=new_file, index=False
+    )
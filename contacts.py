@@ -0,0 +1,41 @@
+import os
+
+# pandas is imported inside the functions that read CSVs, so importing this module stays cheap (cli.py)
+CONTACT_COLUMNS = ['influencer_name', 'email']
+# Rows parsed per chunk; memory use is bounded by this rather than by the file size
+DEFAULT_CHUNKSIZE = 10000
+
+
+def iter_contact_chunks(csv_path, columns=CONTACT_COLUMNS, chunksize=DEFAULT_CHUNKSIZE):
+    """Yield the contact CSV as DataFrame chunks holding only `columns` (all columns if None)."""
+    import pandas as pd
+    reader = pd.read_csv(csv_path, usecols=columns, dtype=str, keep_default_na=False, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            yield chunk
+
+def read_columns(csv_path):
+    """Return the header of a CSV without reading any rows."""
+    import pandas as pd
+    return pd.read_csv(csv_path, nrows=0).columns.tolist()
+
+def count_contacts(csv_path, chunksize=DEFAULT_CHUNKSIZE):
+    total = 0
+    # Parse only the first column so any CSV layout can be counted
+    for chunk in iter_contact_chunks(csv_path, columns=[0], chunksize=chunksize):
+        total += len(chunk)
+    return total
+
+def preview_contacts(csv_path, n=3):
+    """Return the first n rows as a DataFrame."""
+    import pandas as pd
+    return pd.read_csv(csv_path, nrows=n, dtype=str, keep_default_na=False)
+
+def read_emails(csv_path, chunksize=DEFAULT_CHUNKSIZE):
+    """Return the set of emails in a CSV, or an empty set if it does not exist."""
+    if not os.path.exists(csv_path):
+        return set()
+    emails = set()
+    for chunk in iter_contact_chunks(csv_path, columns=['email'], chunksize=chunksize):
+        emails.update(chunk['email'])
+    return emails
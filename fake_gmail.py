@@ -0,0 +1,400 @@
+"""In-memory stand-in for the Gmail discovery service and REST API, used by benchmark.py."""
+import base64
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+def make_http_error(status, reason):
+    resp = httplib2.Response({'status': status})
+    content = json.dumps({'error': {'code': status, 'errors': [{'reason': reason}]}}).encode()
+    return HttpError(resp, content)
+
+
+def post_notification(endpoint, email_address, history_id, subscription='projects/fake/subscriptions/gmail'):
+    """POST a Gmail change notification to a push endpoint the way a Pub/Sub push subscription does."""
+    data = json.dumps({'emailAddress': email_address, 'historyId': int(history_id)}).encode()
+    envelope = {
+        'message': {'data': base64.b64encode(data).decode(), 'messageId': uuid.uuid4().hex,
+                    'publishTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())},
+        'subscription': subscription,
+    }
+    request = urllib.request.Request(endpoint, data=json.dumps(envelope).encode(),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return response.status
+
+
+class FakeRequest:
+    def __init__(self, service, method, handler):
+        self.service = service
+        self.method = method
+        self.handler = handler
+
+    def execute(self, http=None, num_retries=0):
+        self.service.simulate_http_call(self.method)
+        return self.handler()
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None, callback=None):
+        if request_id is None:
+            request_id = str(len(self.requests))
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self, http=None):
+        # A batch is a single HTTP round-trip, but every inner call is billed
+        self.service.simulate_http_call('batch')
+        for request_id, request, callback in self.requests:
+            self.service.count_call(request.method)
+            try:
+                response, exception = request.handler(), None
+            except HttpError as e:
+                response, exception = None, e
+            if callback is not None:
+                callback(request_id, response, exception)
+
+
+class _Messages:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None, **kwargs):
+        def handler():
+            start = int(pageToken or 0)
+            page = self.service.inbox[start:start + maxResults]
+            response = {'messages': [{'id': m['id'], 'threadId': m['threadId']} for m in page],
+                        'resultSizeEstimate': len(page)}
+            if start + maxResults < len(self.service.inbox):
+                response['nextPageToken'] = str(start + maxResults)
+            return response
+        return FakeRequest(self.service, 'messages.list', handler)
+
+    def get(self, userId, id, format='full', metadataHeaders=None, **kwargs):
+        def handler():
+            msg = self.service.messages_by_id[id]
+            headers = [h for h in msg['headers'] if not metadataHeaders or h['name'] in metadataHeaders]
+            return {'id': msg['id'], 'threadId': msg['threadId'], 'payload': {'headers': headers}}
+        return FakeRequest(self.service, 'messages.get', handler)
+
+    def send(self, userId, body):
+        def handler():
+            return self.service.record_sent(body)
+        return FakeRequest(self.service, 'messages.send', handler)
+
+
+class _History:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, startHistoryId, historyTypes=None, labelId=None, maxResults=100, pageToken=None, **kwargs):
+        def handler():
+            start = int(startHistoryId)
+            if start < self.service.oldest_history_id:
+                raise make_http_error(404, 'notFound')
+            records = [r for r in self.service.history if r['id'] > start]
+            offset = int(pageToken or 0)
+            page = records[offset:offset + maxResults]
+            response = {
+                'history': [{'id': str(r['id']), 'messagesAdded': [{'message': r['message']}]} for r in page],
+                'historyId': str(self.service.history_id),
+            }
+            if offset + maxResults < len(records):
+                response['nextPageToken'] = str(offset + maxResults)
+            return response
+        return FakeRequest(self.service, 'history.list', handler)
+
+
+class _Users:
+    def __init__(self, service):
+        self.service = service
+
+    def messages(self):
+        return _Messages(self.service)
+
+    def history(self):
+        return _History(self.service)
+
+    def watch(self, userId, body):
+        def handler():
+            self.service.watch_topic = body['topicName']
+            return {'historyId': str(self.service.history_id),
+                    'expiration': str(int((time.time() + 7 * 24 * 3600) * 1000))}
+        return FakeRequest(self.service, 'watch', handler)
+
+    def stop(self, userId):
+        def handler():
+            self.service.watch_topic = None
+            return {}
+        return FakeRequest(self.service, 'stop', handler)
+
+    def getProfile(self, userId):
+        def handler():
+            return {'emailAddress': self.service.email_address, 'historyId': str(self.service.history_id)}
+        return FakeRequest(self.service, 'getProfile', handler)
+
+
+class FakeGmailService:
+    """Deterministic fake of the googleapiclient Gmail service.
+
+    Every HTTP round-trip sleeps `latency` seconds, plus up to `jitter`
+    more drawn from the seeded generator, and fails with a 429
+    `rateLimitExceeded` error with probability `error_rate`.
+    """
+
+    def __init__(self, inbox_size=0, latency=0.0, error_rate=0.0, seed=0, senders=None, email_address='me@example.com',
+                 jitter=0.0):
+        self.email_address = email_address
+        # Set by users.watch; with push_endpoint set, new inbox messages are announced there
+        self.watch_topic = None
+        self.push_endpoint = None
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.http_calls = 0
+        self.calls = {}
+        self.sent = []
+        self.inbox = []
+        self.messages_by_id = {}
+        self.history = []
+        self.history_id = 1
+        self.oldest_history_id = 1
+        senders = senders or [f'contact{i}@example.com' for i in range(max(1, inbox_size))]
+        for i in range(inbox_size):
+            self.add_inbox_message(senders[i % len(senders)])
+
+    def add_inbox_message(self, sender, name='Contact', thread_id=None, in_reply_to=None, headers=None):
+        """Deliver a message to the inbox; pass a sent message's thread_id/Message-ID to make it a reply.
+
+        `headers` is a dict of extra headers, e.g. {'Auto-Submitted': 'auto-replied'}.
+        """
+        if in_reply_to and thread_id is None:
+            # Like Gmail, file a reply in the thread of the message it references
+            thread_id = next((m['threadId'] for m in self.messages_by_id.values()
+                              if any(h['value'] == in_reply_to for h in m['headers'] if h['name'] == 'Message-ID')),
+                             None)
+        msg_id = f'msg{len(self.inbox):08d}'
+        msg = {
+            'id': msg_id,
+            'threadId': thread_id or f'thr{len(self.inbox):08d}',
+            'headers': [{'name': 'From', 'value': f'{name} <{sender}>'}],
+        }
+        if in_reply_to:
+            msg['headers'] += [{'name': 'In-Reply-To', 'value': in_reply_to},
+                               {'name': 'References', 'value': in_reply_to}]
+        if headers:
+            msg['headers'] += [{'name': key, 'value': value} for key, value in headers.items()]
+        self.inbox.append(msg)
+        self.messages_by_id[msg_id] = msg
+        self.history_id += 1
+        self.history.append({
+            'id': self.history_id,
+            'message': {'id': msg_id, 'threadId': msg['threadId'], 'labelIds': ['INBOX']},
+        })
+        if self.watch_topic and self.push_endpoint:
+            post_notification(self.push_endpoint, self.email_address, self.history_id)
+        return msg
+
+    def expire_history(self):
+        """Make every historyId issued so far too old, as Gmail does after about a week."""
+        self.oldest_history_id = self.history_id + 1
+
+    def count_call(self, method):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+    def simulate_http_call(self, method):
+        with self.lock:
+            self.http_calls += 1
+            fail = self.error_rate and self.random.random() < self.error_rate
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if method != 'batch':
+            self.count_call(method)
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise make_http_error(429, 'rateLimitExceeded')
+
+    def record_sent(self, body):
+        with self.lock:
+            msg_id = f'sent{len(self.sent):08d}'
+            self.sent.append(body)
+            # Sent messages start their own thread and can be read back like Gmail's SENT label
+            self.messages_by_id[msg_id] = {
+                'id': msg_id,
+                'threadId': msg_id,
+                'headers': [{'name': 'Message-ID', 'value': f'<{msg_id}@mail.example.com>'}],
+            }
+        return {'id': msg_id, 'threadId': msg_id, 'labelIds': ['SENT']}
+
+    def users(self):
+        return _Users(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+
+class _GmailRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send each response in one segment so keep-alive clients are not stalled by Nagle
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+    routes = [
+        ('POST', re.compile(r'/gmail/v1/users/[^/]+/messages/send$'), 'send'),
+        ('GET', re.compile(r'/gmail/v1/users/[^/]+/messages$'), 'list'),
+        ('GET', re.compile(r'/gmail/v1/users/[^/]+/messages/(?P<id>[^/]+)$'), 'get'),
+        ('GET', re.compile(r'/gmail/v1/users/[^/]+/history$'), 'history'),
+        ('GET', re.compile(r'/gmail/v1/users/[^/]+/profile$'), 'profile'),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, content_type='application/json'):
+        data = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _request(self, method, target, body):
+        """Map one REST call onto the FakeGmailService and return its FakeRequest."""
+        url = urlsplit(target)
+        params = {k: v if len(v) > 1 else v[0] for k, v in parse_qs(url.query).items()}
+        params.pop('alt', None)
+        users = self.server.service.users()
+        for route_method, pattern, name in self.routes:
+            match = pattern.match(url.path)
+            if route_method != method or not match:
+                continue
+            if name == 'send':
+                return users.messages().send(userId='me', body=json.loads(body or b'{}'))
+            if name == 'list':
+                return users.messages().list(
+                    userId='me', q=params.get('q'), maxResults=int(params.get('maxResults', 100)),
+                    pageToken=params.get('pageToken')
+                )
+            if name == 'get':
+                headers = params.get('metadataHeaders')
+                if isinstance(headers, str):
+                    headers = [headers]
+                return users.messages().get(userId='me', id=match.group('id'), format=params.get('format'),
+                                            metadataHeaders=headers)
+            if name == 'history':
+                return users.history().list(
+                    userId='me', startHistoryId=params['startHistoryId'],
+                    maxResults=int(params.get('maxResults', 100)), pageToken=params.get('pageToken')
+                )
+            return users.getProfile(userId='me')
+        return None
+
+    def _call(self, request, batched):
+        """Run a FakeRequest and return (status, json_text)."""
+        try:
+            if batched:
+                self.server.service.count_call(request.method)
+                result = request.handler()
+            else:
+                result = request.execute()
+            return 200, json.dumps(result)
+        except HttpError as e:
+            return e.resp.status, e.content.decode()
+
+    def _handle(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if method == 'POST' and self.path.startswith('/batch'):
+            return self._handle_batch(body)
+        request = self._request(method, self.path, body)
+        if request is None:
+            return self._reply(404, json.dumps({'error': {'code': 404, 'message': 'Not found'}}))
+        self._reply(*self._call(request, batched=False))
+
+    def _handle_batch(self, body):
+        boundary = self.headers['Content-Type'].split('boundary=', 1)[1].strip('"')
+        try:
+            self.server.service.simulate_http_call('batch')
+        except HttpError as e:
+            return self._reply(e.resp.status, e.content)
+        out_boundary = f'batch_{uuid.uuid4().hex}'
+        parts = []
+        for part in body.decode().split(f'--{boundary}'):
+            part = part.strip('\r\n')
+            if not part or part == '--':
+                continue
+            outer, _, inner = part.replace('\r\n', '\n').partition('\n\n')
+            content_id = re.search(r'Content-ID:\s*<([^>]*)>', outer, re.I)
+            content_id = content_id.group(1) if content_id else ''
+            request_line, _, inner_body = inner.partition('\n\n')
+            method, target = request_line.split('\n')[0].split()[:2]
+            request = self._request(method, target, inner_body.encode())
+            status, payload = self._call(request, batched=True) if request else (404, '{}')
+            parts.append(
+                f'--{out_boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n'
+                f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\nContent-Type: application/json\r\n\r\n'
+                f'{payload}\r\n'
+            )
+        parts.append(f'--{out_boundary}--\r\n')
+        self._reply(200, ''.join(parts), content_type=f'multipart/mixed; boundary={out_boundary}')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class _FakeHTTPServer(ThreadingHTTPServer):
+    # A deep accept backlog, so a burst of new pooled connections is not dropped
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class FakeGmailServer:
+    """Local HTTP server exposing a FakeGmailService through the Gmail REST paths.
+
+    Use it as a context manager; `url` is the base URL to hand to
+    async_gmail.AsyncGmailClient or to googleapiclient via api_endpoint.
+    """
+
+    def __init__(self, service=None, host='127.0.0.1', port=0):
+        self.service = service or FakeGmailService()
+        self._server = _FakeHTTPServer((host, port), _GmailRequestHandler)
+        self._server.service = self.service
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,142 @@
+"""Local mock of Groq's OpenAI-compatible chat completion endpoint, used by benchmark.py."""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler
+
+from fake_gmail import _FakeHTTPServer
+
+COMPLETIONS_PATH = '/openai/v1/chat/completions'
+RECIPIENTS_RE = re.compile(r'Recipients:\n(?P<records>\[.*\])\n\nRespond', re.DOTALL)
+
+
+class FakeCompletionServer:
+    """Answers chat completions the way the prompts in sugestion.py and personalize.py expect.
+
+    A personalization prompt gets one draft per recipient listed in it;
+    any other prompt gets five subject and message suggestions. `latency`
+    delays each response, `error_rate` answers a share of calls with 429
+    or 500, `malformed_rate` truncates a share of responses and
+    `drop_rate` leaves one recipient out of a share of responses. Both
+    plain and streamed (SSE) responses are supported. Point a groq client
+    at it with base_url=server.url.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, malformed_rate=0.0, drop_rate=0.0, seed=0,
+                 host='127.0.0.1', port=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.drop_rate = drop_rate
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _FakeHTTPServer((host, port), _CompletionHandler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _roll(self, rate):
+        with self._lock:
+            return self._random.random() < rate
+
+    def complete(self, prompt):
+        """Return (status, content) for one prompt."""
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self._roll(self.error_rate):
+            with self._lock:
+                self.errors += 1
+            return (429 if self._roll(0.5) else 500), ''
+
+        match = RECIPIENTS_RE.search(prompt)
+        if match:
+            records = json.loads(match.group('records'))
+            if len(records) > 1 and self._roll(self.drop_rate):
+                records = records[1:]
+            data = {'drafts': [
+                {'email': record['email'],
+                 'subject': f"An idea for {record.get('influencer_name', record['email'])}",
+                 'message': f"Hi {record.get('influencer_name', '')}, " + ', '.join(
+                     f'{key}: {value}' for key, value in record.items() if key != 'email')}
+                for record in records
+            ]}
+        else:
+            data = {'subject_suggestions': [f'Subject option {i}' for i in range(1, 6)],
+                    'message_suggestions': [f'Hi {{{{influencer_name}}}}, message option {i}' for i in range(1, 6)]}
+        content = 'Here is the JSON:\n' + json.dumps(data)
+        if self._roll(self.malformed_rate):
+            content = content[:len(content) // 2]
+        return 200, content
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _CompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, content_type='application/json'):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path.split('?')[0] != COMPLETIONS_PATH:
+            self._reply(404, json.dumps({'error': {'message': 'not found'}}))
+            return
+        prompt = ''.join(m.get('content', '') for m in body.get('messages', []))
+        status, content = self.server.fake.complete(prompt)
+        if status != 200:
+            self._reply(status, json.dumps({'error': {'message': 'fake failure', 'type': 'server_error'}}))
+            return
+
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        base = {'id': completion_id, 'created': int(time.time()), 'model': body.get('model', 'fake')}
+        if body.get('stream'):
+            events = []
+            for i in range(0, len(content), 16):
+                delta = {'content': content[i:i + 16]}
+                events.append(dict(base, object='chat.completion.chunk',
+                                   choices=[{'index': 0, 'delta': delta, 'finish_reason': None}]))
+            events.append(dict(base, object='chat.completion.chunk',
+                               choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]))
+            stream = ''.join(f'data: {json.dumps(event)}\n\n' for event in events) + 'data: [DONE]\n\n'
+            self._reply(200, stream, content_type='text/event-stream')
+            return
+        self._reply(200, json.dumps(dict(
+            base, object='chat.completion',
+            choices=[{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            usage={'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4,
+                   'total_tokens': (len(prompt) + len(content)) // 4}
+        )))
@@ -0,0 +1,134 @@
+"""Shared Gmail credentials and service factory with an in-process cache.
+
+The Google client libraries are imported on first use, so importing this
+module (and every module that imports it) costs nothing until Gmail is
+actually needed; the OAuth flow is only loaded when there is no usable token.
+"""
+import datetime
+import os
+import threading
+
+# If modifying scopes, delete token.json
+SCOPES = [
+    'https://www.googleapis.com/auth/gmail.send',
+    'https://www.googleapis.com/auth/gmail.readonly'
+]
+TOKEN_PATH = 'token.json'
+CLIENT_SECRETS_PATH = os.path.join('credentials', 'credentials_email.json')
+# Access tokens are refreshed this long before they expire
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+_lock = threading.RLock()
+_credentials = {}
+_services = {}
+_http_class = None
+
+
+def _save(creds, token_path):
+    with open(token_path, 'w') as token_file:
+        token_file.write(creds.to_json())
+
+
+def needs_refresh(creds):
+    """True if the credentials are invalid or expire within REFRESH_MARGIN."""
+    if not creds.valid:
+        return True
+    # google-auth stores expiry as a naive UTC datetime
+    expiry = getattr(creds, 'expiry', None)
+    return expiry is not None and expiry - REFRESH_MARGIN <= datetime.datetime.utcnow()
+
+
+def refresh_if_needed(creds, token_path=TOKEN_PATH):
+    """Refresh the credentials if they expire within REFRESH_MARGIN; only one thread refreshes."""
+    if not needs_refresh(creds):
+        return creds
+    with _lock:
+        # Another thread may have refreshed while we waited for the lock
+        if needs_refresh(creds) and creds.refresh_token:
+            from google.auth.transport.requests import Request
+            creds.refresh(Request())
+            _save(creds, token_path)
+    return creds
+
+
+def gmail_authenticate(token_path=TOKEN_PATH, client_secrets_path=CLIENT_SECRETS_PATH, scopes=SCOPES):
+    """Return cached credentials for token_path, loading, refreshing or running the OAuth flow as needed."""
+    with _lock:
+        creds = _credentials.get(token_path)
+        if creds is None and os.path.exists(token_path):
+            from google.oauth2.credentials import Credentials
+            creds = Credentials.from_authorized_user_file(token_path, scopes)
+        if creds and creds.refresh_token:
+            refresh_if_needed(creds, token_path)
+        if not creds or not creds.valid:
+            creds = run_oauth_flow(client_secrets_path, scopes)
+            _save(creds, token_path)
+        _credentials[token_path] = creds
+        return creds
+
+
+def run_oauth_flow(client_secrets_path=CLIENT_SECRETS_PATH, scopes=SCOPES):
+    """Sign in through the browser and return new credentials; nothing is cached or saved."""
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    flow = InstalledAppFlow.from_client_secrets_file(client_secrets_path, scopes)
+    return flow.run_local_server(port=0)
+
+
+def signed_in_address(client_secrets_path=CLIENT_SECRETS_PATH, scopes=SCOPES):
+    """Sign in through the browser and return the lower-cased address of the account signed in to."""
+    from googleapiclient.discovery import build
+    creds = run_oauth_flow(client_secrets_path, scopes)
+    service = build('gmail', 'v1', credentials=creds, static_discovery=True, cache_discovery=False)
+    return service.users().getProfile(userId='me').execute()['emailAddress'].lower()
+
+
+def proactive_http_class():
+    """Return ProactiveAuthorizedHttp, defining it on first call (its base class lives in google_auth_httplib2)."""
+    global _http_class
+    with _lock:
+        if _http_class is None:
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+
+            class ProactiveAuthorizedHttp(AuthorizedHttp):
+                """AuthorizedHttp that refreshes shortly before expiry instead of waiting for a 401."""
+
+                def __init__(self, credentials, http=None, token_path=TOKEN_PATH):
+                    super().__init__(credentials, http=http or httplib2.Http())
+                    self.token_path = token_path
+
+                def request(self, *args, **kwargs):
+                    refresh_if_needed(self.credentials, self.token_path)
+                    return super().request(*args, **kwargs)
+
+            _http_class = ProactiveAuthorizedHttp
+        return _http_class
+
+
+def authorized_http(creds, token_path=TOKEN_PATH):
+    """Return a fresh transport for one thread; httplib2 connections are not thread-safe."""
+    return proactive_http_class()(creds, token_path=token_path)
+
+
+def get_service(token_path=TOKEN_PATH, client_secrets_path=CLIENT_SECRETS_PATH):
+    """Return the cached Gmail service for token_path, building it on first use.
+
+    The discovery document comes from the copy bundled with
+    googleapiclient, so no discovery request is made at startup.
+    """
+    with _lock:
+        service = _services.get(token_path)
+        if service is None:
+            from googleapiclient.discovery import build
+            creds = gmail_authenticate(token_path, client_secrets_path)
+            service = build('gmail', 'v1', http=authorized_http(creds, token_path),
+                            static_discovery=True, cache_discovery=False)
+            _services[token_path] = service
+        return service
+
+
+def clear_cache():
+    """Forget cached credentials and services, e.g. after token.json was replaced."""
+    with _lock:
+        _credentials.clear()
+        _services.clear()
@@ -1,64 +1,154 @@
 import gradio as gr
-import time
 import json
+import os
+import re
 import pandas as pd
 import threading
 from datetime import datetime
 from send_mail import (
-    gmail_authenticate,
-    build,
     convert_to_double_braces,
-    create_message,
-    send_message
+    prepare_campaign,
+    print_send_result
 )
-# Updated import - we'll use the fixed version
-from check_reply import get_recent_repliers, remove_responders_from_csv
-from sugestion import generate_suggestions, choose_option
-
-# Global variables for tracking
-tracking_active = False
-tracking_thread = None
-service = None
-creds = None
-
-def authenticate_gmail():
-    """Authenticate Gmail and return status"""
-    global creds, service
+from journal import SendJournal, campaign_key
+from contacts import count_contacts, preview_contacts, read_columns
+from contact_store import ContactStore
+from poll_scheduler import ReplyTracker
+from jobs import FairExecutor, JobManager, format_send_progress, format_tracking_progress
+from sender_pool import Sender, SenderPool
+from quota import get_default_scheduler
+from gmail_auth import TOKEN_PATH, signed_in_address
+from check_reply import CHECKPOINT_PATH
+from sugestion import SuggestionParseError, stream_suggestions
+import metrics
+
+# State shared by every session: background jobs, the thread pool that sends every
+# campaign, one Sender (credentials + quota) and one reply tracker per Gmail account.
+# What a session owns (its account, its selection, its job ids) lives in gr.State;
+# jobs are only reached through the ids a session holds, never by account name.
+# A session only gets an account it signed in to or that is assigned to its login.
+jobs = JobManager()
+send_executor = FairExecutor()
+accounts = {}
+trackers = {}
+accounts_lock = threading.Lock()
+contact_store = None
+DEFAULT_ACCOUNT = 'me'
+# {Gradio login: [account names]} for accounts a login may use without signing in (app launched with auth=)
+ASSIGNMENTS_PATH = 'account_assignments.json'
+
+def get_contact_store():
+    """Return the shared contact store, opening it on first use"""
+    global contact_store
+    with accounts_lock:
+        if contact_store is None:
+            contact_store = ContactStore()
+        return contact_store
+
+def account_name(name):
+    name = (name or DEFAULT_ACCOUNT).strip()
+    # The name becomes part of a token file name
+    if not re.fullmatch(r'\w+', name):
+        raise ValueError("Account names may only contain letters, digits and underscores")
+    return name
+
+def account_token_path(name):
+    """token.json for the default account, token_<name>.json otherwise"""
+    return TOKEN_PATH if name == DEFAULT_ACCOUNT else f'token_{name}.json'
+
+def _new_account(name):
+    if name == DEFAULT_ACCOUNT:
+        # Shares the process-wide quota scheduler with the other entry points
+        return Sender(name, TOKEN_PATH, checkpoint_path=CHECKPOINT_PATH, scheduler=get_default_scheduler())
+    return Sender(name, account_token_path(name))
+
+def get_account(name):
+    """Return the Sender for a Gmail account"""
+    name = account_name(name)
+    with accounts_lock:
+        if name not in accounts:
+            accounts[name] = _new_account(name)
+        return accounts[name]
+
+def assigned_accounts(username):
+    """Account names assigned to a Gradio login in ASSIGNMENTS_PATH"""
+    if not username or not os.path.exists(ASSIGNMENTS_PATH):
+        return set()
+    with open(ASSIGNMENTS_PATH) as f:
+        return set(json.load(f).get(username, []))
+
+def authenticate_gmail(account, request: gr.Request = None):
+    """Authenticate this session's Gmail account; returns (status, account for the session state).
+
+    An account nobody has authenticated yet goes through the OAuth flow.
+    One that has (its token file exists) is only given to a session whose
+    login it is assigned to, or that signs in to that same Google account.
+    """
     try:
-        creds = gmail_authenticate()
-        service = build('gmail', 'v1', credentials=creds)
-        return "✅ Gmail authenticated successfully!", True
+        name = account_name(account)
+        with accounts_lock:
+            # Claimed here, so a second session cannot slip in while the first one signs in
+            new = name not in accounts and not os.path.exists(account_token_path(name))
+            if new:
+                accounts[name] = _new_account(name)
+        sender = get_account(name)
+        try:
+            if not new and name not in assigned_accounts(getattr(request, 'username', None)):
+                if signed_in_address() != sender.address:
+                    return f"❌ You signed in to a different Google account than '{name}'", None
+            sender.creds
+            sender.service
+        except Exception:
+            if new:
+                with accounts_lock:
+                    accounts.pop(name, None)
+            raise
+        return f"✅ Gmail account '{sender.name}' authenticated successfully!", sender.name
     except Exception as e:
-        return f"❌ Authentication failed: {str(e)}", False
+        return f"❌ Authentication failed: {str(e)}", None
+
+def generate_email_suggestions(subject, message, regenerate=False):
+    """Stream suggestions from Groq (cached unless regenerate is set).
 
-def generate_email_suggestions(subject, message):
-    """Generate suggestions using Groq"""
+    Yields (status, subject_list, message_list) each time another option
+    is complete, so the radios fill in while the model is still writing.
+    """
     if not subject.strip() or not message.strip():
-        return "Please enter both subject and message", [], [], "", ""
+        yield "Please enter both subject and message", [], []
+        return
     
     # Auto-convert single braces to double braces for placeholders
-    if "{influencer_name}" in subject:
-        subject = subject.replace("{influencer_name}", "{{influencer_name}}")
-    if "{influencer_name}" in message:
-        message = message.replace("{influencer_name}", "{{influencer_name}}")
+    subject = convert_to_double_braces(subject)
+    message = convert_to_double_braces(message)
     
+    options = {"subject_suggestions": [], "message_suggestions": []}
     try:
         print(f"Generating suggestions for:\nSubject: {subject}\nMessage: {message}")
-        suggestions = generate_suggestions(subject, message)
+        for key, text in stream_suggestions(subject, message, regenerate=regenerate):
+            options[key].append(text)
+            yield (
+                f"⏳ Generating... {len(options['subject_suggestions'])} subjects, "
+                f"{len(options['message_suggestions'])} messages so far",
+                options["subject_suggestions"],
+                options["message_suggestions"]
+            )
         
-        # Return the suggestions as lists for checkboxes
-        return (
-            "✅ Suggestions generated successfully!",
-            suggestions["subject_suggestions"],  # List for subject checkboxes
-            suggestions["message_suggestions"],  # List for message checkboxes
-            suggestions["subject_suggestions"][0],  # Default to first suggestion
-            suggestions["message_suggestions"][0]   # Default to first suggestion
+        yield (
+            "✅ Fresh suggestions generated!" if regenerate else "✅ Suggestions generated successfully!",
+            options["subject_suggestions"],
+            options["message_suggestions"]
         )
+    except SuggestionParseError as e:
+        # Keep whatever options already arrived; the user can pick one or regenerate
+        print(f"⚠️ Raw response:\n{e.raw}")
+        yield f"⚠️ {e} Try 🔄 Regenerate.", options["subject_suggestions"], options["message_suggestions"]
     except Exception as e:
         error_msg = str(e)
         if "connection" in error_msg.lower() or "timeout" in error_msg.lower():
-            return "❌ Connection error: Please check your internet connection and Groq API key", [], [], "", ""
-        return f"❌ Error generating suggestions: {error_msg}", [], [], "", ""
+            yield ("❌ Connection error: Please check your internet connection and Groq API key",
+                   options["subject_suggestions"], options["message_suggestions"])
+            return
+        yield f"❌ Error generating suggestions: {error_msg}", options["subject_suggestions"], options["message_suggestions"]
 
 def update_selected_subject(subject_choice):
     """Return the selected subject"""
@@ -69,10 +159,10 @@ def update_selected_message(message_choice):
     return message_choice if message_choice else ""
 
 def save_selection(subject, message):
-    """Save the selected subject and message"""
+    """Save the selected subject and message; returns (status, selection for the session state)"""
     try:
         if not subject or not message:
-            return "❌ Please select both subject and message options"
+            return "❌ Please select both subject and message options", None
             
         output = {
             "selected_subject": subject,
@@ -80,199 +170,165 @@ def save_selection(subject, message):
             "timestamp": datetime.now().isoformat()
         }
         
+        # Still written for the command-line tools; each session sends its own copy
         with open("final_selection.json", "w") as f:
             json.dump(output, f, indent=4)
         
-        return "✅ Selection saved to final_selection.json"
+        return "✅ Selection saved to final_selection.json", output
     except Exception as e:
-        return f"❌ Error saving selection: {str(e)}"
+        return f"❌ Error saving selection: {str(e)}", None
+
+def run_send_job(job, sender, csv_path, subject_text, message_text):
+    """Send the campaign in the background, counting results on the job as they arrive"""
+    # Unknown placeholders raise here, before anything is sent
+    messages = prepare_campaign(csv_path, subject_text, message_text)
+    # Counted here rather than in the click handler, which would scan the whole CSV
+    job.total = count_contacts(csv_path)
+    errors = 0
+    # Journaled so that resending the same campaign skips contacts already mailed;
+    # stopping ends the input, so sends already in flight are still journaled.
+    # Every campaign shares send_executor, which takes their sends in turn.
+    with SendJournal(campaign_id=campaign_key(csv_path, subject_text, message_text)) as journal:
+        results = SenderPool([sender]).iter_send_results(job.iter_until_stopped(messages), journal=journal,
+                                                         executor=send_executor.tenant(job.id))
+        for result in results:
+            print_send_result(result)
+            job.incr('done')
+            if result.get('skipped'):
+                job.incr('skipped')
+            elif result['error'] is None:
+                job.incr('sent')
+            else:
+                job.incr('failed')
+                errors += 1
+                if errors <= 5:
+                    job.log(f"❌ {result['email']}: {result['error']}")
+    job.log("🛑 Sending stopped" if job.stopping else "✅ Campaign finished")
+
+def send_initial_emails(csv_path, account, selection):
+    """Start sending to all contacts in the CSV as a background job; returns (status, job id)"""
+    if not account:
+        return "❌ Please authenticate Gmail first", None
 
-def send_initial_emails(csv_path):
-    """Send emails to all contacts in CSV"""
-    global service
-    
-    if service is None:
-        return "❌ Please authenticate Gmail first"
-    
     try:
-        # Load CSV
         if not csv_path:
             csv_path = 'influencer.csv'
-        
-        df = pd.read_csv(csv_path)
-        
-        # Load selected templates
-        with open('final_selection.json') as f:
-            selected = json.load(f)
-        
-        subject_template = convert_to_double_braces(selected["selected_subject"])
-        message_template = convert_to_double_braces(selected["selected_message"])
-        
-        sent_count = 0
-        errors = []
-        
-        for _, row in df.iterrows():
-            try:
-                influencer_name = row['influencer_name']
-                email = row['email']
-                
-                personalized_subject = subject_template.replace("{{influencer_name}}", influencer_name)
-                personalized_message = message_template.replace("{{influencer_name}}", influencer_name)
-                
-                email_msg = create_message(email, personalized_subject, personalized_message)
-                send_message(service, 'me', email_msg)
-                sent_count += 1
-                
-                # Small delay to avoid rate limiting
-                time.sleep(1)
-                
-            except Exception as e:
-                errors.append(f"Failed to send to {email}: {str(e)}")
-        
-        result = f"✅ Sent {sent_count} emails successfully"
-        if errors:
-            result += f"\n❌ {len(errors)} errors occurred:\n" + "\n".join(errors[:5])
-            if len(errors) > 5:
-                result += f"\n... and {len(errors) - 5} more errors"
-        
-        return result
-        
-    except Exception as e:
-        return f"❌ Error sending emails: {str(e)}"
 
-def save_responder_to_csv(responder_email, responder_name=None):
-    """Save responder to responded.csv file"""
-    try:
-        import os
-        
-        # Check if responded.csv exists
-        if not os.path.exists('responded.csv'):
-            # Create new file with headers
-            with open('responded.csv', 'w', newline='') as f:
-                f.write('influencer_name,email\n')
-        
-        # Read existing data to avoid duplicates
-        try:
-            existing_df = pd.read_csv('responded.csv')
-            if responder_email in existing_df['email'].values:
-                return False  # Already exists
-        except:
-            pass
-        
-        # Append new responder
-        with open('responded.csv', 'a', newline='') as f:
-            name = responder_name if responder_name else "Unknown"
-            f.write(f'{name},{responder_email}\n')
-        
-        return True
-    except Exception as e:
-        print(f"Error saving responder: {e}")
-        return False
-
-def start_reply_tracking(csv_path):
-    """Start the reply tracking in a separate thread - FIXED VERSION"""
-    global tracking_active, tracking_thread, service
-
-    if tracking_active:
-        return "⚠️ Tracking already active"
-
-    if service is None:
-        return "❌ Please authenticate Gmail first"
+        if selection is None:
+            # final_selection.json may hold another session's copy, so it is never used here
+            return "❌ Please save a subject and message selection first", None
+        subject_text, message_text = selection["selected_subject"], selection["selected_message"]
 
-    tracking_active = True
+        job = jobs.submit('send', run_send_job, get_account(account), csv_path, subject_text, message_text,
+                          owner=account)
+        return f"🚀 Sending started as job {job.id}", job.id
 
-    def tracking_loop():
-        global tracking_active
-        csv_file_path = csv_path if csv_path else 'influencer.csv'
-
-        print(f"🚀 Starting reply tracking for {csv_file_path}")
+    except Exception as e:
+        return f"❌ Error sending emails: {str(e)}", None
+
+def send_progress(job_id):
+    """Progress of the session's send job, read from its counters"""
+    job = jobs.get(job_id) if job_id else None
+    if job is None:
+        return gr.update()
+    return format_send_progress(job.snapshot())
+
+def stop_sending(job_id):
+    job = jobs.stop(job_id) if job_id else None
+    if job is None:
+        return "⚠️ No campaign is being sent"
+    return format_send_progress(job.snapshot())
+
+def run_tracking_job(job, tracker):
+    """Track replies in the background, counting polls and new replies on the job"""
+    job.on_stop = tracker.stop
+
+    def on_poll(newly_responded):
+        job.incr('polls')
+        job.incr('replies', len(newly_responded))
+        for name, email in newly_responded:
+            job.log(f"📩 {name} - {email}")
+        job.set(pending=sum(counts['pending'] for counts in tracker.status().values()))
 
-        # Load original contact list for validation
+    try:
+        tracker.run(on_poll=on_poll)
+    finally:
+        tracker.close()
+        # Write the remaining contacts back to each CSV once, when tracking stops
         try:
-            original_df = pd.read_csv(csv_file_path)
-            # original_contacts = set(original_df['email'].str.lower())
-            original_contacts = set(email.lower().strip() for email in original_df["email"])
-            print(f"📋 Loaded {len(original_contacts)} original contacts for validation")
+            tracker.export()
         except Exception as e:
-            print(f"❌ Error loading original contacts: {e}")
-            return
-
-        while tracking_active:
+            job.log(f"⚠️ Error updating the contact CSVs: {e}")
+
+def start_reply_tracking(csv_path, account, tracking):
+    """Start reply tracking for the account as a background job, or add the CSV to the one running.
+
+    Sessions on the same account share its tracking job, since the mailbox
+    and its history checkpoint are the same. Returns (status, tracking state):
+    (job id, True) for the session that started the job, which alone may
+    stop it, and (job id, False) for sessions that joined it.
+    """
+    if not account:
+        return "❌ Please authenticate Gmail first", tracking
+
+    csv_file_path = csv_path if csv_path else 'influencer.csv'
+    with accounts_lock:
+        job = jobs.latest('track', owner=account, running_only=True)
+        if job is not None:
+            # Keep control of a job this session started itself
+            joined = tracking if tracking and tracking[0] == job.id else (job.id, False)
+            # One loop tracks every campaign; its mailbox polls serve all of them
             try:
-                print(f"🔍 Checking for replies at {datetime.now().strftime('%H:%M:%S')}...")
-
-                repliers = get_recent_repliers(service)
-                
-
-                if repliers:
-                    # ✅ Only keep those that are in the original contacts
-                    # valid_repliers = set(email for email in repliers if email in original_contacts)
-                    valid_repliers = set(email.lower().strip() for email in repliers if email.lower().strip() in original_contacts)
-
-
-                    # if valid_repliers:
-                    #     print(f"📩 Valid replies from original contacts: {valid_repliers}")
-                    #     remove_responders_from_csv(csv_file_path, valid_repliers)
-                    #     original_contacts -= valid_repliers
-                    if valid_repliers:
-                        print(f"📩 Valid replies from original contacts: {valid_repliers}")
-    
-                        for email in valid_repliers:
-                            try:
-                                influencer_name = original_df.loc[original_df['email'].str.lower() == email, 'influencer_name'].values[0]
-                            except:
-                                influencer_name = "Unknown"
-        
-                        save_responder_to_csv(email, influencer_name)
-
-                        remove_responders_from_csv(csv_file_path, valid_repliers)
-                        original_contacts -= valid_repliers
-
-            
-                        print(f"📋 {len(original_contacts)} contacts remaining")
-                    else:
-                        print("ℹ️ No valid replies from contacts in original CSV.")
-                else:
-                    print("ℹ️ No new replies found")
-
-                # Update live status
-                try:
-                    current_df = pd.read_csv(csv_file_path)
-                    remaining_count = len(current_df)
-
-                    import os
-                    if os.path.exists('responded.csv'):
-                        responded_df = pd.read_csv('responded.csv')
-                        responded_count = len(responded_df)
-                    else:
-                        responded_count = 0
-
-                    print(f"📊 Status: {remaining_count} contacts remaining, {responded_count} total responses")
-                except Exception as e:
-                    print(f"⚠️ Error getting statistics: {e}")
-
-                time.sleep(60)  # Wait 1 min before next check
-
+                added = trackers[account].add_campaign(csv_file_path)
             except Exception as e:
-                print(f"❌ Tracking error: {e}")
-                time.sleep(30)
-                continue
-
-    tracking_thread = threading.Thread(target=tracking_loop, daemon=True)
-    tracking_thread.start()
-
-    return "🚀 Reply tracking started! Now checking for REAL replies from your original contacts every minute..."
+                return f"❌ Error loading {csv_file_path}: {e}", tracking
+            if not added:
+                return f"⚠️ Tracking already active (job {job.id})", joined
+            job.log(f"➕ Now also tracking {csv_file_path}")
+            return f"➕ Now also tracking replies for {csv_file_path} (job {job.id})", joined
 
-
-def stop_reply_tracking():
-    """Stop the reply tracking"""
-    global tracking_active
-    tracking_active = False
-    return "🛑 Reply tracking stopped"
-
-def get_tracking_status():
+        store = get_contact_store()
+        try:
+            # Polls soon after sends and less often while no replies come,
+            # or waits for Gmail push notifications when GMAIL_PUSH_TOPIC is set
+            tracker = ReplyTracker(SenderPool([get_account(account)]), store, [csv_file_path])
+        except Exception as e:
+            return f"❌ Error starting reply tracking: {e}", tracking
+        trackers[account] = tracker
+        job = jobs.submit('track', run_tracking_job, tracker, owner=account)
+    counts = store.counts(csv_file_path)
+    job.set(pending=counts['pending'])
+    job.log(f"📋 Loaded {counts['pending']} original contacts from {csv_file_path}")
+    return f"🚀 Reply tracking started as job {job.id}", (job.id, True)
+
+
+def stop_reply_tracking(tracking):
+    """Stop the session's reply tracking job, if this session started it"""
+    job = jobs.get(tracking[0]) if tracking else None
+    if job is None or not job.running:
+        return "⚠️ Tracking is not running"
+    if not tracking[1]:
+        return f"⚠️ Job {job.id} was started by another session; only that session can stop it"
+    job.stop()
+    return f"🛑 Reply tracking stopped (job {job.id})"
+
+def get_tracking_status(tracking):
     """Get current tracking status"""
-    return "🟢 Active" if tracking_active else "🔴 Inactive"
+    job = jobs.get(tracking[0]) if tracking else None
+    if job is not None and job.running:
+        return "🟢 Active"
+    return "🔴 Inactive"
+
+def tracking_progress(tracking, replies_seen):
+    """Timer callback: tracking status, job progress, and the responses list when new replies came in"""
+    job = jobs.get(tracking[0]) if tracking else None
+    if job is None:
+        return get_tracking_status(tracking), gr.update(), gr.update(), replies_seen
+    snapshot = job.snapshot()
+    replies = (job.id, snapshot['counters'].get('replies', 0))
+    # responded.csv is only re-read when the job's counter shows new replies
+    responses = get_responded_contacts() if replies != replies_seen else gr.update()
+    return get_tracking_status(tracking), format_tracking_progress(snapshot), responses, replies
 
 def get_responded_contacts():
     """Get list of contacts who have responded"""
@@ -281,9 +337,7 @@ def get_responded_contacts():
         if os.path.exists('responded.csv'):
             df = pd.read_csv('responded.csv')
             if len(df) > 0:
-                response_list = []
-                for _, row in df.iterrows():
-                    response_list.append(f"• {row['influencer_name']} - {row['email']}")
+                response_list = "• " + df['influencer_name'].astype(str) + " - " + df['email'].astype(str)
                 return f"📧 Total Responses: {len(df)}\n\n" + "\n".join(response_list)
             else:
                 return "📧 No responses yet"
@@ -316,19 +370,20 @@ def load_csv_info(csv_path):
         if not csv_path:
             csv_path = 'influencer.csv'
         
-        df = pd.read_csv(csv_path)
+        columns = read_columns(csv_path)
+        total = count_contacts(csv_path)
         
         # Show sample data
         sample_data = ""
-        if len(df) > 0:
+        if total > 0:
             sample_data = f"\n\nSample data:\n"
-            for i, row in df.head(3).iterrows():
-                if 'influencer_name' in df.columns and 'email' in df.columns:
+            for i, row in preview_contacts(csv_path).iterrows():
+                if 'influencer_name' in columns and 'email' in columns:
                     sample_data += f"• {row['influencer_name']} - {row['email']}\n"
                 else:
                     sample_data += f"• Row {i+1}: {dict(row)}\n"
         
-        return f"📊 CSV loaded: {len(df)} contacts found\nColumns: {', '.join(df.columns.tolist())}{sample_data}"
+        return f"📊 CSV loaded: {total} contacts found\nColumns: {', '.join(columns)}{sample_data}"
     except Exception as e:
         return f"❌ Error loading CSV: {str(e)}"
 
@@ -342,14 +397,24 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
     💡 **Quick Start Guide:**
     🔐 **Authenticate Gmail** first --> 📁 **Load your CSV** to verify contacts --> ✍️ **Write your email** using `{influencer_name}` for personalization --> 🤖 **Generate suggestions** with AI --> ☑️ **Select your preferred options** using checkboxes --> 📤 **Send your campaign** --> 🔄 **Track REAL replies** automatically (only from your original contacts)
     """)
-    gr.Markdown("⚠️ **Note:** Use `{influencer_name}` (single braces) in your email body input - the system will convert it automatically!")
+    gr.Markdown("⚠️ **Note:** Use `{influencer_name}` (single braces) in your email body input - the system will convert it automatically! Any other CSV column, e.g. `{niche}`, works the same way.")
     gr.Markdown("🎯 **Fixed:** Now only tracks actual replies from people in your contact list!")
 
     
+    # Per-session state: the authenticated account and the saved selection
+    session_account = gr.State(None)
+    session_selection = gr.State(None)
+
     with gr.Tabs() as tabs:
         # Tab 1: Authentication
         with gr.Tab("🔐 Authentication", id=0):
             gr.Markdown("### Gmail Authentication")
+            account_input = gr.Textbox(
+                label="👤 Gmail Account",
+                value=DEFAULT_ACCOUNT,
+                info="Each teammate uses their own account name (letters, digits, _); 'me' uses token.json, others token_<name>.json. "
+                     "An account already set up on this server asks you to sign in to it again"
+            )
             auth_btn = gr.Button("🔑 Authenticate Gmail", variant="primary")
             auth_status = gr.Textbox(label="Authentication Status", interactive=False)
             
@@ -360,7 +425,8 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
             
             auth_btn.click(
                 authenticate_gmail,
-                outputs=[auth_status, gr.State()]
+                inputs=[account_input],
+                outputs=[auth_status, session_account]
             )
         
         # Tab 2: Email Composition
@@ -381,7 +447,9 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
                         lines=5,
                         info="Example: Hi {influencer_name}, I hope you're doing well. I'd love to collaborate..."
                     )
-                    generate_btn = gr.Button("🤖 Generate AI Suggestions", variant="primary")
+                    with gr.Row():
+                        generate_btn = gr.Button("🤖 Generate AI Suggestions", variant="primary")
+                        regenerate_btn = gr.Button("🔄 Regenerate", variant="secondary")
             
             suggestion_status = gr.Textbox(label="Status", interactive=False)
             
@@ -420,17 +488,22 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
                 next_to_campaign = gr.Button("Next: Campaign Management ➡️", variant="secondary", size="lg")
             
             # Event handlers
-            def update_suggestions_and_radio(subject, message):
-                status, subject_list, message_list, default_subject, default_message = generate_email_suggestions(subject, message)
-                return (
-                    status,
-                    gr.Radio(choices=subject_list, value=None),  # Update subject radio
-                    gr.Radio(choices=message_list, value=None),  # Update message radio
-                    subject_list,  # Store in state
-                    message_list,  # Store in state
-                    "",  # Clear selected subject
-                    ""   # Clear selected message
-                )
+            def update_suggestions_and_radio(subject, message, regenerate=False):
+                for status, subject_list, message_list in generate_email_suggestions(
+                    subject, message, regenerate=regenerate
+                ):
+                    yield (
+                        status,
+                        gr.Radio(choices=subject_list, value=None),  # Update subject radio
+                        gr.Radio(choices=message_list, value=None),  # Update message radio
+                        list(subject_list),  # Store in state
+                        list(message_list),  # Store in state
+                        "",  # Clear selected subject
+                        ""   # Clear selected message
+                    )
+            
+            def regenerate_suggestions_and_radio(subject, message):
+                yield from update_suggestions_and_radio(subject, message, regenerate=True)
             
             generate_btn.click(
                 update_suggestions_and_radio,
@@ -446,6 +519,21 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
                 ]
             )
             
+            # Same outputs, but bypass the suggestion cache
+            regenerate_btn.click(
+                regenerate_suggestions_and_radio,
+                inputs=[subject_input, message_input],
+                outputs=[
+                    suggestion_status, 
+                    subject_radio, 
+                    message_radio,
+                    subject_suggestions_state,
+                    message_suggestions_state,
+                    selected_subject, 
+                    selected_message
+                ]
+            )
+            
             # Update selected values when radio buttons change
             subject_radio.change(
                 update_selected_subject,
@@ -462,7 +550,7 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
             save_btn.click(
                 save_selection,
                 inputs=[selected_subject, selected_message],
-                outputs=[save_status]
+                outputs=[save_status, session_selection]
             )
         
         # Tab 3: Campaign Management
@@ -481,8 +569,13 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
             gr.Markdown("---")
             
             with gr.Row():
-                send_emails_btn = gr.Button("📧 Send Initial Emails", variant="primary", size="lg")
-                send_status = gr.Textbox(label="Send Status", interactive=False)
+                with gr.Column():
+                    send_emails_btn = gr.Button("📧 Send Initial Emails", variant="primary", size="lg")
+                    stop_sending_btn = gr.Button("⏹️ Stop Sending", variant="stop")
+                send_status = gr.Textbox(label="Send Status", interactive=False, lines=6)
+            send_job_id = gr.State(None)
+            # Progress is read from the job's counters every second; the send runs in the background
+            send_timer = gr.Timer(1.0)
             
             # Next button for Campaign Management tab
             gr.Markdown("---")
@@ -498,7 +591,19 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
             
             send_emails_btn.click(
                 send_initial_emails,
-                inputs=[csv_path_input],
+                inputs=[csv_path_input, session_account, session_selection],
+                outputs=[send_status, send_job_id]
+            )
+
+            stop_sending_btn.click(
+                stop_sending,
+                inputs=[send_job_id],
+                outputs=[send_status]
+            )
+
+            send_timer.tick(
+                send_progress,
+                inputs=[send_job_id],
                 outputs=[send_status]
             )
         
@@ -522,7 +627,11 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
                         stop_tracking_btn = gr.Button("🛑 Stop Tracking", variant="stop")
                         refresh_status_btn = gr.Button("🔄 Refresh Status")
             
-            tracking_output = gr.Textbox(label="Tracking Output", interactive=False)
+            tracking_output = gr.Textbox(label="Tracking Output", interactive=False, lines=8)
+            # (job id, whether this session may stop it), set by Start Tracking
+            tracking_job = gr.State(None)
+            replies_seen = gr.State(None)
+            tracking_timer = gr.Timer(2.0)
             
             # Response display section
             gr.Markdown("---")
@@ -546,13 +655,13 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
                 prev_to_campaign = gr.Button("⬅️ Previous: Campaign Management", variant="secondary")
             
             # FIXED: Update responses display after tracking actions
-            def start_tracking_and_refresh(csv_path):
-                result = start_reply_tracking(csv_path)
+            def start_tracking_and_refresh(csv_path, account, tracking):
+                result, tracking = start_reply_tracking(csv_path, account, tracking)
                 responses = get_responded_contacts()
-                return result, responses
+                return result, responses, tracking
             
-            def stop_tracking_and_refresh():
-                result = stop_reply_tracking()
+            def stop_tracking_and_refresh(tracking):
+                result = stop_reply_tracking(tracking)
                 responses = get_responded_contacts() 
                 return result, responses
             
@@ -564,17 +673,19 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
             # Event handlers for tracking - FIXED to update both outputs
             start_tracking_btn.click(
                 start_tracking_and_refresh,
-                inputs=[csv_path_input],
-                outputs=[tracking_output, responses_display]
+                inputs=[csv_path_input, session_account, tracking_job],
+                outputs=[tracking_output, responses_display, tracking_job]
             )
             
             stop_tracking_btn.click(
                 stop_tracking_and_refresh,
+                inputs=[tracking_job],
                 outputs=[tracking_output, responses_display]
             )
             
             refresh_status_btn.click(
                 get_tracking_status,
+                inputs=[tracking_job],
                 outputs=[tracking_status_display]
             )
             
@@ -589,8 +700,14 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
                 outputs=[tracking_output, responses_display]
             )
             
-            # ADDED: Auto-refresh button with instructions
-            gr.Markdown("💡 **Tip:** Click 'Refresh Responses' periodically to see new replies while tracking is active")
+            # Status, progress and new responses stream in while the tracking job runs
+            tracking_timer.tick(
+                tracking_progress,
+                inputs=[tracking_job, replies_seen],
+                outputs=[tracking_status_display, tracking_output, responses_display, replies_seen]
+            )
+
+            gr.Markdown("💡 **Tip:** Progress and new replies show up here on their own while tracking is active")
             gr.Markdown("🎯 **Fixed Feature:** Now only genuine replies from your contact list are tracked!")
     
     # Tab navigation event handlers
@@ -611,7 +728,9 @@ with gr.Blocks(title="Email Campaign Manager", theme=gr.themes.Soft()) as app:
 #     )
 
 if __name__ == "__main__":
-    app.launch(
+    metrics.start_exporters()
+    # Handlers return quickly (sends and tracking run as jobs), so many sessions can be served at once
+    app.queue(default_concurrency_limit=16).launch(
         server_name="127.0.0.1",
         server_port=7860,
         share=False,
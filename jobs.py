@@ -0,0 +1,274 @@
+"""Background jobs (campaign sends, reply tracking) with in-memory progress counters, for the Gradio app."""
+import collections
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future
+
+# Log lines kept per job for the UI
+LOG_LINES = 50
+# Threads shared by every campaign being sent from one process
+FAIR_WORKERS = 32
+# Finished jobs are kept for their sessions' progress views, up to this many and this long
+MAX_FINISHED_JOBS = 100
+FINISHED_JOB_TTL = 24 * 3600
+
+
+class Job:
+    """One background task and its live progress.
+
+    The task updates counters with incr()/set() and adds log lines; the UI
+    reads snapshot() as often as it likes without touching the CSVs or
+    the journal. stop() asks the task to finish early: it sees
+    `job.stopping`, and an optional on_stop callback can interrupt a wait.
+    """
+
+    def __init__(self, kind, total=None, owner=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.kind = kind
+        self.owner = owner
+        self.total = total
+        self.status = 'running'
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.counters = collections.Counter()
+        self.on_stop = None
+        self._log = collections.deque(maxlen=LOG_LINES)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def stopping(self):
+        return self._stopping.is_set()
+
+    @property
+    def running(self):
+        return self.status == 'running'
+
+    def incr(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def set(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self.counters[key] = value
+
+    def log(self, line):
+        with self._lock:
+            self._log.append(f"{time.strftime('%H:%M:%S')} {line}")
+
+    def stop(self):
+        self._stopping.set()
+        if self.on_stop is not None:
+            self.on_stop()
+
+    def iter_until_stopped(self, items):
+        """Yield from items until stop() is called."""
+        for item in items:
+            if self.stopping:
+                return
+            yield item
+
+    def _finish(self, status, error=None):
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+
+    def snapshot(self):
+        """Return a dict of the job's state, with its rate (per second of the 'done' counter) and ETA."""
+        with self._lock:
+            counters = dict(self.counters)
+            log = list(self._log)
+            status, error = self.status, self.error
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        done = counters.get('done', 0)
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.total is not None and rate > 0 and status == 'running':
+            eta = max(0.0, (self.total - done) / rate)
+        return {'id': self.id, 'kind': self.kind, 'owner': self.owner, 'status': status, 'error': error, 'total': self.total,
+                'elapsed': elapsed, 'rate': rate, 'eta': eta, 'counters': counters, 'log': log}
+
+
+class JobManager:
+    """Runs jobs on daemon threads and keeps them by id.
+
+    Running jobs are always kept; finished ones are dropped once there are
+    more than `max_finished` of them or they finished over `finished_ttl`
+    seconds ago, oldest first.
+    """
+
+    def __init__(self, max_finished=MAX_FINISHED_JOBS, finished_ttl=FINISHED_JOB_TTL):
+        self.max_finished = max_finished
+        self.finished_ttl = finished_ttl
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, target, *args, total=None, owner=None, **kwargs):
+        """Start target(job, *args, **kwargs) in the background and return the Job."""
+        job = Job(kind, total=total, owner=owner)
+
+        def run():
+            try:
+                target(job, *args, **kwargs)
+            except Exception as e:
+                traceback.print_exc()
+                job.log(f"❌ {e}")
+                job._finish('failed', str(e))
+            else:
+                job._finish('stopped' if job.stopping else 'done')
+
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+        threading.Thread(target=run, name=f'job-{kind}-{job.id}', daemon=True).start()
+        return job
+
+    def _evict(self):
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.finished_at is not None]
+        excess = len(finished) - self.max_finished
+        for job in finished:
+            if excess > 0 or now - job.finished_at > self.finished_ttl:
+                del self._jobs[job.id]
+                excess -= 1
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self, kind, owner=None, running_only=False):
+        """Return the most recently started job of this kind (and owner, when given), or None."""
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job.kind == kind and (owner is None or job.owner == owner) and (job.running or not running_only):
+                    return job
+        return None
+
+    def running(self):
+        with self._lock:
+            return [job for job in self._jobs.values() if job.running]
+
+    def stop(self, job_id):
+        job = self.get(job_id)
+        if job is not None and job.running:
+            job.stop()
+        return job
+
+
+class _Tenant:
+    def __init__(self, executor, key):
+        self.executor = executor
+        self.key = key
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(self.key, fn, *args, **kwargs)
+
+
+class FairExecutor:
+    """A thread pool shared by many jobs that takes their tasks round-robin.
+
+    Each job (tenant) has its own queue; a free worker runs the oldest task
+    of the next tenant in turn, so a campaign with a long backlog cannot
+    starve one started after it. tenant(key) returns an object with the
+    submit() of a concurrent.futures executor, for send_engine.run_sends.
+    """
+
+    def __init__(self, max_workers=FAIR_WORKERS):
+        self.max_workers = max_workers
+        self._queues = collections.OrderedDict()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._shutdown = False
+
+    def tenant(self, key):
+        return _Tenant(self, key)
+
+    def submit(self, key, fn, *args, **kwargs):
+        future = Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError('FairExecutor is shut down')
+            self._queues.setdefault(key, collections.deque()).append((future, fn, args, kwargs))
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, name=f'fair-{len(self._threads)}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+        return future
+
+    def _next(self):
+        key, queue = next(iter(self._queues.items()))
+        task = queue.popleft()
+        if queue:
+            self._queues.move_to_end(key)
+        else:
+            del self._queues[key]
+        return task
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queues and not self._shutdown:
+                    self._cond.wait()
+                if not self._queues:
+                    return
+                future, fn, args, kwargs = self._next()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def queued(self):
+        """Return {tenant: tasks waiting}."""
+        with self._cond:
+            return {key: len(queue) for key, queue in self._queues.items()}
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f'{seconds}s'
+    if seconds < 3600:
+        return f'{seconds // 60}m{seconds % 60:02d}s'
+    return f'{seconds // 3600}h{seconds % 3600 // 60:02d}m'
+
+
+def format_send_progress(snapshot):
+    """One status block for a send job snapshot."""
+    counters = snapshot['counters']
+    total = snapshot['total']
+    lines = [f"📦 Job {snapshot['id']} ({snapshot['status']})",
+             f"📧 {counters.get('done', 0)}/{total if total is not None else '?'} processed: "
+             f"{counters.get('sent', 0)} sent, {counters.get('skipped', 0)} skipped, "
+             f"{counters.get('failed', 0)} failed",
+             f"⚡ {snapshot['rate']:.1f}/s, elapsed {format_duration(snapshot['elapsed'])}"
+             + (f", ETA {format_duration(snapshot['eta'])}" if snapshot['eta'] is not None else '')]
+    if snapshot['error']:
+        lines.append(f"❌ {snapshot['error']}")
+    return '\n'.join(lines + snapshot['log'][-5:])
+
+
+def format_tracking_progress(snapshot):
+    """One status block for a tracking job snapshot."""
+    counters = snapshot['counters']
+    lines = [f"📦 Job {snapshot['id']} ({snapshot['status']}), running {format_duration(snapshot['elapsed'])}",
+             f"🔍 {counters.get('polls', 0)} checks, {counters.get('replies', 0)} new replies, "
+             f"{counters.get('pending', 0)} contacts still pending"]
+    if snapshot['error']:
+        lines.append(f"❌ {snapshot['error']}")
+    return '\n'.join(lines + snapshot['log'][-10:])
@@ -0,0 +1,266 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+import metrics
+
+JOURNAL_PATH = 'send_journal.db'
+# Buffered send results are committed once this many accumulate or this many seconds pass
+FLUSH_EVERY = 100
+FLUSH_INTERVAL = 1.0
+
+
+def campaign_key(csv_path, subject_text, message_text):
+    """Identify a campaign by its contact list and templates, so a rerun resumes it."""
+    digest = hashlib.sha256('\0'.join((csv_path, subject_text, message_text)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class SendJournal:
+    """Append-only SQLite (WAL mode) record of every send attempt and its Gmail message id.
+
+    Results are buffered and committed in batched transactions, so
+    journaling costs one fsync per FLUSH_EVERY sends rather than per send.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, campaign_id='default', flush_every=FLUSH_EVERY,
+                 flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.campaign_id = campaign_id
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        # Worker processes (work_queue.py) may share the file, so wait out each other's write locks
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS sends (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                campaign TEXT NOT NULL,
+                email TEXT NOT NULL,
+                status TEXT NOT NULL,
+                message_id TEXT,
+                error TEXT,
+                latency REAL,
+                attempted_at REAL NOT NULL,
+                sender TEXT,
+                thread_id TEXT,
+                rfc_message_id TEXT
+            )
+        ''')
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(sends)')}
+        for column in ('sender', 'thread_id', 'rfc_message_id'):
+            if column not in columns:
+                # Journals written by older versions lack the newer columns
+                self._conn.execute(f'ALTER TABLE sends ADD COLUMN {column} TEXT')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS sends_campaign_email ON sends (campaign, email)')
+        # Reply matching (reply_index.py) looks sent messages up by Gmail thread and RFC 822 Message-ID
+        self._conn.execute('CREATE INDEX IF NOT EXISTS sends_thread ON sends (thread_id)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS sends_message_id ON sends (message_id)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS sends_rfc_message_id ON sends (rfc_message_id)')
+        # Sends each account may still make today, shared by every process using this journal
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS daily_usage (
+                sender TEXT NOT NULL,
+                day REAL NOT NULL,
+                reserved INTEGER NOT NULL,
+                PRIMARY KEY (sender, day)
+            )
+        ''')
+        # Per-recipient copy written by personalize.py before it is sent
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS drafts (
+                campaign TEXT NOT NULL,
+                email TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (campaign, email)
+            )
+        ''')
+        self._conn.commit()
+
+    def completed(self, emails=None):
+        """Return the emails that already have a successful send in this campaign.
+
+        With `emails`, only those recipients are looked up (by index) instead
+        of reading the whole campaign.
+        """
+        query = "SELECT DISTINCT email FROM sends WHERE campaign = ? AND status = 'sent'"
+        with self._lock:
+            if emails is None:
+                rows = self._conn.execute(query, (self.campaign_id,)).fetchall()
+            else:
+                emails = list(emails)
+                rows = []
+                # Stay under SQLite's limit on bound parameters
+                for i in range(0, len(emails), 500):
+                    part = emails[i:i + 500]
+                    rows += self._conn.execute(
+                        f"{query} AND email IN ({', '.join('?' * len(part))})", (self.campaign_id, *part)
+                    ).fetchall()
+        return {row[0] for row in rows}
+
+    def record(self, result):
+        """Buffer one send result from the send engine, flushing when the batch is full."""
+        status = 'sent' if result['error'] is None else 'failed'
+        with self._lock:
+            self._buffer.append((
+                self.campaign_id, result['email'], status, result['message_id'],
+                result['error'], result['latency'], time.time(), result.get('sender'), result.get('thread_id')
+            ))
+            due = (len(self._buffer) >= self.flush_every
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    @metrics.timed('journal_flush_seconds')
+    def flush(self):
+        with self._lock:
+            if self._buffer:
+                with self._conn:
+                    self._conn.executemany(
+                        'INSERT INTO sends (campaign, email, status, message_id, error, latency, attempted_at, sender, '
+                        'thread_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        self._buffer
+                    )
+                self._buffer = []
+            self._last_flush = time.monotonic()
+
+    def counts(self):
+        """Return {'sent': n, 'failed': n} for this campaign (failed counts attempts)."""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT status, COUNT(*) FROM sends WHERE campaign = ? GROUP BY status',
+                (self.campaign_id,)
+            ).fetchall()
+        counts = {'sent': 0, 'failed': 0}
+        counts.update(dict(rows))
+        return counts
+
+    def sent_by_sender(self, since):
+        """Return {sender: n} of successful sends since the given timestamp, across all campaigns."""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sender, COUNT(*) FROM sends WHERE status = 'sent' AND attempted_at >= ? "
+                "AND sender IS NOT NULL GROUP BY sender",
+                (since,)
+            ).fetchall()
+        return dict(rows)
+
+    def reserve_sends(self, sender, day, limit, n):
+        """Take up to n of the sender's sends for the day starting at `day`; return how many were granted.
+
+        The count is shared by every process using this journal, so workers
+        on one account never exceed `limit` between them. It starts from the
+        sends already recorded that day.
+        """
+        self.flush()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO daily_usage (sender, day, reserved) SELECT ?, ?, COUNT(*) FROM sends "
+                    "WHERE sender = ? AND status = 'sent' AND attempted_at >= ?",
+                    (sender, day, sender, day)
+                )
+                reserved = self._conn.execute('SELECT reserved FROM daily_usage WHERE sender = ? AND day = ?',
+                                              (sender, day)).fetchone()[0]
+                granted = max(0, min(n, limit - reserved))
+                if granted:
+                    self._conn.execute('UPDATE daily_usage SET reserved = reserved + ? WHERE sender = ? AND day = ?',
+                                       (granted, sender, day))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return granted
+
+    def release_sends(self, sender, day, n):
+        """Give back n sends taken with reserve_sends() that were not made."""
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE daily_usage SET reserved = MAX(0, reserved - ?) WHERE sender = ? AND day = ?',
+                               (n, sender, day))
+
+    def send_activity(self, after_id=0):
+        """Return (last_row_id, {sender: latest send time}) for successful sends recorded after row `after_id`.
+
+        Across all campaigns; untagged sends are reported under None.
+        """
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sender, MAX(attempted_at), MAX(id) FROM sends WHERE status = 'sent' AND id > ? GROUP BY sender",
+                (after_id,)
+            ).fetchall()
+        last_id = max([after_id] + [row[2] for row in rows])
+        return last_id, {sender: attempted_at for sender, attempted_at, _ in rows}
+
+    def missing_rfc_message_ids(self, senders, limit=500):
+        """Return (gmail_message_id, email) of sent messages from `senders` (None: untagged) lacking a Message-ID."""
+        self.flush()
+        names = [name for name in senders if name is not None]
+        clauses = [f"sender IN ({', '.join('?' * len(names))})"] if names else []
+        if None in senders:
+            clauses.append('sender IS NULL')
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT message_id, email FROM sends WHERE status = 'sent' AND rfc_message_id IS NULL "
+                f"AND message_id IS NOT NULL AND ({' OR '.join(clauses)}) ORDER BY id LIMIT ?",
+                (*names, limit)
+            ).fetchall()
+        return rows
+
+    def set_rfc_message_ids(self, pairs):
+        """Store (gmail_message_id, rfc_message_id) pairs for sent messages ('' marks one that cannot be read)."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'UPDATE sends SET rfc_message_id = ? WHERE message_id = ?',
+                [(rfc_id, message_id) for message_id, rfc_id in pairs]
+            )
+
+    def save_drafts(self, drafts):
+        """Store (email, subject, message) drafts in one transaction, replacing earlier ones."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO drafts (campaign, email, subject, message, created_at) VALUES (?, ?, ?, ?, ?)',
+                [(self.campaign_id, email, subject, message, now) for email, subject, message in drafts]
+            )
+
+    def drafted(self):
+        """Return the emails that already have a draft in this campaign."""
+        with self._lock:
+            rows = self._conn.execute('SELECT email FROM drafts WHERE campaign = ?', (self.campaign_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def iter_drafts(self, batch_size=1000):
+        """Yield (email, subject, message) for every draft, reading batch_size rows at a time."""
+        last = ''
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT email, subject, message FROM drafts WHERE campaign = ? AND email > ? '
+                    'ORDER BY email LIMIT ?',
+                    (self.campaign_id, last, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][0]
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,308 @@
+"""Counters and latency histograms for the hot paths, exported as Prometheus text or JSON lines.
+
+Off unless CAMPAIGN_METRICS is set when this module is first imported:
+
+    CAMPAIGN_METRICS=prometheus python app.py        # http://127.0.0.1:9108/metrics
+    CAMPAIGN_METRICS=jsonl python work_queue.py work # a snapshot per line in metrics.jsonl
+    CAMPAIGN_METRICS=prometheus,jsonl ...
+
+When off, @timed returns the function it decorates unchanged and timer()
+returns a shared no-op context manager, so instrumented code runs as if
+it were not instrumented; count() and observe() return at once.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+ENABLED = bool(os.getenv('CAMPAIGN_METRICS'))
+EXPORTERS = [name.strip() for name in os.getenv('CAMPAIGN_METRICS', '').split(',') if name.strip()]
+PROMETHEUS_HOST = os.getenv('CAMPAIGN_METRICS_HOST', '127.0.0.1')
+PROMETHEUS_PORT = int(os.getenv('CAMPAIGN_METRICS_PORT', '9108'))
+JSONL_PATH = os.getenv('CAMPAIGN_METRICS_PATH', 'metrics.jsonl')
+# Seconds between two snapshots appended to the JSONL file
+JSONL_INTERVAL = float(os.getenv('CAMPAIGN_METRICS_INTERVAL', '10'))
+PREFIX = 'campaign_'
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (inf past the last bucket)."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Registry:
+    """Thread-safe store of counters and histograms, keyed by name and labels."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name, value, **labels):
+        self.observe_key(_key(name, labels), value)
+
+    def observe_key(self, key, value):
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = _Histogram()
+            histogram.observe(value)
+
+    def snapshot(self):
+        """Return {'counters': [...], 'histograms': [...]} with p50/p99 estimates, as plain JSON data."""
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{'name': name, 'labels': dict(labels), 'count': h.count, 'sum': round(h.sum, 6),
+                           'p50': h.quantile(0.5), 'p99': h.quantile(0.99)}
+                          for (name, labels), h in sorted(self.histograms.items())]
+        return {'counters': counters, 'histograms': histograms}
+
+    def prometheus_text(self):
+        """Render every metric in the Prometheus text exposition format."""
+        def labelled(name, labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return PREFIX + name
+            return PREFIX + name + '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {PREFIX}{name} counter')
+                    typed.add(name)
+                lines.append(f'{labelled(name, labels)} {value}')
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {PREFIX}{name} histogram')
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), h.counts):
+                    cumulative += count
+                    lines.append(f"{labelled(name + '_bucket', labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{labelled(name + '_sum', labels)} {h.sum}")
+                lines.append(f"{labelled(name + '_count', labels)} {h.count}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+registry = Registry()
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('key', 'start')
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        registry.observe_key(self.key, time.perf_counter() - self.start)
+        if exc_type is not None:
+            name, labels = self.key
+            registry.count(name + '_errors', **dict(labels))
+        return False
+
+
+def timer(name, **labels):
+    """Context manager recording the block's duration in the `name` histogram (seconds)."""
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(_key(name, labels))
+
+
+def timed(name, **labels):
+    """Decorator recording each call's duration in the `name` histogram; a no-op when metrics are off."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+        key = _key(name, labels)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                registry.count(name + '_errors', **labels)
+                raise
+            finally:
+                registry.observe_key(key, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1, **labels):
+    if ENABLED:
+        registry.count(name, n, **labels)
+
+
+def observe(name, value, **labels):
+    if ENABLED:
+        registry.observe(name, value, **labels)
+
+
+def _metrics_handler():
+    # http.server is only imported when the endpoint is started
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = registry.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return MetricsHandler
+
+
+class PrometheusExporter:
+    """Serves GET /metrics in the Prometheus text format on a background thread (localhost by default)."""
+
+    def __init__(self, host=PROMETHEUS_HOST, port=PROMETHEUS_PORT):
+        from http.server import ThreadingHTTPServer
+        self._server = ThreadingHTTPServer((host, port), _metrics_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/metrics'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class JsonlExporter:
+    """Appends a timestamped snapshot to a JSON-lines file every `interval` seconds, and once more on stop()."""
+
+    def __init__(self, path=JSONL_PATH, interval=JSONL_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def write(self):
+        line = json.dumps(dict(registry.snapshot(), timestamp=time.time(), pid=os.getpid()))
+        with open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.write()
+
+
+_exporters = []
+_exporters_lock = threading.Lock()
+
+
+def start_exporters(names=None):
+    """Start the configured exporters (CAMPAIGN_METRICS by default) once per process; returns them."""
+    if not ENABLED:
+        return []
+    with _exporters_lock:
+        if not _exporters:
+            for name in names or EXPORTERS:
+                if name == 'prometheus':
+                    try:
+                        exporter = PrometheusExporter().start()
+                    except OSError as e:
+                        # e.g. a second worker process on the same port; jsonl suits several processes
+                        print(f"⚠️ Metrics endpoint not started on port {PROMETHEUS_PORT}: {e}")
+                        continue
+                    print(f"📈 Metrics at {exporter.url}")
+                elif name == 'jsonl':
+                    exporter = JsonlExporter().start()
+                    print(f"📈 Metrics appended to {exporter.path} every {exporter.interval:g}s")
+                else:
+                    print(f"⚠️ Unknown metrics exporter '{name}' (use prometheus or jsonl)")
+                    continue
+                _exporters.append(exporter)
+            if _exporters:
+                # Write the final JSONL snapshot when the process exits normally
+                atexit.register(stop_exporters)
+        return list(_exporters)
+
+
+def stop_exporters():
+    with _exporters_lock:
+        for exporter in _exporters:
+            exporter.stop()
+        _exporters.clear()
@@ -0,0 +1,232 @@
+"""Write a personalized subject and message for every recipient with the LLM, then send them.
+
+    python personalize.py                 # draft copy for influencer.csv
+    python personalize.py --send          # draft what is missing, then send the drafts
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from dotenv import load_dotenv
+from groq import APIError, AsyncGroq
+
+import metrics
+from async_gmail import AsyncTokenBucket
+from contacts import iter_contact_chunks, read_columns
+from journal import SendJournal, campaign_key
+from send_mail import MessageBuilder, print_send_result
+from sugestion import MODEL, SuggestionParseError, extract_json_from_response
+from suggestion_cache import normalize_text
+
+# Recipients written per LLM call; larger packs cost fewer calls but longer, riskier responses
+PACK_SIZE = 8
+DEFAULT_CONCURRENCY = 8
+TEMPERATURE = 0.7
+MAX_RETRIES = 4
+
+
+def personalized_campaign_key(csv_path, subject_text, message_text):
+    return campaign_key(csv_path, 'personalized:' + subject_text, message_text)
+
+
+def build_pack_prompt(subject_text, message_text, records):
+    recipients = json.dumps(records, ensure_ascii=False, indent=1)
+    return f"""
+You are an expert marketing agent writing influencer outreach emails.
+Using the template below as the starting point, write one personalized
+subject line and email message for EACH recipient. Use the recipient's
+details (niche, audience, recent posts, ...) so every email feels
+written for that person, while keeping the template's offer and tone.
+Fill in any {{{{placeholder}}}} from the recipient's details.
+
+Template subject:
+{subject_text}
+
+Template message:
+{message_text}
+
+Recipients:
+{recipients}
+
+Respond in JSON format only, with one entry per recipient, as:
+{{
+  "drafts": [{{"email": "...", "subject": "...", "message": "..."}}]
+}}
+"""
+
+
+def parse_drafts(content, records):
+    """Return {email: (subject, message)} for the recipients of the pack found in the response."""
+    data = extract_json_from_response(content)
+    wanted = {record['email'].strip().lower(): record['email'] for record in records}
+    drafts = {}
+    for item in data.get('drafts', []) if isinstance(data, dict) else []:
+        if not isinstance(item, dict):
+            continue
+        email = wanted.get(str(item.get('email', '')).strip().lower())
+        subject, message = item.get('subject'), item.get('message')
+        if email and isinstance(subject, str) and isinstance(message, str) and subject.strip() and message.strip():
+            drafts[email] = (subject.strip(), message.strip())
+    return drafts
+
+
+class Personalizer:
+    """Bounded-concurrency async pipeline from contact records to drafts in the send journal.
+
+    Recipients are packed PACK_SIZE to a prompt. At most `concurrency`
+    completions run at once (and at most `requests_per_minute` start per
+    minute, when set), and CSV chunks are only read as capacity frees up.
+    Drafts are saved to the journal as each response lands, so an
+    interrupted run resumes with the recipients that have neither a draft
+    nor a successful send. A pack whose response is malformed or
+    incomplete is split in half and retried down to single recipients.
+    """
+
+    def __init__(self, journal, subject_text, message_text, client=None, model=MODEL, temperature=TEMPERATURE,
+                 pack_size=PACK_SIZE, concurrency=DEFAULT_CONCURRENCY, requests_per_minute=None):
+        if client is None:
+            # GROQ_API_KEY may come from .env; the groq client retries 429 and 5xx responses with backoff on its own
+            load_dotenv()
+            client = AsyncGroq(max_retries=MAX_RETRIES)
+        self.journal = journal
+        self.subject_text = normalize_text(subject_text)
+        self.message_text = normalize_text(message_text)
+        self.client = client
+        self.model = model
+        self.temperature = temperature
+        self.pack_size = pack_size
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.stats = {'drafted': 0, 'failed': 0, 'skipped': 0, 'calls': 0}
+
+    async def _complete(self, records):
+        if self._bucket is not None:
+            await self._bucket.acquire()
+        self.stats['calls'] += 1
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": build_pack_prompt(self.subject_text, self.message_text, records)}],
+            temperature=self.temperature
+        )
+        return response.choices[0].message.content or ''
+
+    async def _draft_pack(self, records):
+        async with self._semaphore:
+            try:
+                drafts = parse_drafts(await self._complete(records), records)
+            except SuggestionParseError:
+                drafts = {}
+            except APIError as e:
+                # Retries are exhausted; leave the pack for the next (resumed) run
+                self.stats['failed'] += len(records)
+                print(f"❌ LLM call failed for {len(records)} recipients: {e}")
+                return
+        if drafts:
+            self.journal.save_drafts((email, subject, message) for email, (subject, message) in drafts.items())
+            self.stats['drafted'] += len(drafts)
+        missing = [record for record in records if record['email'] not in drafts]
+        if not missing:
+            return
+        if len(records) == 1:
+            self.stats['failed'] += 1
+            print(f"❌ No usable draft for {records[0]['email']}")
+            return
+        half = (len(missing) + 1) // 2
+        await asyncio.gather(self._draft_pack(missing[:half]), self._draft_pack(missing[half:]))
+
+    def _packs(self, records):
+        done = self.journal.drafted() | self.journal.completed()
+        pack = []
+        for record in records:
+            if record['email'] in done:
+                self.stats['skipped'] += 1
+                continue
+            pack.append(record)
+            if len(pack) == self.pack_size:
+                yield pack
+                pack = []
+        if pack:
+            yield pack
+
+    async def run(self, records):
+        """Draft every record (a dict with at least 'email') and return the stats dict."""
+        self._semaphore = asyncio.Semaphore(max(1, self.concurrency))
+        rpm = self.requests_per_minute
+        self._bucket = AsyncTokenBucket(rpm / 60.0, capacity=max(1, self.concurrency)) if rpm else None
+        packs = self._packs(records)
+        pending = set()
+        max_in_flight = max(1, self.concurrency) * 2
+        while True:
+            for pack in packs:
+                pending.add(asyncio.ensure_future(self._draft_pack(pack)))
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+            print(f"✍️ Drafted {self.stats['drafted']} so far ({self.stats['failed']} failed)")
+        return self.stats
+
+
+def iter_contact_records(csv_path, columns=None):
+    """Yield each contact as a dict of the given columns (all columns by default)."""
+    if columns is not None and 'email' not in columns:
+        columns = ['email'] + list(columns)
+    for chunk in iter_contact_chunks(csv_path, columns=columns):
+        yield from chunk.to_dict('records')
+
+
+def personalize_campaign(csv_path, subject_text, message_text, journal, columns=None, **kwargs):
+    """Draft personalized copy for every contact in the CSV into the journal; returns the stats dict."""
+    personalizer = Personalizer(journal, subject_text, message_text, **kwargs)
+    return asyncio.run(personalizer.run(iter_contact_records(csv_path, columns)))
+
+
+def iter_draft_messages(journal):
+    """Yield (email, message) pairs built from the journal's drafts, for a send engine."""
+    builder = MessageBuilder()
+    for email, subject, message in journal.iter_drafts():
+        yield email, builder.build(email, subject, message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default='influencer.csv')
+    parser.add_argument('--selection', default='final_selection.json')
+    parser.add_argument('--columns', nargs='*', default=None,
+                        help='CSV columns shown to the model (default: all)')
+    parser.add_argument('--pack-size', type=int, default=PACK_SIZE)
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--rpm', type=float, default=None, help='cap on LLM requests per minute')
+    parser.add_argument('--send', action='store_true', help='send the drafts once they are written')
+    args = parser.parse_args()
+    metrics.start_exporters()
+
+    if args.columns:
+        unknown = [c for c in args.columns if c not in read_columns(args.csv)]
+        if unknown:
+            raise SystemExit(f"❌ Unknown columns: {', '.join(unknown)}")
+
+    with open(args.selection) as f:
+        selected = json.load(f)
+    subject_text, message_text = selected["selected_subject"], selected["selected_message"]
+
+    campaign_id = personalized_campaign_key(args.csv, subject_text, message_text)
+    with SendJournal(campaign_id=campaign_id) as journal:
+        start = time.perf_counter()
+        stats = personalize_campaign(args.csv, subject_text, message_text, journal, columns=args.columns,
+                                     pack_size=args.pack_size, concurrency=args.concurrency,
+                                     requests_per_minute=args.rpm)
+        print(f"✅ Drafting finished in {time.perf_counter() - start:.1f}s: {stats}")
+
+        if args.send:
+            from sender_pool import load_sender_pool
+            for result in load_sender_pool().iter_send_results(iter_draft_messages(journal), journal=journal):
+                print_send_result(result)
+
+
+if __name__ == '__main__':
+    main()
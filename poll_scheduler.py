@@ -0,0 +1,239 @@
+"""Adaptive reply polling: often right after a send wave, backing off while a mailbox stays quiet.
+
+ReplyTracker runs one loop for every tracked campaign: each mailbox is
+polled once and the repliers found are marked in every contact list.
+"""
+import threading
+import time
+
+from contact_store import append_responded_csv
+from gmail_auth import TOKEN_PATH
+from journal import SendJournal
+from push import ReplyWaiter
+from reply_index import ReplyIndex
+
+# Shortest and longest gap between two polls of one mailbox
+MIN_INTERVAL = 15
+MAX_INTERVAL = 1800
+# Each poll that finds no reply multiplies the mailbox's interval by this
+BACKOFF = 2.0
+# Replies cluster in the hours after a send wave, so the interval stays at most HOT_INTERVAL meanwhile;
+# no longer than the old fixed 60s loop, so replies are not found later than they used to be
+HOT_WINDOW = 3 * 3600
+HOT_INTERVAL = 60
+# Below this share of free quota a due poll is put off, so it does not compete with sends
+HEADROOM_FLOOR = 0.25
+
+
+class _Mailbox:
+    def __init__(self, sender, now, min_interval):
+        self.sender = sender
+        self.interval = min_interval
+        self.next_due = now
+        self.last_poll = now
+        self.last_send = 0.0
+
+
+class AdaptivePollScheduler:
+    """Decides when each mailbox is polled next.
+
+    A mailbox starts at min_interval. Each poll without a reply (or that
+    failed) multiplies its interval by `backoff`, up to max_interval, or
+    hot_interval within hot_window of its last send; a reply or a new send
+    resets it to min_interval. Sends are read from the journal, so waves
+    sent by other processes (work_queue.py) count too. A due poll is put
+    off while the sender's quota scheduler has less than HEADROOM_FLOOR
+    headroom, but never beyond max_interval since the last poll.
+    `senders` are sender_pool.Sender objects.
+    """
+
+    def __init__(self, senders, journal=None, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, backoff=BACKOFF,
+                 hot_window=HOT_WINDOW, hot_interval=HOT_INTERVAL, clock=time.time):
+        self.journal = journal
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.hot_window = hot_window
+        self.hot_interval = hot_interval
+        self.clock = clock
+        self.polls = 0
+        self.deferred = 0
+        now = clock()
+        self._mailboxes = {sender.name: _Mailbox(sender, now, min_interval) for sender in senders}
+        # Untagged journal rows come from single-account sends through token.json
+        self._untagged = [sender.name for sender in senders if sender.token_path == TOKEN_PATH]
+        self._last_row = 0
+        self._lock = threading.Lock()
+        if journal is not None:
+            # Only sends recorded from now on start a new wave; earlier ones just set the hot window
+            self._last_row, activity = journal.send_activity()
+            for name, at in self._activity_names(activity):
+                self._mailboxes[name].last_send = max(self._mailboxes[name].last_send, at)
+
+    def _activity_names(self, activity):
+        for sender, at in activity.items():
+            for name in ([sender] if sender is not None else self._untagged):
+                if name in self._mailboxes:
+                    yield name, at
+
+    def refresh_activity(self):
+        """Read sends journaled since the last call and start the senders' hot windows; returns their names."""
+        if self.journal is None:
+            return []
+        self._last_row, activity = self.journal.send_activity(self._last_row)
+        names = []
+        for name, at in self._activity_names(activity):
+            self.note_send(name, at)
+            names.append(name)
+        return names
+
+    def note_send(self, name, at=None):
+        """Record a send from the named mailbox: poll it again soon."""
+        now = self.clock()
+        with self._lock:
+            mailbox = self._mailboxes[name]
+            mailbox.last_send = max(mailbox.last_send, at if at is not None else now)
+            mailbox.interval = self.min_interval
+            mailbox.next_due = min(mailbox.next_due, now + self.min_interval)
+
+    def _cap(self, mailbox, now):
+        return self.hot_interval if now - mailbox.last_send < self.hot_window else self.max_interval
+
+    def record_poll(self, name, repliers):
+        """Schedule the mailbox's next poll after one that found `repliers` (None if the poll failed)."""
+        now = self.clock()
+        with self._lock:
+            mailbox = self._mailboxes[name]
+            self.polls += 1
+            if repliers:
+                mailbox.interval = self.min_interval
+            else:
+                mailbox.interval = min(max(mailbox.interval * self.backoff, self.min_interval),
+                                       self._cap(mailbox, now))
+            mailbox.last_poll = now
+            mailbox.next_due = now + mailbox.interval
+
+    def due(self):
+        """Return the names of the mailboxes to poll now."""
+        now = self.clock()
+        names = []
+        with self._lock:
+            for name, mailbox in self._mailboxes.items():
+                if mailbox.next_due > now:
+                    continue
+                if (now - mailbox.last_poll < self.max_interval
+                        and mailbox.sender.scheduler.headroom() < HEADROOM_FLOOR):
+                    # Sends are using the quota; look again shortly
+                    self.deferred += 1
+                    mailbox.next_due = now + self.min_interval
+                    continue
+                names.append(name)
+        return names
+
+    def next_wait(self):
+        """Seconds until the next mailbox is due (0 if one is due already)."""
+        now = self.clock()
+        with self._lock:
+            return max(0.0, min(mailbox.next_due for mailbox in self._mailboxes.values()) - now)
+
+    def stats(self):
+        now = self.clock()
+        with self._lock:
+            return {name: {'interval': mailbox.interval, 'next_in': round(max(0.0, mailbox.next_due - now), 1),
+                           'hot': now - mailbox.last_send < self.hot_window}
+                    for name, mailbox in self._mailboxes.items()}
+
+
+class ReplyTracker:
+    """Tracks replies for several campaigns (contact lists) from one loop.
+
+    Each round polls the mailboxes that are due (push.ReplyWaiter, paced
+    by an AdaptivePollScheduler unless GMAIL_PUSH_TOPIC is set) once for
+    all campaigns, and marks the repliers in every tracked list of the
+    contact store. Campaigns can be added while the loop runs.
+    """
+
+    def __init__(self, pool, store, csv_paths=(), schedule=None, waiter=None):
+        self.pool = pool
+        self.store = store
+        self.csv_paths = []
+        # Replies are matched to sent messages by thread and Message-ID, not by the From address
+        self.reply_index = ReplyIndex()
+        self.journal = SendJournal()
+        self.schedule = schedule or AdaptivePollScheduler(pool.senders, journal=self.journal)
+        self.waiter = waiter or ReplyWaiter(pool.senders, schedule=self.schedule)
+        self._lock = threading.Lock()
+        for csv_path in csv_paths:
+            self.add_campaign(csv_path)
+
+    def add_campaign(self, csv_path):
+        """Start tracking the contact list; returns False if it is tracked already."""
+        with self._lock:
+            if csv_path in self.csv_paths:
+                return False
+            self.store.import_csv(csv_path)
+            self.csv_paths.append(csv_path)
+        return True
+
+    def poll(self, only=None):
+        """Poll the named mailboxes (all by default) and return [(influencer_name, email)] newly responded."""
+        names = [sender.name for sender in self.pool.senders if only is None or sender.name in only]
+        results = self.pool.poll_campaign_replies(self.reply_index, journal=self.journal, only=names)
+        for name in names:
+            self.schedule.record_poll(name, results.get(name))
+        repliers = set().union(*results.values())
+        newly_responded = []
+        with self._lock:
+            csv_paths = list(self.csv_paths)
+        for csv_path in csv_paths:
+            marked = self.store.mark_responded(csv_path, repliers) if repliers else []
+            if marked:
+                print(f"📩 Found replies for {csv_path} from: {[email for _, email in marked]}")
+            newly_responded += marked
+        if newly_responded:
+            append_responded_csv(newly_responded)
+        return newly_responded
+
+    def status(self):
+        """Return {csv_path: {'pending': n, 'responded': n}} for every tracked campaign."""
+        with self._lock:
+            csv_paths = list(self.csv_paths)
+        return {csv_path: self.store.counts(csv_path) for csv_path in csv_paths}
+
+    def run(self, on_poll=None):
+        """Poll until stop() is called; the first round polls every mailbox.
+
+        on_poll(newly_responded), when given, is called after every round.
+        """
+        self.waiter.start()
+        names = None
+        while True:
+            try:
+                newly_responded = self.poll(names)
+                if not newly_responded:
+                    print("ℹ️ No new replies found")
+                if on_poll is not None:
+                    on_poll(newly_responded)
+            except Exception as e:
+                print(f"❌ Tracking error: {e}")
+                for sender in self.pool.senders:
+                    if names is None or sender.name in names:
+                        self.schedule.record_poll(sender.name, None)
+            names = self.waiter.wait()
+            if not names:
+                return
+
+    def stop(self):
+        self.waiter.wake()
+
+    def export(self):
+        """Write each tracked CSV back with its remaining contacts; re-importing keeps edits made meanwhile."""
+        for csv_path in self.status():
+            self.store.import_csv(csv_path)
+            self.store.export_csv(csv_path, csv_path)
+            print(f"✅ Updated '{csv_path}' with the remaining contacts.")
+
+    def close(self):
+        self.waiter.stop()
+        self.journal.close()
+        self.reply_index.close()
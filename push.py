@@ -0,0 +1,320 @@
+"""Push-based reply detection: Gmail users.watch notifications delivered to a local webhook.
+
+Gmail publishes mailbox changes to a Cloud Pub/Sub topic; a push
+subscription on that topic POSTs them to NotificationReceiver. Set
+GMAIL_PUSH_TOPIC (projects/<project>/topics/<topic>) to enable push mode
+and point the subscription's endpoint at this host (GMAIL_PUSH_PORT,
+optionally through a tunnel) with ?token=<GMAIL_PUSH_TOKEN> appended.
+Without a topic the tracking loops keep polling every POLL_INTERVAL.
+One receiver serves the whole process (get_shared_receiver()), since the
+subscription posts to a single endpoint; it routes each notification to
+the waiter watching that mailbox.
+"""
+import base64
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from quota import get_default_scheduler
+
+PUSH_TOPIC = os.getenv('GMAIL_PUSH_TOPIC')
+PUSH_HOST = os.getenv('GMAIL_PUSH_HOST', '127.0.0.1')
+PUSH_PORT = int(os.getenv('GMAIL_PUSH_PORT', '8085'))
+PUSH_TOKEN = os.getenv('GMAIL_PUSH_TOKEN')
+# Seconds between polls when push is off
+POLL_INTERVAL = 60
+# In push mode, poll anyway after this long without a notification, in case one was lost
+FALLBACK_INTERVAL = 900
+# Gmail stops a watch after 7 days; renew it once it is within this many seconds of expiring
+RENEW_BEFORE = 24 * 3600
+# After a notification, wait this long so a burst of changes is fetched in one go
+COALESCE_SECONDS = 1.0
+
+
+def start_watch(service, topic, scheduler=None, label_ids=('INBOX',)):
+    """Ask Gmail to publish inbox changes to the Pub/Sub topic; returns {'historyId', 'expiration'}."""
+    scheduler = scheduler or get_default_scheduler()
+    body = {'topicName': topic, 'labelIds': list(label_ids), 'labelFilterBehavior': 'INCLUDE'}
+    return scheduler.execute(service.users().watch(userId='me', body=body), 'watch')
+
+
+def stop_watch(service, scheduler=None):
+    scheduler = scheduler or get_default_scheduler()
+    return scheduler.execute(service.users().stop(userId='me'), 'watch', units=1)
+
+
+def parse_notification(body):
+    """Return (email_address, history_id) from a Pub/Sub push request body; raises ValueError if malformed."""
+    try:
+        envelope = json.loads(body)
+        data = json.loads(base64.b64decode(envelope['message']['data']))
+        return data['emailAddress'].lower(), int(data['historyId'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Not a Gmail push notification: {e}") from e
+
+
+class _NotificationHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        receiver = self.server.receiver
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        token = parse_qs(urlsplit(self.path).query).get('token', [None])[0]
+        if receiver.token and token != receiver.token:
+            receiver._reject()
+            self._reply(403)
+            return
+        try:
+            email, history_id = parse_notification(body)
+        except ValueError:
+            receiver._reject()
+            # 2xx stops Pub/Sub from redelivering a message that will never parse
+            self._reply(204)
+            return
+        receiver._notify(email, history_id)
+        self._reply(204)
+
+
+class Subscription:
+    """The notifications one ReplyWaiter receives: those for its `addresses`.
+
+    Notifications are coalesced per mailbox (keeping the highest historyId)
+    until wait() collects them.
+    """
+
+    def __init__(self):
+        self.addresses = frozenset()
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._woken = False
+
+    def _notify(self, email, history_id):
+        with self._cond:
+            self._pending[email] = max(history_id, self._pending.get(email, 0))
+            self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        """Block until a notification arrives (or wake() is called) and return {email: history_id}.
+
+        Returns an empty dict on timeout.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or self._woken, timeout=timeout)
+            pending, self._pending = self._pending, {}
+            self._woken = False
+        return pending
+
+    def wake(self):
+        with self._cond:
+            self._woken = True
+            self._cond.notify_all()
+
+
+class NotificationReceiver:
+    """Local HTTP endpoint for Pub/Sub push notifications, shared by every waiter in the process.
+
+    Each notification goes to the subscriptions whose addresses include its
+    mailbox, or to all of them when none does (e.g. an alias). Requests
+    without the expected ?token= are rejected when a token is set.
+    """
+
+    def __init__(self, host=PUSH_HOST, port=PUSH_PORT, token=PUSH_TOKEN):
+        self.token = token
+        self.received = 0
+        self.rejected = 0
+        self._subscriptions = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _NotificationHandler)
+        self._server.daemon_threads = True
+        self._server.receiver = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def subscribe(self):
+        subscription = Subscription()
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def route(self, subscription, addresses):
+        """Deliver notifications for these mailbox addresses to the subscription."""
+        with self._lock:
+            subscription.addresses = frozenset(address.lower() for address in addresses)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def _notify(self, email, history_id):
+        with self._lock:
+            self.received += 1
+            subscriptions = list(self._subscriptions)
+        targets = [s for s in subscriptions if email in s.addresses] or subscriptions
+        for subscription in targets:
+            subscription._notify(email, history_id)
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def start(self):
+        """Start serving; calling it again is a no-op."""
+        with self._lock:
+            if not self._thread.is_alive():
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+_shared_receiver = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_receiver():
+    """Return the process-wide receiver on PUSH_HOST:PUSH_PORT, started on first use and kept until exit."""
+    global _shared_receiver
+    with _shared_lock:
+        if _shared_receiver is None:
+            _shared_receiver = NotificationReceiver().start()
+        return _shared_receiver
+
+
+class ReplyWaiter:
+    """Paces a reply tracking loop.
+
+    Without a topic, wait() sleeps POLL_INTERVAL and every mailbox is
+    polled. With a topic, each sender's mailbox is watched and wait()
+    returns as soon as a notification arrives, naming only the senders
+    whose mailbox changed; after FALLBACK_INTERVAL without one it returns
+    all senders so a lost notification costs at most one interval.
+    Watches are renewed before they expire. `senders` are
+    sender_pool.Sender objects. Notifications come through `receiver`
+    (the shared one by default), which the waiter neither starts twice
+    nor stops.
+
+    Without a topic, a `schedule` (poll_scheduler.AdaptivePollScheduler)
+    replaces the fixed interval: wait() returns the senders it finds due,
+    checking the journal for new send waves every min_interval meanwhile.
+    """
+
+    def __init__(self, senders, topic=PUSH_TOPIC, receiver=None, interval=POLL_INTERVAL,
+                 fallback_interval=FALLBACK_INTERVAL, coalesce=COALESCE_SECONDS, schedule=None):
+        self.senders = list(senders)
+        self.topic = topic
+        self.schedule = schedule
+        if receiver is None and topic:
+            receiver = get_shared_receiver()
+        self.receiver = receiver
+        self._subscription = receiver.subscribe() if receiver is not None else None
+        self.interval = interval
+        self.fallback_interval = fallback_interval
+        self.coalesce = coalesce
+        self._stopped = threading.Event()
+        self._expirations = {}
+        self._addresses = {}
+
+    @property
+    def push(self):
+        return self.receiver is not None
+
+    def start(self):
+        if self.push:
+            self.receiver.start()
+            for sender in self.senders:
+                self._addresses[sender.address] = sender.name
+                self._watch(sender)
+            self.receiver.route(self._subscription, self._addresses)
+            print(f"📡 Push mode: watching {len(self.senders)} mailbox(es) via {self.topic}")
+        return self
+
+    def _watch(self, sender):
+        response = start_watch(sender.service, self.topic, scheduler=sender.scheduler)
+        self._expirations[sender.name] = int(response['expiration']) / 1000.0
+
+    def _renew_due(self):
+        for sender in self.senders:
+            if self._expirations.get(sender.name, 0) - time.time() < RENEW_BEFORE:
+                try:
+                    self._watch(sender)
+                except Exception as e:
+                    print(f"⚠️ Could not renew the Gmail watch for {sender.name}: {e}")
+
+    def wait(self):
+        """Wait for the next check; return the names of the senders to poll (all of them on a timed poll).
+
+        Returns an empty list once wake() has been called.
+        """
+        if not self.push and self.schedule is not None:
+            while not self._stopped.is_set():
+                self.schedule.refresh_activity()
+                names = self.schedule.due()
+                if names:
+                    return names
+                self._stopped.wait(min(self.schedule.next_wait(), self.schedule.min_interval))
+            return []
+        if not self.push:
+            if self._stopped.wait(self.interval):
+                return []
+            return [sender.name for sender in self.senders]
+
+        self._renew_due()
+        # A wake() consumed by an earlier wait() leaves no signal behind, so check before blocking
+        if self._stopped.is_set():
+            return []
+        notified = self._subscription.wait(timeout=self.fallback_interval)
+        if self._stopped.is_set():
+            return []
+        if not notified:
+            return [sender.name for sender in self.senders]
+        if self.coalesce:
+            if self._stopped.wait(self.coalesce):
+                return []
+            notified.update(self._subscription.wait(timeout=0))
+            if self._stopped.is_set():
+                return []
+        names = {self._addresses.get(email) for email in notified}
+        # A notification for an address we do not know (e.g. an alias) checks everyone
+        if None in names:
+            return [sender.name for sender in self.senders]
+        return [sender.name for sender in self.senders if sender.name in names]
+
+    def wake(self):
+        """End waiting for good: the pending wait() and any later one return at once (tracking is stopping)."""
+        self._stopped.set()
+        if self.push:
+            self._subscription.wake()
+
+    def stop(self):
+        self.wake()
+        if self.push:
+            for sender in self.senders:
+                try:
+                    stop_watch(sender.service, scheduler=sender.scheduler)
+                except Exception as e:
+                    print(f"⚠️ Could not stop the Gmail watch for {sender.name}: {e}")
+            self.receiver.unsubscribe(self._subscription)
@@ -0,0 +1,261 @@
+"""Quota-aware scheduling, retry and backoff shared by every Gmail call in the process."""
+import json
+import random
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+import metrics
+
+# Gmail quota units per method (https://developers.google.com/gmail/api/reference/quota)
+QUOTA_UNITS = {
+    'messages.send': 100,
+    'messages.get': 5,
+    'messages.list': 5,
+    'history.list': 2,
+    'getProfile': 1,
+    'watch': 100,
+}
+# Per-user limit on quota units per second
+USER_QUOTA_PER_SECOND = 250
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket. take() never blocks, so asyncio code can share it; acquire() blocks."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, tokens=1):
+        """Take the tokens and return 0, or take none and return the seconds until they are available."""
+        # A request larger than the bucket waits for a full bucket and leaves it in debt
+        needed = min(tokens, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= needed:
+                self._tokens -= tokens
+                return 0
+            return (needed - self._tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        while True:
+            wait_for = self.take(tokens)
+            if not wait_for:
+                return
+            time.sleep(wait_for)
+
+    def level(self):
+        """Share of the bucket currently filled (0.0-1.0; negative while in debt)."""
+        with self._lock:
+            self._refill()
+            return self._tokens / self.capacity
+
+
+def error_reason(error):
+    """Return the first `reason` of a Gmail HttpError, or ''."""
+    try:
+        details = json.loads(error.content.decode('utf-8'))['error']
+        return (details.get('errors') or [{}])[0].get('reason', '')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return ''
+
+
+def is_rate_limited(error):
+    status = error.resp.status
+    return status == 429 or (status == 403 and error_reason(error) in RATE_LIMIT_REASONS)
+
+
+def is_retryable(error):
+    return is_rate_limited(error) or error.resp.status in RETRYABLE_STATUSES
+
+
+class QuotaPolicy:
+    """Gmail's per-user quota, adaptive concurrency and retry policy, without the waiting.
+
+    Every call takes QUOTA_UNITS[method] units from a token bucket
+    refilled at `units_per_second` (None disables pacing). Concurrency is
+    additive-increase / multiplicative-decrease: halved on each rate-limit
+    error, raised by one after `success_window` successes in a row.
+    Retryable errors back off exponentially with full jitter, honouring
+    Retry-After when Gmail sends one.
+
+    Methods return how long to wait instead of waiting, so QuotaScheduler
+    (threads) and async_gmail.AsyncQuotaScheduler (asyncio) share this
+    policy; each serializes its calls to it with its own lock.
+    """
+
+    def __init__(self, units_per_second=USER_QUOTA_PER_SECOND, max_concurrency=8, min_concurrency=1,
+                 success_window=20, max_retries=5, base_delay=1.0, max_delay=64.0):
+        self.bucket = TokenBucket(units_per_second, capacity=units_per_second) if units_per_second else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = max_concurrency
+        self.success_window = success_window
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.units_used = {}
+        self.rate_limited = 0
+        self.retries = 0
+        self._in_flight = 0
+        self._streak = 0
+        self._cooldown_until = 0.0
+
+    def slot_wait(self):
+        """Seconds before a call may start: 0 now, None once a running call finishes."""
+        wait_for = self._cooldown_until - time.monotonic()
+        if wait_for > 0:
+            return wait_for
+        return 0 if self._in_flight < self.limit else None
+
+    def start(self, method, units=None):
+        """Take a concurrency slot for a call and return its quota units, to be taken from the bucket."""
+        units = QUOTA_UNITS.get(method, 5) if units is None else units
+        self._in_flight += 1
+        self.units_used[method] = self.units_used.get(method, 0) + units
+        return units
+
+    def finish(self, success=True, rate_limited=False, delay=0.0, retry=False):
+        """Give back a call's slot; `delay` is the backoff before its retry, if `retry`."""
+        self._in_flight -= 1
+        if retry:
+            self.retries += 1
+        if rate_limited:
+            self.throttle(delay)
+        elif success:
+            self._streak += 1
+            if self._streak >= self.success_window and self.limit < self.max_concurrency:
+                self.limit += 1
+                self._streak = 0
+
+    def throttle(self, delay=0.0):
+        """Halve concurrency and hold new calls for `delay` seconds after a rate-limit error."""
+        self.rate_limited += 1
+        self.limit = max(self.min_concurrency, self.limit // 2)
+        self._streak = 0
+        self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+
+    def headroom(self):
+        """Share of capacity free right now (0.0-1.0): unused concurrency slots and quota units.
+
+        0.0 while cooling down after a rate-limit error.
+        """
+        if time.monotonic() < self._cooldown_until:
+            return 0.0
+        free = (self.limit - self._in_flight) / self.max_concurrency
+        if self.bucket is not None:
+            free = min(free, self.bucket.level())
+        return max(0.0, free)
+
+    def backoff(self, attempt, retry_after=None):
+        """Seconds to wait before retry `attempt` (0-based), honouring a Retry-After value."""
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'in_flight': self._in_flight,
+            'rate_limited': self.rate_limited,
+            'retries': self.retries,
+            'units_used': dict(self.units_used),
+        }
+
+
+class QuotaScheduler:
+    """Shares one user's quota across threads: blocks as a QuotaPolicy says (same arguments)."""
+
+    def __init__(self, units_per_second=USER_QUOTA_PER_SECOND, **policy):
+        self.policy = QuotaPolicy(units_per_second, **policy)
+        self._cond = threading.Condition()
+
+    @property
+    def max_retries(self):
+        return self.policy.max_retries
+
+    def acquire(self, method, units=None):
+        """Block until a concurrency slot and enough quota units are available."""
+        with self._cond:
+            while True:
+                wait_for = self.policy.slot_wait()
+                if wait_for == 0:
+                    break
+                self._cond.wait(timeout=wait_for)
+            units = self.policy.start(method, units)
+        if self.policy.bucket is not None:
+            self.policy.bucket.acquire(units)
+
+    def release(self, success=True, rate_limited=False, delay=0.0, retry=False):
+        with self._cond:
+            self.policy.finish(success, rate_limited, delay, retry)
+            self._cond.notify_all()
+
+    def report_rate_limited(self, delay=0.0):
+        """Record a throttled call that was not made through execute(), e.g. inside a batch."""
+        with self._cond:
+            self.policy.throttle(delay)
+            self._cond.notify_all()
+
+    def headroom(self):
+        """See QuotaPolicy.headroom."""
+        with self._cond:
+            return self.policy.headroom()
+
+    def backoff(self, attempt, error=None):
+        """Seconds to wait before retry `attempt` (0-based) of a call that raised HttpError `error`."""
+        return self.policy.backoff(attempt, error.resp.get('retry-after') if error is not None else None)
+
+    def execute(self, request, method, units=None, http=None):
+        """Execute a googleapiclient request under the quota, retrying throttled and 5xx errors."""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(method, units)
+            try:
+                with metrics.timer('gmail_call_seconds', method=method):
+                    result = request.execute(http=http) if http is not None else request.execute()
+            except HttpError as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    self.release(success=False, rate_limited=is_rate_limited(e))
+                    raise
+                delay = self.backoff(attempt, e)
+                metrics.count('gmail_retries_total', method=method, status=e.resp.status)
+                self.release(success=False, rate_limited=is_rate_limited(e), delay=delay, retry=True)
+                time.sleep(delay)
+                continue
+            except Exception:
+                self.release(success=False)
+                raise
+            self.release(success=True)
+            return result
+
+    def stats(self):
+        with self._cond:
+            return self.policy.stats()
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def get_default_scheduler():
+    """Return the process-wide scheduler, so all entry points share one quota budget."""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = QuotaScheduler()
+        return _default_scheduler
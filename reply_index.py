@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+
+from journal import JOURNAL_PATH, SendJournal
+
+
+# Local parts of the addresses delivery failures come from
+BOUNCE_SENDERS = ('mailer-daemon', 'postmaster')
+# Precedence values set by vacation responders and list software
+AUTOMATED_PRECEDENCE = ('bulk', 'junk', 'list', 'auto_reply')
+
+
+def normalize_message_id(value):
+    return value.strip().strip('<>').lower()
+
+
+def is_automated(sender, auto_submitted='', precedence='', own_addresses=()):
+    """True for mail in a campaign thread that is not the contact answering.
+
+    That is bounces, auto-replies (RFC 3834 Auto-Submitted, or a bulk
+    Precedence) and copies of our own messages. `sender` is the lower-cased
+    From address.
+    """
+    if not sender or sender in own_addresses:
+        return True
+    if sender.split('@')[0] in BOUNCE_SENDERS:
+        return True
+    if auto_submitted and auto_submitted.strip().lower() != 'no':
+        return True
+    return precedence.strip().lower() in AUTOMATED_PRECEDENCE
+
+
+class ReplyIndex:
+    """In-memory index of sent messages by Gmail threadId and RFC 822 Message-ID.
+
+    Built from the send journal's `sends` table (every campaign) and kept
+    current by refresh(), which reads only the rows added since the
+    previous call; Message-IDs backfilled later arrive through
+    add_message_ids(). Lookups are dict hits.
+    """
+
+    def __init__(self, journal_path=JOURNAL_PATH):
+        self.journal_path = journal_path
+        self.by_thread = {}
+        self.by_message_id = {}
+        self._last_row = 0
+        self._lock = threading.Lock()
+        # Creates or migrates the sends table if no campaign has run yet
+        SendJournal(journal_path).close()
+        self._conn = sqlite3.connect(journal_path, timeout=30, check_same_thread=False)
+        self.refresh()
+
+    def refresh(self):
+        """Load sends recorded since the last refresh; returns the number of new rows."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, email, thread_id, rfc_message_id FROM sends WHERE status = 'sent' AND id > ? ORDER BY id",
+                (self._last_row,)
+            ).fetchall()
+            for row_id, email, thread_id, rfc_message_id in rows:
+                if thread_id:
+                    self.by_thread[thread_id] = email
+                if rfc_message_id:
+                    self.by_message_id[normalize_message_id(rfc_message_id)] = email
+                self._last_row = row_id
+        return len(rows)
+
+    def add_message_ids(self, pairs):
+        """Index (rfc_message_id, email) pairs that were backfilled after the send was recorded."""
+        with self._lock:
+            for rfc_message_id, email in pairs:
+                if rfc_message_id:
+                    self.by_message_id[normalize_message_id(rfc_message_id)] = email
+
+    def is_known_thread(self, thread_id):
+        return thread_id in self.by_thread
+
+    def match(self, thread_id=None, in_reply_to='', references=''):
+        """Return the recipient a message replies to, or None.
+
+        In-Reply-To and References name the exact message answered, so they
+        win over the thread, which Gmail may also group by subject.
+        """
+        for value in (in_reply_to, *reversed(references.split())):
+            if value:
+                email = self.by_message_id.get(normalize_message_id(value))
+                if email:
+                    return email
+        return self.by_thread.get(thread_id)
+
+    def close(self):
+        self._conn.close()
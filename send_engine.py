@@ -0,0 +1,135 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import metrics
+from quota import QUOTA_UNITS, USER_QUOTA_PER_SECOND, get_default_scheduler
+
+# Sends per second the per-user quota allows when nothing else is using it
+GMAIL_SEND_RATE = USER_QUOTA_PER_SECOND / QUOTA_UNITS['messages.send']
+DEFAULT_CONCURRENCY = 4
+
+
+def send_one(service, user_id, email, message, http=None, scheduler=None):
+    """Send a single message under the quota scheduler and return a per-recipient result dict."""
+    scheduler = scheduler or get_default_scheduler()
+    start = time.perf_counter()
+    try:
+        request = service.users().messages().send(userId=user_id, body=message)
+        sent = scheduler.execute(request, 'messages.send', http=http)
+        result = {
+            'email': email,
+            'message_id': sent.get('id'),
+            'thread_id': sent.get('threadId'),
+            'latency': time.perf_counter() - start,
+            'error': None,
+            'skipped': False,
+        }
+        # One histogram per outcome; its _count is the number of sends
+        metrics.observe('send_seconds', result['latency'], status='sent')
+        return result
+    except Exception as e:
+        result = {
+            'email': email,
+            'message_id': None,
+            'thread_id': None,
+            'latency': time.perf_counter() - start,
+            'error': str(e),
+            'skipped': False,
+        }
+        metrics.observe('send_seconds', result['latency'], status='failed')
+        return result
+
+
+def skipped_result(email):
+    return {'email': email, 'message_id': None, 'thread_id': None, 'latency': 0.0, 'error': None, 'skipped': True}
+
+
+def iter_send_results(service, messages, concurrency=DEFAULT_CONCURRENCY, scheduler=None,
+                      user_id='me', http_factory=None, journal=None, executor=None):
+    """Send (email, message) pairs on a worker pool and yield results as they complete.
+
+    `messages` may be any iterable, including a generator; at most
+    2 * concurrency messages are held in memory at a time. `http_factory`
+    builds one transport per worker thread, since httplib2 connections
+    must not be shared between threads. Sends are paced, retried and
+    throttled by `scheduler` (the process-wide quota.QuotaScheduler by
+    default), which may run fewer than `concurrency` sends at once while
+    Gmail is pushing back. With a `journal.SendJournal`,
+    recipients it already lists as sent are skipped (yielding a result
+    with 'skipped' set) and every new result is recorded. `executor`
+    replaces the private thread pool (see run_sends).
+    """
+    scheduler = scheduler or get_default_scheduler()
+    local = threading.local()
+
+    def worker(email, message):
+        http = None
+        if http_factory is not None:
+            http = getattr(local, 'http', None)
+            if http is None:
+                http = local.http = http_factory()
+        return send_one(service, user_id, email, message, http=http, scheduler=scheduler)
+
+    return run_sends(messages, worker, concurrency=concurrency, journal=journal, executor=executor)
+
+
+def run_sends(messages, worker, concurrency=DEFAULT_CONCURRENCY, journal=None, done=None, executor=None):
+    """Run worker(email, message) on a thread pool with bounded look-ahead, yielding results.
+
+    Shared by iter_send_results and sender_pool; see iter_send_results for
+    the journal and memory behaviour. `done` overrides the set of emails to
+    skip, which otherwise is everything the journal lists as sent. With
+    `executor` (anything with submit(), e.g. a jobs.FairExecutor tenant)
+    the sends run on that shared pool instead of a private one; at most
+    2 * concurrency are queued on it at a time either way.
+
+    Without a journal or `done`, nothing is skipped or remembered, so memory
+    stays bounded by the look-ahead however long the stream is; the
+    tradeoff is that an address listed twice in `messages` is sent twice.
+    """
+    if done is None and journal is not None:
+        done = journal.completed()
+
+    def finished(future):
+        result = future.result()
+        if journal is not None:
+            journal.record(result)
+        if done is not None and result['error'] is None:
+            done.add(result['email'])
+        return result
+
+    max_in_flight = max(1, concurrency) * 2
+    pool = executor if executor is not None else ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        pending = set()
+        for email, message in messages:
+            if done is not None and email in done:
+                yield skipped_result(email)
+                continue
+            pending.add(pool.submit(worker, email, message))
+            if len(pending) >= max_in_flight:
+                completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    yield finished(future)
+        while pending:
+            completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                yield finished(future)
+    finally:
+        if executor is None:
+            pool.shutdown(wait=True)
+        if journal is not None:
+            journal.flush()
+
+
+def send_campaign(service, messages, concurrency=DEFAULT_CONCURRENCY, scheduler=None,
+                  user_id='me', http_factory=None, on_result=None, journal=None):
+    """Send every message and return the list of per-recipient results."""
+    results = []
+    for result in iter_send_results(service, messages, concurrency=concurrency, scheduler=scheduler,
+                                    user_id=user_id, http_factory=http_factory, journal=journal):
+        if on_result is not None:
+            on_result(result)
+        results.append(result)
+    return results
@@ -1,34 +1,15 @@
-import pandas as pd
 import json
-import os
 import base64
 import re
+from concurrent.futures import ProcessPoolExecutor
+from email import base64mime
 from email.mime.text import MIMEText
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-
-# If modifying scopes, delete token.json
-SCOPES = [
-    'https://www.googleapis.com/auth/gmail.send',
-    'https://www.googleapis.com/auth/gmail.readonly'
-]
-
-
-def gmail_authenticate():
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(r'credentials\credentials_email.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token_file:
-            token_file.write(creds.to_json())
-    return creds
+from quota import get_default_scheduler
+import metrics
+from journal import SendJournal, campaign_key
+from contacts import iter_contact_chunks, read_columns
+from template import compile_template, check_templates, find_empty_fields
+from sender_pool import load_sender_pool
 
 def create_message(to, subject, message_text):
     message = MIMEText(message_text, 'plain', 'utf-8')
@@ -37,45 +18,150 @@ def create_message(to, subject, message_text):
     raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
     return {'raw': raw}
 
-def send_message(service, user_id, message):
+class MessageBuilder:
+    """Builds raw payloads byte-for-byte identical to create_message().
+
+    The constant MIME headers are serialized once per campaign. When
+    `body_text` is given (a body without placeholders) it is encoded once
+    too and every message reuses it.
+    """
+
+    def __init__(self, body_text=None):
+        prototype = MIMEText('', 'plain', 'utf-8')
+        self._fold = prototype.policy.fold_binary
+        self._max_line_length = prototype.policy.max_line_length
+        self._prefix = b''.join(self._fold(name, value) for name, value in prototype.raw_items())
+        self._body = self.encode_body(body_text) if body_text is not None else None
+
+    @staticmethod
+    def encode_body(message_text):
+        return base64mime.body_encode(message_text.encode('utf-8')).encode('ascii')
+
+    def header(self, name, value):
+        # Short printable ASCII values are emitted unchanged by the folder, so skip it
+        if value.isascii() and value.isprintable() and len(name) + 2 + len(value) <= self._max_line_length:
+            return f'{name}: {value}\n'.encode('ascii')
+        return self._fold(name, value)
+
+    def build(self, to, subject, message_text=None):
+        body = self._body if message_text is None else self.encode_body(message_text)
+        raw = b''.join((self._prefix, self.header('to', to), self.header('subject', subject), b'\n', body))
+        return {'raw': base64.urlsafe_b64encode(raw).decode()}
+
+    @metrics.timed('message_build_seconds')
+    def build_batch(self, items):
+        """Build messages for a list of (to, subject, message_text) tuples."""
+        metrics.count('messages_built_total', len(items))
+        return [self.build(to, subject, message_text) for to, subject, message_text in items]
+
+# Per-process builder used by the optional encoding pool
+_worker_builder = None
+
+def _init_worker_builder(body_text):
+    global _worker_builder
+    _worker_builder = MessageBuilder(body_text)
+
+def _build_batch_in_worker(items):
+    return _worker_builder.build_batch(items)
+
+def send_message(service, user_id, message, scheduler=None):
+    # Throttled and 5xx responses are retried with backoff by the shared quota scheduler
+    scheduler = scheduler or get_default_scheduler()
     try:
-        sent_message = service.users().messages().send(userId=user_id, body=message).execute()
+        sent_message = scheduler.execute(service.users().messages().send(userId=user_id, body=message), 'messages.send')
         print(f"✅ Email sent to {message['raw'][:30]}... Message Id: {sent_message['id']}")
         return sent_message
     except Exception as e:
         print(f"❌ Failed to send email: {e}")
 
+def build_campaign_messages(chunks, subject_template, message_template, processes=0):
+    """Yield (email, message) pairs for every row of the contact chunks.
+
+    Templates are CompiledTemplate objects; each chunk is rendered with
+    render_chunk and its messages are built as one batch. With
+    `processes` > 0 batches are encoded in a process pool while earlier
+    messages are being sent.
+    """
+    # A body without placeholders is encoded once for the whole campaign
+    body_text = None if message_template.fields else message_template.text
+
+    def batches():
+        for chunk in chunks:
+            emails = chunk['email'].tolist()
+            print_empty_fields(emails, find_empty_fields(chunk, subject_template, message_template))
+            subjects = subject_template.render_chunk(chunk)
+            bodies = message_template.render_chunk(chunk) if body_text is None else [None] * len(emails)
+            yield emails, list(zip(emails, subjects, bodies))
+
+    if not processes:
+        builder = MessageBuilder(body_text)
+        for emails, items in batches():
+            yield from zip(emails, builder.build_batch(items))
+        return
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker_builder, initargs=(body_text,)) as pool:
+        pending = []
+        for emails, items in batches():
+            pending.append((emails, pool.submit(_build_batch_in_worker, items)))
+            # Keep a couple of batches encoding ahead of the sender
+            if len(pending) > processes * 2:
+                emails, future = pending.pop(0)
+                yield from zip(emails, future.result())
+        for emails, future in pending:
+            yield from zip(emails, future.result())
+
+def prepare_campaign(csv_path, subject_text, message_text, processes=0):
+    """Compile the templates, validate them against the CSV header and return the message stream.
+
+    Raises ValueError before anything is sent if a placeholder has no matching column.
+    """
+    subject_template = compile_template(convert_to_double_braces(subject_text))
+    message_template = compile_template(convert_to_double_braces(message_text))
+
+    columns = read_columns(csv_path)
+    check_templates(columns, subject_template, message_template)
+
+    usecols = list(dict.fromkeys(['email'] + subject_template.fields + message_template.fields))
+    chunks = iter_contact_chunks(csv_path, columns=usecols)
+    return build_campaign_messages(chunks, subject_template, message_template, processes=processes)
+
+def print_empty_fields(emails, empty, limit=5):
+    """Warn about contacts whose placeholder values are blank; they are sent with those left empty."""
+    for position, fields in list(empty.items())[:limit]:
+        print(f"⚠️ {emails[position]}: empty {', '.join(fields)}")
+    if len(empty) > limit:
+        print(f"⚠️ ...and {len(empty) - limit} more contacts in this chunk with empty placeholder fields")
+
+def print_send_result(result):
+    if result.get('skipped'):
+        print(f"⏭️ Skipping {result['email']}: already sent in this campaign")
+    elif result['error'] is None:
+        via = f" via {result['sender']}" if result.get('sender') else ''
+        print(f"✅ Email sent to {result['email']}{via} Message Id: {result['message_id']}")
+    else:
+        print(f"❌ Failed to send email to {result['email']}: {result['error']}")
+
 def convert_to_double_braces(text):
     # Replace {placeholder} with {{placeholder}}, but skip if already doubled
     return re.sub(r'(?<!{){(\w+)}(?!})', r'{{\1}}', text)
 
-def main():
-    # Authenticate Gmail API
-    creds = gmail_authenticate()
-    service = build('gmail', 'v1', credentials=creds)
-
-    # Load influencers CSV
-    df = pd.read_csv('influencer.csv')
+def main(csv_path='influencer.csv', selection_path='final_selection.json'):
+    metrics.start_exporters()
+    # One sender per account in senders.json (or token.json alone); services are cached per account
+    pool = load_sender_pool()
 
     # Load chosen subject/message from JSON
-    with open('final_selection.json') as f:
+    with open(selection_path) as f:
         selected = json.load(f)
 
-    # Ensure templates use double braces
-    subject_template = convert_to_double_braces(selected["selected_subject"])
-    message_template = convert_to_double_braces(selected["selected_message"])
-
-    for _, row in df.iterrows():
-        influencer_name = row['influencer_name']
-        email = row['email']
-
-        # Replace placeholders
-        personalized_subject = subject_template.replace("{{influencer_name}}", influencer_name)
-        personalized_message = message_template.replace("{{influencer_name}}", influencer_name)
+    # Compile templates and stream influencers from the CSV
+    subject_text, message_text = selected["selected_subject"], selected["selected_message"]
+    messages = prepare_campaign(csv_path, subject_text, message_text)
 
-        # Create and send the message
-        email_msg = create_message(email, personalized_subject, personalized_message)
-        send_message(service, 'me', email_msg)
+    # The journal lets a rerun after a crash skip everyone who was already sent to
+    with SendJournal(campaign_id=campaign_key(csv_path, subject_text, message_text)) as journal:
+        for result in pool.iter_send_results(messages, journal=journal):
+            print_send_result(result)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,271 @@
+"""Shard a campaign across several Gmail accounts, each with its own quota."""
+import bisect
+import datetime
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from check_reply import CHECKPOINT_PATH, get_campaign_replies, get_new_repliers
+from gmail_auth import TOKEN_PATH, authorized_http, get_service, gmail_authenticate
+from quota import QuotaScheduler, get_default_scheduler
+from send_engine import DEFAULT_CONCURRENCY, run_sends, send_one
+
+SENDERS_PATH = 'senders.json'
+# Gmail's daily recipient cap for consumer accounts; set "daily_limit" in senders.json for Workspace (2000)
+DEFAULT_DAILY_LIMIT = 500
+# Sends taken from the journal's shared daily count at a time, so it is not written once per send
+USAGE_BLOCK = 10
+# Points per sender on the hash ring; more points spread recipients more evenly
+VIRTUAL_NODES = 100
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+def _start_of_day():
+    return datetime.datetime.combine(datetime.date.today(), datetime.time()).timestamp()
+
+
+class Sender:
+    """One Gmail account: its credentials, service, quota scheduler and daily send count."""
+
+    def __init__(self, name, token_path, daily_limit=DEFAULT_DAILY_LIMIT, checkpoint_path=None, user_id='me',
+                 service=None, scheduler=None):
+        self.name = name
+        self.token_path = token_path
+        self.daily_limit = daily_limit
+        self.checkpoint_path = checkpoint_path or f'reply_checkpoint_{name}.json'
+        self.user_id = user_id
+        # Quota is per user, so every account paces and backs off on its own
+        self.scheduler = scheduler or QuotaScheduler()
+        # A prebuilt service (e.g. fake_gmail.FakeGmailService) skips authentication
+        self._service = service
+        self._address = None
+        self.sent_today = 0
+        self._day = _start_of_day()
+        # Sends reserved in the journal's shared daily count and not used yet
+        self._allowance = 0
+
+    @property
+    def creds(self):
+        return gmail_authenticate(self.token_path)
+
+    @property
+    def service(self):
+        return self._service or get_service(self.token_path)
+
+    @property
+    def address(self):
+        """The account's lower-cased email address, read from its profile on first use."""
+        if self._address is None:
+            profile = self.scheduler.execute(self.service.users().getProfile(userId=self.user_id), 'getProfile')
+            self._address = profile['emailAddress'].lower()
+        return self._address
+
+    def http_factory(self):
+        if self._service is not None:
+            return None
+        return authorized_http(self.creds, self.token_path)
+
+
+class SenderPool:
+    """Routes each recipient to a sender with consistent hashing.
+
+    A recipient always maps to the same sender while the pool is
+    unchanged, so follow-ups come from the address that sent the first
+    mail; adding or removing an account only moves the recipients that
+    hashed to it. When a sender hits its daily limit its recipients go to
+    the next sender on the ring. While sending with a journal, the limit
+    is enforced on the journal's daily count, which every process sharing
+    the journal draws from; without one, on this pool's own count.
+    """
+
+    def __init__(self, senders, virtual_nodes=VIRTUAL_NODES):
+        if not senders:
+            raise ValueError("A sender pool needs at least one sender")
+        self.senders = list(senders)
+        self._lock = threading.Lock()
+        self._ring = sorted(
+            (_hash(f'{sender.name}#{i}'), index)
+            for index, sender in enumerate(self.senders)
+            for i in range(virtual_nodes)
+        )
+        self._points = [point for point, _ in self._ring]
+        self._journal = None
+
+    def _candidates(self, email):
+        """Yield the distinct senders in ring order, starting at the recipient's home sender."""
+        start = bisect.bisect(self._points, _hash(email.strip().lower()))
+        seen = set()
+        for offset in range(len(self._ring)):
+            index = self._ring[(start + offset) % len(self._ring)][1]
+            if index not in seen:
+                seen.add(index)
+                yield self.senders[index]
+                if len(seen) == len(self.senders):
+                    return
+
+    def sender_for(self, email):
+        """Return the home sender of a recipient, ignoring daily limits."""
+        return next(self._candidates(email))
+
+    def reserve(self, email):
+        """Count one send against the first sender with capacity left today, or return None."""
+        with self._lock:
+            today = _start_of_day()
+            for sender in self._candidates(email):
+                if sender._day != today:
+                    self._release(sender)
+                    sender._day, sender.sent_today = today, 0
+                if self._journal is None:
+                    if sender.sent_today < sender.daily_limit:
+                        sender.sent_today += 1
+                        return sender
+                    continue
+                if not sender._allowance:
+                    sender._allowance = self._journal.reserve_sends(sender.name, today, sender.daily_limit,
+                                                                    USAGE_BLOCK)
+                if sender._allowance:
+                    sender._allowance -= 1
+                    sender.sent_today += 1
+                    return sender
+        return None
+
+    def unreserve(self, sender):
+        """Give back a reservation whose send failed."""
+        with self._lock:
+            sender.sent_today = max(0, sender.sent_today - 1)
+            if self._journal is not None:
+                sender._allowance += 1
+
+    def _release(self, sender):
+        """Return a sender's unused journal reservations (call with the lock held)."""
+        if self._journal is not None and sender._allowance:
+            self._journal.release_sends(sender.name, sender._day, sender._allowance)
+        sender._allowance = 0
+
+    def load_usage(self, journal):
+        """Seed today's send counts from the journal, so limits hold across restarts."""
+        counts = journal.sent_by_sender(_start_of_day())
+        with self._lock:
+            for sender in self.senders:
+                sender.sent_today = counts.get(sender.name, 0)
+                sender._day = _start_of_day()
+
+    def iter_send_results(self, messages, concurrency=None, journal=None, done=None, executor=None):
+        """Send (email, message) pairs across the pool, yielding send_engine result dicts with a 'sender' key.
+
+        `journal`, `done` and `executor` behave as in send_engine.run_sends.
+        With a journal, daily limits are counted in it (see SenderPool).
+        """
+        if journal is not None:
+            self.load_usage(journal)
+        local = threading.local()
+
+        def worker(email, message):
+            sender = self.reserve(email)
+            if sender is None:
+                return {'email': email, 'message_id': None, 'thread_id': None, 'latency': 0.0, 'skipped': False,
+                        'error': 'Daily send limit reached on every sender', 'sender': None}
+            transports = local.__dict__.setdefault('http', {})
+            if sender.name not in transports:
+                transports[sender.name] = sender.http_factory()
+            http = transports[sender.name]
+            result = send_one(sender.service, sender.user_id, email, message, http=http, scheduler=sender.scheduler)
+            if result['error'] is not None:
+                self.unreserve(sender)
+            result['sender'] = sender.name
+            return result
+
+        concurrency = concurrency or DEFAULT_CONCURRENCY * len(self.senders)
+        with self._lock:
+            self._journal = journal
+        try:
+            yield from run_sends(messages, worker, concurrency=concurrency, journal=journal, done=done,
+                                 executor=executor)
+        finally:
+            with self._lock:
+                for sender in self.senders:
+                    self._release(sender)
+                self._journal = None
+
+    def get_new_repliers(self, query="in:inbox newer_than:2d"):
+        """Poll every mailbox concurrently and return the union of new repliers."""
+        def poll(sender):
+            return get_new_repliers(sender.service, sender.checkpoint_path, query, scheduler=sender.scheduler)
+
+        repliers = set()
+        with ThreadPoolExecutor(max_workers=len(self.senders)) as pool:
+            for sender, future in [(s, pool.submit(poll, s)) for s in self.senders]:
+                try:
+                    repliers |= future.result()
+                except Exception as e:
+                    print(f"⚠️ Could not check replies for {sender.name}: {e}")
+        return repliers
+
+    def get_campaign_replies(self, index, journal=None, query="in:inbox newer_than:2d", only=None):
+        """Poll the mailboxes concurrently and return the recipients who replied to a campaign thread.
+
+        See check_reply.get_campaign_replies; `index` is a shared
+        reply_index.ReplyIndex. `only` limits the poll to the named senders,
+        e.g. those push.ReplyWaiter reported as changed.
+        """
+        replied = set()
+        for repliers in self.poll_campaign_replies(index, journal, query, only).values():
+            replied |= repliers
+        return replied
+
+    def poll_campaign_replies(self, index, journal=None, query="in:inbox newer_than:2d", only=None):
+        """Like get_campaign_replies, but return {sender name: recipients} for the mailboxes polled successfully."""
+        senders = [s for s in self.senders if only is None or s.name in only]
+        if not senders:
+            return {}
+
+        def poll(sender):
+            # Untagged journal rows come from single-account sends through token.json
+            senders = (sender.name, None) if sender.token_path == TOKEN_PATH else (sender.name,)
+            return get_campaign_replies(sender.service, index, sender.checkpoint_path, query,
+                                        scheduler=sender.scheduler, journal=journal, senders=senders,
+                                        own_address=sender.address)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=len(senders)) as pool:
+            for sender, future in [(s, pool.submit(poll, s)) for s in senders]:
+                try:
+                    results[sender.name] = future.result()
+                except Exception as e:
+                    print(f"⚠️ Could not check replies for {sender.name}: {e}")
+        return results
+
+    def stats(self):
+        return {sender.name: dict(sender.scheduler.stats(), sent_today=sender.sent_today,
+                                  daily_limit=sender.daily_limit)
+                for sender in self.senders}
+
+
+def load_sender_pool(config_path=SENDERS_PATH, units_per_second=None):
+    """Build the pool from senders.json, or a single-account pool on token.json when it is absent.
+
+    senders.json is a list of {"name", "token_path"} objects, optionally
+    with "daily_limit" and "checkpoint_path". `units_per_second` lowers
+    each sender's quota pacing, for when several processes share the
+    accounts.
+    """
+    def scheduler():
+        return QuotaScheduler(units_per_second) if units_per_second else None
+
+    if not os.path.exists(config_path):
+        # The token.json account shares the process-wide scheduler with the other entry points
+        return SenderPool([Sender('me', TOKEN_PATH, checkpoint_path=CHECKPOINT_PATH,
+                                  scheduler=scheduler() or get_default_scheduler())])
+    with open(config_path) as f:
+        config = json.load(f)
+    return SenderPool([
+        Sender(entry['name'], entry['token_path'],
+               daily_limit=entry.get('daily_limit', DEFAULT_DAILY_LIMIT),
+               checkpoint_path=entry.get('checkpoint_path'), scheduler=scheduler())
+        for entry in config
+    ])
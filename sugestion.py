@@ -1,30 +1,113 @@
 import json
 import re
-from groq import Groq  # pip install groq
 import os
-from dotenv import load_dotenv
+import threading
+from suggestion_cache import cache_key, get_suggestion_cache, normalize_text
 
-# Initialize Groq Client
-load_dotenv()
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+_client = None
+_client_lock = threading.Lock()
+
+MODEL = "llama-3.1-8b-instant"
+TEMPERATURE = 0.8
+
+SUGGESTION_KEYS = ("subject_suggestions", "message_suggestions")
+
+class SuggestionParseError(ValueError):
+    """The model's response did not contain the expected suggestions JSON."""
+
+    def __init__(self, message, raw=''):
+        super().__init__(message)
+        self.raw = raw
 
 def extract_json_from_response(response_text):
-    """Extracts the first JSON object from a mixed Groq response."""
+    """Extracts the first JSON object from a mixed Groq response; raises SuggestionParseError."""
     match = re.search(r"{.*}", response_text, re.DOTALL)
-    if match:
-        try:
-            return json.loads(match.group(0))
-        except json.JSONDecodeError as e:
-            print("❌ JSON decode error:", e)
-            print("⚠️ Raw matched content:\n", match.group(0))
-            exit(1)
-    else:
-        print("❌ Could not extract JSON from Groq response.")
-        print("⚠️ Raw response:\n", response_text)
-        exit(1)
-
-def generate_suggestions(subject, message):
-    prompt = f"""
+    if not match:
+        raise SuggestionParseError("Could not extract JSON from Groq response.", response_text)
+    try:
+        return json.loads(match.group(0), strict=False)
+    except json.JSONDecodeError as e:
+        raise SuggestionParseError(f"JSON decode error: {e}", match.group(0)) from e
+
+def check_suggestions(suggestions, raw=''):
+    """Raise SuggestionParseError unless both suggestion lists are present and non-empty."""
+    for key in SUGGESTION_KEYS:
+        options = suggestions.get(key) if isinstance(suggestions, dict) else None
+        if not isinstance(options, list) or not options or not all(isinstance(o, str) for o in options):
+            raise SuggestionParseError(f"Groq response has no usable '{key}' list.", raw)
+    return suggestions
+
+class SuggestionStreamParser:
+    """Incremental parser that reports each suggestion string as soon as it is complete.
+
+    feed() takes the next piece of streamed text and returns a list of
+    (key, text) pairs for the strings of the top-level `subject_suggestions`
+    and `message_suggestions` arrays that the piece completed. Any prose
+    before the first '{' is ignored; the complete text is still validated
+    with extract_json_from_response() at the end.
+    """
+
+    def __init__(self, keys=SUGGESTION_KEYS):
+        self.keys = set(keys)
+        self._started = False
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._chars = []
+        self._key = None
+
+    def feed(self, text):
+        events = []
+        for ch in text:
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._stack.append(ch)
+                continue
+            if self._in_string:
+                self._chars.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    try:
+                        # strict=False admits the raw newlines models sometimes put inside strings
+                        value = json.loads('"' + ''.join(self._chars), strict=False)
+                    except ValueError:
+                        continue
+                    self._string_done(value, events)
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._chars = []
+            elif ch in '{[':
+                self._stack.append(ch)
+            elif ch in '}]' and self._stack:
+                self._stack.pop()
+        return events
+
+    def _string_done(self, value, events):
+        if self._stack == ['{']:
+            # Top-level strings are keys (the expected values are all arrays)
+            self._key = value
+        elif self._stack == ['{', '['] and self._key in self.keys:
+            events.append((self._key, value))
+
+def get_client():
+    """Return the Groq client, created on first use; groq and .env are only loaded then."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from dotenv import load_dotenv
+            from groq import Groq  # pip install groq
+            load_dotenv()
+            _client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        return _client
+
+def build_prompt(subject, message):
+    return f"""
 You are an expert marketing agent. Based on the following inputs, suggest:
 - 5 improved subject lines
 - 5 improved email messages that feel personalized but professional
@@ -42,14 +125,57 @@ Respond in JSON format as:
   "message_suggestions": ["...", "...", "...", "...", "..."]
 }}
 """
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
+
+def generate_suggestions(subject, message, regenerate=False):
+    """Return suggestions for the subject/message, from the on-disk cache when possible.
+
+    The cache is keyed by the normalized prompt, model and temperature;
+    regenerate=True always asks Groq and replaces the cached entry.
+    Raises SuggestionParseError if the response has no usable JSON.
+    """
+    suggestions = {key: [] for key in SUGGESTION_KEYS}
+    for key, text in stream_suggestions(subject, message, regenerate=regenerate):
+        suggestions[key].append(text)
+    return suggestions
+
+def stream_suggestions(subject, message, regenerate=False):
+    """Yield (key, suggestion) pairs as the streamed Groq response completes each one.
+
+    A cache hit yields every cached suggestion at once. The full response
+    is validated before it is cached; a malformed one raises
+    SuggestionParseError after whatever was already yielded.
+    """
+    prompt = build_prompt(normalize_text(subject), normalize_text(message))
+    key = cache_key(prompt, MODEL, TEMPERATURE)
+    cache = get_suggestion_cache()
+    if not regenerate:
+        cached = cache.get(key)
+        if cached is not None:
+            print("♻️ Using cached suggestions (regenerate for fresh ones).")
+            for name in SUGGESTION_KEYS:
+                for text in cached[name]:
+                    yield name, text
+            return
+
+    stream = get_client().chat.completions.create(
+        model=MODEL,
         messages=[{"role": "user", "content": prompt}],
-        temperature=0.8
+        temperature=TEMPERATURE,
+        stream=True
     )
 
-    content = response.choices[0].message.content.strip()
-    return extract_json_from_response(content)
+    parser = SuggestionStreamParser()
+    pieces = []
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        piece = chunk.choices[0].delta.content or ''
+        pieces.append(piece)
+        yield from parser.feed(piece)
+
+    content = ''.join(pieces).strip()
+    suggestions = check_suggestions(extract_json_from_response(content), content)
+    cache.set(key, suggestions)
 
 def choose_option(options, label):
     """Utility function to display options and get a valid selection from user."""
@@ -67,12 +193,17 @@ def choose_option(options, label):
         except ValueError:
             print("❗ Invalid input. Please enter a number.")
 
-def main():
+def main(selection_path="final_selection.json"):
     subject_input = input("📩 Enter your email subject line: ").strip()
     message_input = input("📝 Enter your email body message: ").strip()
 
     print("\n⏳ Generating suggestions from Groq...")
-    suggestions = generate_suggestions(subject_input, message_input)
+    try:
+        suggestions = generate_suggestions(subject_input, message_input)
+    except SuggestionParseError as e:
+        print(f"❌ {e}")
+        print("⚠️ Raw response:\n", e.raw)
+        exit(1)
 
     subject_choice, chosen_subject = choose_option(suggestions["subject_suggestions"], "Subject")
     message_choice, chosen_message = choose_option(suggestions["message_suggestions"], "Message")
@@ -85,10 +216,10 @@ def main():
     }
 
 
-    with open("final_selection.json", "w") as f:
+    with open(selection_path, "w") as f:
         json.dump(output, f, indent=4)
 
-    print("\n✅ Saved selected subject and message to `final_selection.json`")
+    print(f"\n✅ Saved selected subject and message to `{selection_path}`")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = 'suggestion_cache.db'
+# Entries beyond this many are evicted, least recently used first
+MAX_ENTRIES = 500
+# Entries older than this are treated as missing and regenerated
+TTL_SECONDS = 7 * 24 * 3600
+
+
+def normalize_text(text):
+    """Trim the text and collapse runs of spaces/tabs, keeping line breaks."""
+    lines = [' '.join(line.split()) for line in text.strip().splitlines()]
+    return '\n'.join(lines)
+
+
+def cache_key(*parts):
+    """Hash the parts (prompt, model, temperature, ...) into a cache key."""
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+class SuggestionCache:
+    """Size-bounded LRU cache of JSON values on disk (SQLite), with a TTL."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS suggestions (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS suggestions_used ON suggestions (used_at)')
+        self._conn.commit()
+
+    def get(self, key):
+        """Return the cached value, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT value, created_at FROM suggestions WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute('DELETE FROM suggestions WHERE key = ?', (key,))
+                return None
+            self._conn.execute('UPDATE suggestions SET used_at = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO suggestions (key, value, created_at, used_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now, now)
+            )
+            self._conn.execute(
+                'DELETE FROM suggestions WHERE created_at < ? OR key IN '
+                '(SELECT key FROM suggestions ORDER BY used_at DESC LIMIT -1 OFFSET ?)',
+                (now - self.ttl, self.max_entries)
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM suggestions')
+
+    def close(self):
+        self._conn.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_suggestion_cache():
+    """Return the process-wide cache, opened on first use."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = SuggestionCache()
+        return _default_cache
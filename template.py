@@ -0,0 +1,94 @@
+import re
+
+import metrics
+
+PLACEHOLDER_RE = re.compile(r'{{(\w+)}}')
+
+
+class CompiledTemplate:
+    """A {{field}} template parsed once into literal and placeholder segments.
+
+    `render_chunk` fills every row of a DataFrame chunk in one pass.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.literals = []
+        self.fields = []
+        pos = 0
+        for match in PLACEHOLDER_RE.finditer(text):
+            self.literals.append(text[pos:match.start()])
+            self.fields.append(match.group(1))
+            pos = match.end()
+        self.literals.append(text[pos:])
+        # Literal segments interleaved with empty slots that render() fills with the field values
+        self._parts = [None] * (2 * len(self.literals) - 1)
+        self._parts[::2] = self.literals
+        self._single_field = len(set(self.fields)) == 1
+
+    def unknown_fields(self, columns):
+        """Return the placeholders that are not among the given columns."""
+        columns = set(columns)
+        return [field for field in dict.fromkeys(self.fields) if field not in columns]
+
+    @metrics.timed('template_render_seconds')
+    def render_chunk(self, df):
+        """Render every row of a DataFrame chunk and return the results as a list.
+
+        Each column is read once, however often its placeholder repeats.
+        Chunks from contacts.iter_contact_chunks already hold strings; other
+        dtypes are converted first, and NaN or None render as ''.
+        """
+        if not self.fields:
+            return [self.text] * len(df)
+        columns = {field: _strings(df[field]) for field in dict.fromkeys(self.fields)}
+        if self._single_field:
+            # One field, possibly repeated: the literals joined by its value
+            literals = self.literals
+            return [value.join(literals) for value in columns[self.fields[0]]]
+        parts = self._parts.copy()
+        rendered = []
+        for values in zip(*(columns[field] for field in self.fields)):
+            parts[1::2] = values
+            rendered.append(''.join(parts))
+        return rendered
+
+
+def _strings(column):
+    """Return a Series' values as a list of str, without copying a column that already holds only strings."""
+    from pandas.api.types import infer_dtype
+    if infer_dtype(column, skipna=False) != 'string' or column.hasnans:
+        column = column.fillna('').astype(str)
+    return column.tolist()
+
+
+def find_empty_fields(df, *templates):
+    """Return {row position: [fields]} for the rows of a chunk where a placeholder's value is blank or missing."""
+    empty = {}
+    for field in dict.fromkeys(field for template in templates for field in template.fields):
+        column = df[field]
+        blank = column.isna() | column.astype(str).str.strip().eq('')
+        for position in blank.to_numpy().nonzero()[0]:
+            empty.setdefault(int(position), []).append(field)
+    return empty
+
+
+def compile_template(text):
+    return CompiledTemplate(text)
+
+
+def check_templates(columns, *templates):
+    """Raise ValueError naming every placeholder that has no matching CSV column.
+
+    Columns that exist but are blank for some rows are found per chunk by
+    find_empty_fields() while the campaign is built.
+    """
+    unknown = []
+    for template in templates:
+        for field in template.unknown_fields(columns):
+            if field not in unknown:
+                unknown.append(field)
+    if unknown:
+        raise ValueError(
+            f"Unknown template fields: {', '.join(unknown)} (CSV columns: {', '.join(columns)})"
+        )
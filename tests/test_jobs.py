@@ -0,0 +1,37 @@
+import threading
+import time
+
+from jobs import JobManager
+
+
+def wait_finished(job):
+    while job.running:
+        time.sleep(0.001)
+
+
+def test_finished_jobs_beyond_the_cap_are_dropped_oldest_first():
+    jobs = JobManager(max_finished=3)
+    finished = [jobs.submit('send', lambda job: None) for _ in range(5)]
+    for job in finished:
+        wait_finished(job)
+    release = threading.Event()
+    running = jobs.submit('track', lambda job: release.wait())
+
+    assert [jobs.get(job.id) for job in finished] == [None, None] + finished[2:]
+    assert jobs.get(running.id) is running
+    release.set()
+
+
+def test_running_jobs_are_kept_and_old_finished_jobs_expire():
+    jobs = JobManager(finished_ttl=60)
+    release = threading.Event()
+    running = jobs.submit('track', lambda job: release.wait())
+    old = jobs.submit('send', lambda job: None)
+    wait_finished(old)
+    old.finished_at -= 61
+
+    jobs.submit('send', lambda job: None)
+
+    assert jobs.get(old.id) is None
+    assert jobs.get(running.id) is running
+    release.set()
@@ -0,0 +1,45 @@
+import base64
+import email
+import email.policy
+
+import pytest
+
+from send_mail import MessageBuilder, create_message
+
+LONG_SUBJECT = 'Collaboration opportunity for your channel and our upcoming product launch ' * 3
+
+CASES = [
+    ('contact@example.com', 'Hello', 'Hi there'),
+    ('José Müller <jose@example.com>', 'Hola José', 'Hi José 🙂'),
+    ('"Doe, Jane" <jane@example.com>', 'Quoted, comma', 'Body'),
+    ('contact@example.com', LONG_SUBJECT, 'Body'),
+    ('contact@example.com', 'Ünïcödé ' * 20, 'Body'),
+    ('contact@example.com', '日本語の件名', '本文です。' * 50),
+    ('contact@example.com', 'Emoji 🎉 subject', 'line one\nline two\r\nline three\n'),
+    ('contact@example.com', '', ''),
+    ('contact@example.com', 'x' * 200, 'y' * 2000),
+]
+
+
+@pytest.mark.parametrize('to, subject, text', CASES)
+def test_builder_matches_create_message(to, subject, text):
+    assert MessageBuilder().build(to, subject, text) == create_message(to, subject, text)
+
+
+@pytest.mark.parametrize('to, subject, text', CASES)
+def test_constant_body_matches_create_message(to, subject, text):
+    assert MessageBuilder(text).build(to, subject) == create_message(to, subject, text)
+
+
+def test_build_batch_matches_create_message():
+    items = [(to, subject, text) for to, subject, text in CASES]
+    assert MessageBuilder().build_batch(items) == [create_message(*item) for item in items]
+
+
+def test_payload_round_trips_through_the_email_parser():
+    to, subject, text = CASES[5]
+    raw = base64.urlsafe_b64decode(MessageBuilder().build(to, subject, text)['raw'])
+    parsed = email.message_from_bytes(raw, policy=email.policy.default)
+    assert parsed['to'] == to
+    assert parsed['subject'] == subject
+    assert parsed.get_content() == text
@@ -0,0 +1,63 @@
+import asyncio
+
+import async_gmail
+from async_gmail import AsyncGmailClient, AsyncQuotaScheduler, GmailAPIError
+from quota import QuotaScheduler
+
+
+class FakeCreds:
+    valid = False
+    expiry = None
+    token = 'old'
+
+
+def test_sync_and_async_schedulers_apply_the_same_policy():
+    sync = QuotaScheduler(units_per_second=None, max_concurrency=8)
+    sync.acquire('messages.send')
+    sync.release(success=False, rate_limited=True, retry=True)
+
+    async def throttle_once():
+        scheduler = AsyncQuotaScheduler(units_per_second=None, max_concurrency=8)
+        await scheduler.acquire('messages.send')
+        await scheduler.release(success=False, rate_limited=True, retry=True)
+        return scheduler.stats()
+
+    assert asyncio.run(throttle_once()) == sync.stats() == {
+        'limit': 4, 'in_flight': 0, 'rate_limited': 1, 'retries': 1, 'units_used': {'messages.send': 100},
+    }
+
+
+def test_async_scheduler_retries_rate_limited_calls():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) < 3:
+            raise GmailAPIError(429, 'rateLimitExceeded', retry_after='0')
+        return 'ok'
+
+    async def run():
+        scheduler = AsyncQuotaScheduler(units_per_second=None, max_concurrency=4)
+        return await scheduler.execute(call, 'messages.send'), scheduler.stats()
+
+    result, stats = asyncio.run(run())
+    assert result == 'ok'
+    assert stats['retries'] == 2 and stats['limit'] == 1
+
+
+def test_async_client_refreshes_through_gmail_auth(monkeypatch):
+    refreshed = []
+
+    def refresh_if_needed(creds, token_path):
+        refreshed.append(token_path)
+        creds.token, creds.valid = 'new', True
+        return creds
+
+    monkeypatch.setattr(async_gmail, 'refresh_if_needed', refresh_if_needed)
+
+    async def headers():
+        async with AsyncGmailClient(creds=FakeCreds(), token_path='token_me.json') as client:
+            return await client._headers()
+
+    assert asyncio.run(headers()) == {'Authorization': 'Bearer new'}
+    assert refreshed == ['token_me.json']
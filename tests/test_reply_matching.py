@@ -0,0 +1,55 @@
+import pytest
+
+from check_reply import backfill_message_ids, get_campaign_replies
+from fake_gmail import FakeGmailService
+from journal import SendJournal
+from quota import QuotaScheduler
+from reply_index import ReplyIndex, is_automated
+from send_engine import iter_send_results
+
+OWN = ('me@example.com',)
+
+
+@pytest.mark.parametrize('sender, auto_submitted, precedence', [
+    ('mailer-daemon@googlemail.com', '', ''),
+    ('postmaster@example.net', '', ''),
+    ('contact@example.com', 'auto-replied', ''),
+    ('contact@example.com', 'Auto-Generated', ''),
+    ('contact@example.com', '', 'bulk'),
+    ('contact@example.com', '', 'Junk'),
+    ('me@example.com', '', ''),
+    (None, '', ''),
+])
+def test_automated_mail_is_not_a_reply(sender, auto_submitted, precedence):
+    assert is_automated(sender, auto_submitted, precedence, OWN)
+
+
+@pytest.mark.parametrize('auto_submitted, precedence', [('', ''), ('no', ''), ('', 'first-class')])
+def test_contact_mail_is_a_reply(auto_submitted, precedence):
+    assert not is_automated('contact@example.com', auto_submitted, precedence, OWN)
+
+
+def test_campaign_replies_skip_bounces_auto_replies_and_own_copies(tmp_path):
+    scheduler = QuotaScheduler(units_per_second=None)
+    service = FakeGmailService(inbox_size=1)
+    journal = SendJournal(str(tmp_path / 'journal.db'), 'test')
+    items = [(f'contact{i}@example.com', {'raw': 'cmF3'}) for i in range(6)]
+    results = iter_send_results(service, items, scheduler=scheduler, journal=journal)
+    threads = {r['email']: r['thread_id'] for r in results}
+    index = ReplyIndex(journal.path)
+    backfill_message_ids(service, journal, index, scheduler=scheduler)
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    get_campaign_replies(service, index, checkpoint, scheduler=scheduler)
+
+    for email, sender, headers in [
+        ('contact0@example.com', 'contact0@example.com', {}),
+        ('contact1@example.com', 'mailer-daemon@googlemail.com', {}),
+        ('contact2@example.com', 'contact2@example.com', {'Auto-Submitted': 'auto-replied'}),
+        ('contact3@example.com', 'contact3@example.com', {'Precedence': 'bulk'}),
+        ('contact4@example.com', 'me@example.com', {}),
+    ]:
+        service.add_inbox_message(sender, thread_id=threads[email], headers=headers)
+
+    assert get_campaign_replies(service, index, checkpoint, scheduler=scheduler) == {'contact0@example.com'}
+    index.close()
+    journal.close()
@@ -0,0 +1,52 @@
+import time
+
+from fake_gmail import FakeGmailService
+from quota import QUOTA_UNITS, QuotaScheduler
+from send_engine import send_campaign
+
+
+def make_items(n):
+    return [(f'contact{i}@example.com', {'raw': f'cmF3{i}'}) for i in range(n)]
+
+
+def retrying_scheduler(units_per_second=None, max_retries=8):
+    return QuotaScheduler(units_per_second=units_per_second, max_concurrency=8, max_retries=max_retries,
+                          base_delay=0.01, max_delay=0.05)
+
+
+def test_every_contact_sent_exactly_once_despite_429s():
+    items = make_items(100)
+    service = FakeGmailService(latency=0.002, jitter=0.002, error_rate=0.1)
+    scheduler = retrying_scheduler()
+
+    results = send_campaign(service, items, concurrency=8, scheduler=scheduler)
+
+    assert sorted(r['email'] for r in results) == sorted(email for email, _ in items)
+    assert [r for r in results if r['error'] is not None] == []
+    assert sorted(body['raw'] for body in service.sent) == sorted(message['raw'] for _, message in items)
+    assert scheduler.stats()['retries'] > 0
+
+
+def test_failures_are_reported_per_recipient_without_retries():
+    items = make_items(50)
+    service = FakeGmailService(error_rate=0.3)
+
+    results = send_campaign(service, items, concurrency=4, scheduler=retrying_scheduler(max_retries=0))
+
+    failed = [r for r in results if r['error'] is not None]
+    assert len(results) == 50
+    assert failed and all('429' in r['error'] for r in failed)
+    assert len(service.sent) == 50 - len(failed)
+
+
+def test_sends_are_paced_to_the_quota():
+    sends_per_second = 20
+    items = make_items(40)
+    scheduler = retrying_scheduler(units_per_second=sends_per_second * QUOTA_UNITS['messages.send'])
+
+    start = time.perf_counter()
+    send_campaign(FakeGmailService(), items, concurrency=8, scheduler=scheduler)
+    elapsed = time.perf_counter() - start
+
+    # The bucket starts with one second of quota; the other 20 sends need another second
+    assert elapsed >= 0.9
@@ -0,0 +1,50 @@
+import threading
+
+from fake_gmail import FakeGmailService
+from journal import SendJournal
+from quota import QuotaScheduler
+from sender_pool import Sender, SenderPool
+
+
+def make_pool(service, daily_limit, max_retries=5):
+    return SenderPool([Sender('me', 'unused.json', daily_limit=daily_limit, service=service,
+                              scheduler=QuotaScheduler(units_per_second=None, max_retries=max_retries))])
+
+
+def test_workers_sharing_a_journal_stay_under_the_daily_limit(tmp_path):
+    journal_path = str(tmp_path / 'journal.db')
+    service = FakeGmailService(latency=0.002)
+    results = []
+
+    def worker(i):
+        journal = SendJournal(journal_path, campaign_id=f'worker{i}')
+        items = [(f'w{i}-contact{n}@example.com', {'raw': f'cmF3{i}{n}'}) for n in range(40)]
+        for result in make_pool(service, daily_limit=25).iter_send_results(items, concurrency=4, journal=journal):
+            journal.record(result)
+            results.append(result)
+        journal.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(service.sent) == 25
+    assert len([r for r in results if r['error'] is None]) == 25
+    assert len(results) == 120
+
+
+def test_failed_sends_give_their_reservation_back(tmp_path):
+    journal = SendJournal(str(tmp_path / 'journal.db'))
+    items = [(f'contact{n}@example.com', {'raw': f'cmF3{n}'}) for n in range(10)]
+    failing = make_pool(FakeGmailService(latency=0, error_rate=1.0), daily_limit=10, max_retries=0)
+    for result in failing.iter_send_results(items, concurrency=2, journal=journal):
+        journal.record(result)
+
+    service = FakeGmailService(latency=0)
+    for result in make_pool(service, daily_limit=10).iter_send_results(items, concurrency=2, journal=journal):
+        journal.record(result)
+    journal.close()
+
+    assert len(service.sent) == 10
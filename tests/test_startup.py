@@ -0,0 +1,29 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('pandas', 'groq', 'googleapiclient')
+
+SNIPPETS = {
+    'status': 'import cli; cli.main(["status"])',
+    # suggest loads groq only once it asks for suggestions, not when the command starts
+    'suggest': 'import cli, sugestion',
+}
+
+
+def loaded_heavy_modules(snippet, cwd):
+    report = "; import json, sys; print(json.dumps(sorted({m.split('.')[0] for m in sys.modules})))"
+    env = dict(os.environ, PYTHONPATH=REPO)
+    env.pop('CAMPAIGN_METRICS', None)
+    output = subprocess.run([sys.executable, '-c', snippet + report], cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return sorted(set(json.loads(output.splitlines()[-1])) & set(HEAVY_MODULES))
+
+
+@pytest.mark.parametrize('command', sorted(SNIPPETS))
+def test_command_starts_without_heavy_dependencies(command, tmp_path):
+    assert loaded_heavy_modules(SNIPPETS[command], tmp_path) == []
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from template import check_templates, compile_template, find_empty_fields
+
+
+@pytest.fixture
+def chunk():
+    return pd.DataFrame({
+        'email': ['a@example.com', 'b@example.com', 'c@example.com'],
+        'influencer_name': ['Ann', None, '  '],
+        'followers': [1200, 3400, 5600],
+        'niche': pd.Series(['food', np.nan, 'tech'], dtype=object),
+    })
+
+
+def test_render_chunk_fills_every_placeholder(chunk):
+    template = compile_template('{{influencer_name}} has {{followers}} followers in {{niche}}, {{influencer_name}}')
+    assert template.render_chunk(chunk)[0] == 'Ann has 1200 followers in food, Ann'
+
+
+def test_render_chunk_renders_missing_values_as_empty(chunk):
+    assert compile_template('Hi {{influencer_name}}!').render_chunk(chunk) == ['Hi Ann!', 'Hi !', 'Hi   !']
+    assert compile_template('{{niche}}/{{followers}}').render_chunk(chunk) == ['food/1200', '/3400', 'tech/5600']
+
+
+def test_render_chunk_without_placeholders(chunk):
+    assert compile_template('Hello').render_chunk(chunk) == ['Hello'] * 3
+
+
+def test_find_empty_fields_reports_blank_and_missing_values(chunk):
+    subject = compile_template('Hi {{influencer_name}}')
+    body = compile_template('{{niche}} and {{followers}}')
+    assert find_empty_fields(chunk, subject, body) == {1: ['influencer_name', 'niche'], 2: ['influencer_name']}
+
+
+def test_check_templates_names_unknown_fields():
+    with pytest.raises(ValueError, match='Unknown template fields: nme'):
+        check_templates(['email', 'influencer_name'], compile_template('Hi {{nme}}'))
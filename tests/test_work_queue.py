@@ -0,0 +1,43 @@
+import time
+
+import work_queue
+from fake_gmail import FakeGmailService
+from quota import QuotaScheduler
+from send_engine import DEFAULT_CONCURRENCY
+from sender_pool import Sender, SenderPool
+from work_queue import WorkQueue, run_worker
+
+
+def test_worker_stops_sending_a_batch_whose_lease_was_taken(tmp_path, monkeypatch):
+    queue_path = str(tmp_path / 'queue.db')
+    records = [{'email': f'contact{i}@example.com', 'influencer_name': f'Name {i}'} for i in range(40)]
+    WorkQueue(queue_path, 'test').enqueue([records])
+    service = FakeGmailService(latency=0.01)
+    pool = SenderPool([Sender('me', 'unused.json', service=service, scheduler=QuotaScheduler(units_per_second=None))])
+    results = []
+    stolen = {}
+
+    def steal_after_first_results(result):
+        results.append((time.time(), result))
+        if len(results) == 5:
+            # Another worker takes the batch over, as if this worker's lease had expired
+            stolen['until'] = time.time() + 0.3
+            thief = WorkQueue(queue_path, 'test')
+            thief._conn.execute("UPDATE batches SET worker = 'thief', lease_until = ?", (stolen['until'],))
+            thief._conn.commit()
+            thief.close()
+
+    monkeypatch.setattr(work_queue, 'print_send_result', steal_after_first_results)
+    run_worker('test', 'Hi {{influencer_name}}', 'Hello', queue_path=queue_path,
+               journal_path=str(tmp_path / 'journal.db'), visibility_timeout=0.03, worker_id='worker', pool=pool,
+               poll_interval=0.05)
+
+    # While the thief held the lease, only sends already in flight finished
+    during_theft = [r for at, r in results[5:] if at < stolen['until']]
+    assert len(during_theft) <= 2 * DEFAULT_CONCURRENCY
+    # The batch was leased again once the thief's lease ran out, and nobody got two copies
+    assert sorted(r['email'] for _, r in results if not r['skipped']) == sorted(r['email'] for r in records)
+    assert len(service.sent) == len(records)
+    queue = WorkQueue(queue_path, 'test')
+    assert queue.counts()['done'] == 1
+    queue.close()
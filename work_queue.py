@@ -0,0 +1,280 @@
+"""Run a campaign as recipient batches on a SQLite work queue drained by worker processes.
+
+    python work_queue.py enqueue            # split influencer.csv into batches
+    python work_queue.py work --processes 4 # drain the queue
+    python work_queue.py status
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+
+import pandas as pd
+
+import metrics
+from contacts import iter_contact_chunks, read_columns
+from journal import JOURNAL_PATH, SendJournal, campaign_key
+from quota import USER_QUOTA_PER_SECOND
+from send_mail import build_campaign_messages, convert_to_double_braces, print_send_result
+from sender_pool import SENDERS_PATH, load_sender_pool
+from template import check_templates, compile_template
+
+QUEUE_PATH = 'work_queue.db'
+BATCH_SIZE = 200
+# A leased batch returns to the queue if its worker does not ack or extend it within this many seconds
+VISIBILITY_TIMEOUT = 300.0
+# Batches leased this many times without an ack are parked as 'dead' instead of retried forever
+MAX_ATTEMPTS = 5
+
+
+class WorkQueue:
+    """SQLite-backed queue of recipient batches with leases and visibility timeouts.
+
+    lease() hands a batch to one worker until its lease expires; a worker
+    that dies simply stops extending it and the batch becomes visible
+    again. Leasing runs in a BEGIN IMMEDIATE transaction, so any number of
+    processes on the host can share the file.
+    """
+
+    def __init__(self, path=QUEUE_PATH, campaign_id='default'):
+        self.path = path
+        self.campaign_id = campaign_id
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                campaign TEXT NOT NULL,
+                records TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS batches_status ON batches (campaign, status, lease_until)')
+
+    def enqueue(self, records_batches):
+        """Add each list of record dicts as one batch and return the number of batches."""
+        count = 0
+        self._conn.execute('BEGIN')
+        try:
+            for records in records_batches:
+                self._conn.execute('INSERT INTO batches (campaign, records) VALUES (?, ?)',
+                                   (self.campaign_id, json.dumps(records)))
+                count += 1
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        return count
+
+    def is_enqueued(self):
+        return self._conn.execute('SELECT 1 FROM batches WHERE campaign = ? LIMIT 1',
+                                  (self.campaign_id,)).fetchone() is not None
+
+    def lease(self, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        """Lease the next visible batch; return (batch_id, records) or None when nothing is visible."""
+        now = time.time()
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._conn.execute(
+                "UPDATE batches SET status = 'dead' WHERE campaign = ? AND status = 'leased' "
+                'AND lease_until < ? AND attempts >= ?',
+                (self.campaign_id, now, MAX_ATTEMPTS)
+            )
+            row = self._conn.execute(
+                "SELECT id, records FROM batches WHERE campaign = ? AND "
+                "(status = 'pending' OR (status = 'leased' AND lease_until < ?)) ORDER BY id LIMIT 1",
+                (self.campaign_id, now)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE batches SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                    'WHERE id = ?',
+                    (worker_id, now + visibility_timeout, row[0])
+                )
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def extend(self, batch_id, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        """Push the lease deadline out; return False if the lease was lost to another worker."""
+        cursor = self._conn.execute(
+            "UPDATE batches SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (time.time() + visibility_timeout, batch_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def ack(self, batch_id, worker_id):
+        cursor = self._conn.execute(
+            "UPDATE batches SET status = 'done', lease_until = NULL WHERE id = ? AND worker = ? AND status = 'leased'",
+            (batch_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def has_unfinished(self):
+        """True while any batch is pending or leased (possibly by a worker that has died)."""
+        return self._conn.execute(
+            "SELECT 1 FROM batches WHERE campaign = ? AND status IN ('pending', 'leased') LIMIT 1",
+            (self.campaign_id,)
+        ).fetchone() is not None
+
+    def counts(self):
+        """Return {'pending', 'leased', 'done', 'dead'} batch counts for the campaign."""
+        rows = self._conn.execute(
+            'SELECT status, COUNT(*) FROM batches WHERE campaign = ? GROUP BY status', (self.campaign_id,)
+        ).fetchall()
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'dead': 0}
+        counts.update(dict(rows))
+        return counts
+
+    def close(self):
+        self._conn.close()
+
+
+def enqueue_campaign(queue, csv_path, subject_text, message_text, batch_size=BATCH_SIZE):
+    """Validate the templates and split the CSV into batches holding only the columns they use."""
+    subject_template = compile_template(convert_to_double_braces(subject_text))
+    message_template = compile_template(convert_to_double_braces(message_text))
+    check_templates(read_columns(csv_path), subject_template, message_template)
+    usecols = list(dict.fromkeys(['email'] + subject_template.fields + message_template.fields))
+
+    def batches():
+        for chunk in iter_contact_chunks(csv_path, columns=usecols):
+            records = chunk.to_dict('records')
+            for i in range(0, len(records), batch_size):
+                yield records[i:i + batch_size]
+
+    return queue.enqueue(batches())
+
+
+def run_worker(campaign_id, subject_text, message_text, queue_path=QUEUE_PATH, journal_path=JOURNAL_PATH,
+               senders_path=SENDERS_PATH, units_per_second=None, visibility_timeout=VISIBILITY_TIMEOUT,
+               worker_id=None, pool=None, poll_interval=1.0):
+    """Lease, render, send and ack batches until the campaign's queue is drained.
+
+    Recipients the journal already lists as sent are skipped, so a batch
+    redelivered after a worker died only sends what was not recorded.
+    The lease is extended while sending and the batch is acked only after
+    its results are committed to the journal. If the lease is lost to
+    another worker, no further sends of the batch are started and it is
+    not acked; sends already in flight still finish and are journaled, so
+    the new holder skips them. Returns the number of results processed.
+    """
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    subject_template = compile_template(convert_to_double_braces(subject_text))
+    message_template = compile_template(convert_to_double_braces(message_text))
+    pool = pool or load_sender_pool(senders_path, units_per_second=units_per_second)
+    queue = WorkQueue(queue_path, campaign_id)
+    processed = 0
+    try:
+        with SendJournal(journal_path, campaign_id) as journal:
+            while True:
+                leased = queue.lease(worker_id, visibility_timeout)
+                if leased is None:
+                    if not queue.has_unfinished():
+                        break
+                    # Another worker holds the remaining batches; wait in case its lease expires
+                    time.sleep(poll_interval)
+                    continue
+                batch_id, records = leased
+                chunk = pd.DataFrame(records, dtype=str)
+                messages = build_campaign_messages([chunk], subject_template, message_template)
+                lease = {'lost': False}
+
+                def while_leased(items):
+                    # Checked as each message is handed to the pool, so a lost lease starts no new sends
+                    for item in items:
+                        if lease['lost']:
+                            return
+                        yield item
+
+                last_extend = time.monotonic()
+                done = journal.completed(chunk['email'])
+                for result in pool.iter_send_results(while_leased(messages), journal=journal, done=done):
+                    print_send_result(result)
+                    processed += 1
+                    if not lease['lost'] and time.monotonic() - last_extend > visibility_timeout / 3:
+                        lease['lost'] = not queue.extend(batch_id, worker_id, visibility_timeout)
+                        last_extend = time.monotonic()
+                if lease['lost']:
+                    print(f"⚠️ Lease on batch {batch_id} was taken over by another worker; leaving the rest to it.")
+                    continue
+                # iter_send_results flushed the journal, so every result of the batch is durable
+                if not queue.ack(batch_id, worker_id):
+                    print(f"⚠️ Lease on batch {batch_id} expired before it was acked; it may be redelivered.")
+    finally:
+        queue.close()
+    return processed
+
+
+def _worker_process(*args, **kwargs):
+    """Entry point of a worker process: run_worker() with this process's own metrics exporters."""
+    metrics.start_exporters()
+    try:
+        run_worker(*args, **kwargs)
+    finally:
+        # Worker processes skip atexit handlers, so write the last snapshot here
+        metrics.stop_exporters()
+
+
+def run_workers(processes, campaign_id, subject_text, message_text, **kwargs):
+    """Start `processes` worker processes and wait for them to drain the queue.
+
+    The per-user quota is split evenly between the processes on this host.
+    """
+    kwargs.setdefault('units_per_second', USER_QUOTA_PER_SECOND / processes)
+    workers = [
+        multiprocessing.Process(target=_worker_process, args=(campaign_id, subject_text, message_text), kwargs=kwargs)
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [worker.exitcode for worker in workers]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['enqueue', 'work', 'status'])
+    parser.add_argument('--csv', default='influencer.csv')
+    parser.add_argument('--selection', default='final_selection.json')
+    parser.add_argument('--queue', default=QUEUE_PATH)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--units-per-second', type=float, default=None,
+                        help='quota units per second for each worker process (default: the per-user quota '
+                             'split between --processes; lower it when several hosts share the accounts)')
+    args = parser.parse_args()
+
+    with open(args.selection) as f:
+        selected = json.load(f)
+    subject_text, message_text = selected["selected_subject"], selected["selected_message"]
+    campaign_id = campaign_key(args.csv, subject_text, message_text)
+    queue = WorkQueue(args.queue, campaign_id)
+
+    if args.command == 'enqueue':
+        if queue.is_enqueued():
+            print(f"ℹ️ Campaign {campaign_id} is already queued: {queue.counts()}")
+        else:
+            print(f"✅ Queued {enqueue_campaign(queue, args.csv, subject_text, message_text, args.batch_size)} "
+                  f"batches for campaign {campaign_id}")
+    elif args.command == 'work':
+        units = args.units_per_second or USER_QUOTA_PER_SECOND / args.processes
+        run_workers(args.processes, campaign_id, subject_text, message_text,
+                    queue_path=args.queue, units_per_second=units)
+        print(f"✅ Workers finished: {queue.counts()}")
+    else:
+        print(json.dumps(queue.counts()))
+    queue.close()
+
+
+if __name__ == '__main__':
+    main()